@@ -0,0 +1,315 @@
+# hamilton-transit-map/backend/agencies.py
+import json
+import logging
+import re
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from gtfs_static_parser import GTFSStaticParser, HAMILTON_STATIC_ZIP_URL
+from gtfs_realtime_parser import GTFSRealtimeParser, HAMILTON_VEHICLE_POSITIONS_URL, HAMILTON_TRIP_UPDATES_URL
+from response_cache import StaticResponseCache
+from trip_updates import PredictionIndex
+from vehicle_archive import VehicleArchive, RETENTION_DAYS
+from vehicle_deltas import SnapshotHistory
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent / "data"
+AGENCY_ID_PATTERN = re.compile(r'^[a-z0-9_-]+$')
+# An agency with no requests or stream viewers for this long is no longer polled, and its
+# static dataset and realtime state are dropped until it is asked for again
+IDLE_TIMEOUT = 30 * 60
+SWEEP_INTERVAL = 60
+# Threads shared by the realtime feeds of every agency
+FEED_WORKERS = 4
+# How often the scheduler looks for agencies that have become active
+SCHEDULER_TICK = 1.0
+# A poll that raised is retried after this long
+FAILED_POLL_DELAY = 30
+# The built-in agency's feeds, which its entry in an agencies file may leave out
+HAMILTON_FEED_URLS = {
+    'static_url': HAMILTON_STATIC_ZIP_URL,
+    'vehicle_positions_url': HAMILTON_VEHICLE_POSITIONS_URL,
+    'trip_updates_url': HAMILTON_TRIP_UPDATES_URL
+}
+
+class AgencyConfig:
+    def __init__(self, agency_id, name=None, static_url=None, vehicle_positions_url=None, trip_updates_url=None,
+                 data_dir=None, preload=False, timezone=None):
+        if not AGENCY_ID_PATTERN.match(agency_id or ''):
+            raise ValueError(f"Agency ids must be lowercase letters, digits, '-' or '_', got {agency_id!r}")
+        if not static_url:
+            raise ValueError(f"Agency {agency_id} has no static_url")
+        self.agency_id = agency_id
+        self.name = name or agency_id
+        self.static_url = static_url
+        self.vehicle_positions_url = vehicle_positions_url
+        self.trip_updates_url = trip_updates_url
+        self.data_dir = Path(data_dir) if data_dir else DATA_DIR / agency_id
+        # Preloaded agencies are loaded on startup and never evicted
+        self.preload = preload
+        # Service days follow this IANA timezone, or the feed's agency.txt without one
+        if timezone:
+            try:
+                ZoneInfo(timezone)
+            except (ValueError, ZoneInfoNotFoundError):
+                raise ValueError(f"Unknown timezone {timezone!r} for agency {agency_id}")
+        self.timezone = timezone
+    
+    def create_parser(self):
+        static_parser = GTFSStaticParser(static_zip_url=self.static_url, data_dir=self.data_dir, load=False,
+                                         timezone=self.timezone)
+        return GTFSRealtimeParser(vehicle_positions_url=self.vehicle_positions_url, trip_updates_url=self.trip_updates_url,
+                                  static_parser=static_parser, agency_id=self.agency_id)
+
+def hamilton_config():
+    # What the server ran before it knew about other agencies, with the same data directory
+    return AgencyConfig('hsr', "Hamilton Street Railway", data_dir=DATA_DIR, preload=True, **HAMILTON_FEED_URLS)
+
+def load_agency_configs(path=None):
+    # A JSON list of {"id", "name", "static_url", "vehicle_positions_url", "trip_updates_url",
+    # "data_dir", "preload", "timezone"}; the first agency is the default and is preloaded unless it says
+    # otherwise. static_url is required except for hsr, whose feeds default to Hamilton's; a realtime
+    # feed left out is not polled. Without a file the server runs Hamilton alone.
+    if not path:
+        return [hamilton_config()]
+    
+    with open(path, 'r') as f:
+        entries = json.load(f)
+    if not entries:
+        raise ValueError(f"No agencies configured in {path}")
+    
+    configs = []
+    for i, entry in enumerate(entries):
+        if entry.get('id') == 'hsr':
+            entry = dict(HAMILTON_FEED_URLS, **entry)
+        config = AgencyConfig(entry.get('id'), entry.get('name'), entry.get('static_url'),
+                              entry.get('vehicle_positions_url'), entry.get('trip_updates_url'),
+                              data_dir=entry.get('data_dir'), preload=entry.get('preload', i == 0),
+                              timezone=entry.get('timezone'))
+        if any(other.agency_id == config.agency_id for other in configs):
+            raise ValueError(f"Agency {config.agency_id} is configured twice in {path}")
+        for name in ('vehicle_positions_url', 'trip_updates_url'):
+            if not getattr(config, name):
+                logger.info(f"Agency {config.agency_id} has no {name}; that feed will not be polled")
+        configs.append(config)
+    return configs
+
+class Agency:
+    # Everything served for one agency: its parser and static dataset, the vehicles and
+    # predictions its feeds produce, its archive and its response caches. Caches are per agency
+    # because a StaticResponseCache drops its entries whenever it sees another dataset.
+    def __init__(self, config, parser, tile_cache_bytes=None, retention_days=RETENTION_DAYS):
+        self.config = config
+        self.agency_id = config.agency_id
+        self.name = config.name
+        self.pinned = config.preload
+        self.parser = parser
+        self.static_responses = StaticResponseCache()
+        self.tile_responses = StaticResponseCache(max_bytes=tile_cache_bytes)
+        self.vehicle_archive = VehicleArchive(parser.static_parser.data_dir / 'archive', retention_days=retention_days)
+        # In a production.py worker, the feed status last published by the fetcher process
+        self.published_feed_status = None
+        self.last_used = 0
+        # Published updates that arrived while the static dataset was not loaded, by kind
+        self.deferred = {}
+        # The latest published update of each kind, applied again when an evicted agency reloads
+        self.published = {}
+        self.lock = threading.Lock()
+        self.reset_realtime()
+    
+    def reset_realtime(self):
+        # The vehicles being served are bus_history.latest, an immutable VehicleSnapshot that each
+        # poll replaces in one assignment; handlers read it once and use only that snapshot
+        self.bus_history = SnapshotHistory(self.parser.index_buses_by_route([]))
+        self.trip_predictions = PredictionIndex()
+    
+    @property
+    def loaded(self):
+        return self.parser.static_parser.loaded
+    
+    def get_route_short_name(self, route_id):
+        return self.parser.get_route_short_name(route_id)
+    
+    def touch(self, when=None):
+        self.last_used = max(self.last_used, when or time.time())
+    
+    def is_active(self, now, idle_timeout):
+        return self.pinned or now - self.last_used < idle_timeout
+    
+    def activate(self):
+        self.touch()
+        self.ensure_loaded()
+        return self
+    
+    def ensure_loaded(self):
+        if not self.parser.static_parser.ensure_loaded():
+            return
+        logger.info(f"Loaded the static feed of {self.agency_id}")
+        self.apply_deferred()
+    
+    def when_loaded(self, kind, apply, snapshot):
+        # Applies a published update now, or once the static dataset it depends on is loaded;
+        # only the latest update of each kind is kept meanwhile
+        with self.lock:
+            self.published[kind] = (apply, snapshot)
+        if self.loaded:
+            apply(self, snapshot)
+            return
+        with self.lock:
+            self.deferred[kind] = (apply, snapshot)
+        # The load may have finished in between
+        if self.loaded:
+            self.apply_deferred()
+    
+    def apply_deferred(self):
+        with self.lock:
+            deferred, self.deferred = self.deferred, {}
+        for apply, snapshot in deferred.values():
+            apply(self, snapshot)
+    
+    def evict(self):
+        self.parser.static_parser.unload()
+        self.reset_realtime()
+        # The feeds may not be republished for a while (trip updates overnight, say), so the
+        # state dropped here is rebuilt on reactivation from the last update published to this
+        # worker, or by the next poll fetching the feed whether or not it has changed
+        with self.lock:
+            self.deferred = dict(self.published)
+        self.parser.vehicle_positions_feed.reset()
+        self.parser.trip_updates_feed.reset()
+        self.static_responses = StaticResponseCache()
+        self.tile_responses = StaticResponseCache(max_bytes=self.tile_responses.max_bytes)
+        self.published_feed_status = None
+        logger.info(f"Evicted idle agency {self.agency_id}")
+    
+    def describe(self):
+        return {
+            'id': self.agency_id,
+            'name': self.name,
+            'loaded': self.loaded,
+            'last_used': self.last_used or None
+        }
+
+class AgencyRegistry:
+    # The configured agencies by id. Agencies other than preloaded ones cost nothing until a
+    # request activates them, and sweep() returns them to that state once they go idle.
+    def __init__(self, configs, create_parser=None, tile_cache_bytes=None, retention_days=RETENTION_DAYS,
+                 idle_timeout=IDLE_TIMEOUT):
+        create_parser = create_parser or (lambda config: config.create_parser())
+        self.agencies = {}
+        for config in configs:
+            self.agencies[config.agency_id] = Agency(config, create_parser(config), tile_cache_bytes, retention_days)
+        self.default = next(iter(self.agencies.values()))
+        self.idle_timeout = idle_timeout
+        
+        for agency in self.agencies.values():
+            if agency.pinned:
+                agency.ensure_loaded()
+    
+    def __iter__(self):
+        return iter(self.agencies.values())
+    
+    def __len__(self):
+        return len(self.agencies)
+    
+    def get(self, agency_id=None):
+        if not agency_id:
+            return self.default
+        return self.agencies.get(agency_id)
+    
+    def active(self, now=None):
+        now = time.time() if now is None else now
+        return [agency for agency in self.agencies.values() if agency.is_active(now, self.idle_timeout)]
+    
+    def loaded(self):
+        return [agency for agency in self.agencies.values() if agency.loaded]
+    
+    def sweep(self, in_use=None):
+        # in_use(agency) keeps agencies busy in ways requests do not show, e.g. stream viewers
+        now = time.time()
+        evicted = []
+        for agency in self.agencies.values():
+            if not agency.loaded or agency.is_active(now, self.idle_timeout):
+                continue
+            if in_use is not None and in_use(agency):
+                agency.touch(now)
+                continue
+            agency.evict()
+            evicted.append(agency)
+        return evicted
+    
+    def watch_idle(self, in_use=None, interval=SWEEP_INTERVAL):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep(in_use)
+                except Exception as e:
+                    logger.error(f"Error evicting idle agencies: {e}")
+                    traceback.print_exc()
+        
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+    
+    def describe(self):
+        return [agency.describe() for agency in self.agencies.values()]
+
+class FeedScheduler:
+    # Polls the realtime feeds of every active agency on one shared pool of threads. Each
+    # (agency, feed) is submitted when it is due and rescheduled from its own feed's
+    # next_delay() once polled, so one agency's slow feed does not hold up another's, and the
+    # feeds of idle agencies are not polled at all. jobs maps a feed name to
+    # (poll(agency), feed(agency)); poll is what the single-agency loops used to call.
+    def __init__(self, registry, jobs, workers=FEED_WORKERS):
+        self.registry = registry
+        self.jobs = jobs
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='feed')
+        self.due = {}
+        self.running = set()
+        self.condition = threading.Condition()
+    
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+    
+    def run(self):
+        while True:
+            with self.condition:
+                now = time.time()
+                next_check = now + SCHEDULER_TICK
+                for agency in self.registry.active(now):
+                    for name, (poll, feed) in self.jobs.items():
+                        key = (agency.agency_id, name)
+                        if key in self.running or not feed(agency).url:
+                            continue
+                        due = self.due.get(key, now)
+                        if due <= now:
+                            self.running.add(key)
+                            self.executor.submit(self.poll, agency, name)
+                        else:
+                            next_check = min(next_check, due)
+                self.condition.wait(max(0, next_check - now))
+    
+    def poll(self, agency, name):
+        poll, feed = self.jobs[name]
+        delay = FAILED_POLL_DELAY
+        try:
+            # The first poll of an agency that has just become active loads its static feed
+            agency.ensure_loaded()
+            poll(agency)
+            # Paced to the feed's observed publish cadence, backing off while it is failing
+            delay = feed(agency).next_delay()
+        except Exception as e:
+            logger.error(f"Error polling {name} for {agency.agency_id}: {e}")
+            traceback.print_exc()
+        finally:
+            with self.condition:
+                self.due[(agency.agency_id, name)] = time.time() + delay
+                self.running.discard((agency.agency_id, name))
+                self.condition.notify()
@@ -0,0 +1,135 @@
+# hamilton-transit-map/backend/benchmarks/bench_feed_polling.py
+#
+# Replays a directory of recorded VehiclePositions .pb files through the local fixture server,
+# publishing the next one every --cadence seconds, with an outage in the middle. Polls it with
+# the old fixed-interval fetch and with FeedFetcher, and reports requests made, feeds parsed,
+# publishes missed and how stale each publish was when it was first seen.
+# Header timestamps must advance by --cadence between files; without --recordings, synthetic
+# feeds are generated that way.
+#
+#   python3 backend/benchmarks/bench_feed_polling.py --cadence 2 --duration 40
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from feed_fetcher import FeedFetcher, PollSchedule, read_feed_timestamp
+from fixture_server import FixtureServer
+from gtfs_realtime_parser import GTFSRealtimeParser
+from synthetic_feed import write_vehicle_positions
+
+FEED_PATH = '/GTFS-RT/GTFS_VehiclePositions.pb'
+
+class Publisher:
+    # Swaps the served fixture to the next recording on a fixed cadence; during the outage
+    # window the feed answers 404
+    def __init__(self, server, recordings, cadence, outage):
+        self.server = server
+        self.recordings = recordings
+        self.cadence = cadence
+        self.outage = outage
+        self.published = {}
+        self.stopped = threading.Event()
+    
+    def run(self):
+        start = time.time()
+        for i, path in enumerate(self.recordings):
+            elapsed = time.time() - start
+            if self.outage[0] <= elapsed < self.outage[1]:
+                self.server.remove_fixture(FEED_PATH)
+            else:
+                body = path.read_bytes()
+                self.server.set_fixture(FEED_PATH, body)
+                self.published[read_feed_timestamp(body)] = time.time()
+            if self.stopped.wait(self.cadence):
+                return
+
+def run_poller(name, server, recordings, args, poll, realtime):
+    publisher = Publisher(server, recordings, args.cadence, (args.duration * 0.4, args.duration * 0.55))
+    thread = threading.Thread(target=publisher.run, daemon=True)
+    thread.start()
+    time.sleep(0.1)
+    
+    seen = {}
+    statuses = {}
+    requests_made = 0
+    parsed = 0
+    parse_time = 0
+    deadline = time.time() + args.duration
+    while time.time() < deadline:
+        status, body, delay = poll()
+        requests_made += 1
+        statuses[status] = statuses.get(status, 0) + 1
+        if body is not None:
+            start = time.perf_counter()
+            realtime.parse_vehicle_positions(body)
+            parse_time += time.perf_counter() - start
+            parsed += 1
+            timestamp = read_feed_timestamp(body)
+            if timestamp not in seen:
+                seen[timestamp] = time.time()
+        time.sleep(delay)
+    
+    publisher.stopped.set()
+    thread.join()
+    
+    staleness = [seen[timestamp] - published for timestamp, published in publisher.published.items() if timestamp in seen]
+    missed = sum(1 for timestamp in publisher.published if timestamp not in seen)
+    print(f"  {name:9s} {requests_made:4d} requests  {parsed:3d} parsed ({parse_time * 1000:6.1f} ms)  "
+          f"{missed:3d} of {len(publisher.published)} publishes missed  "
+          f"staleness median {statistics.median(staleness) if staleness else 0:5.2f} s  max {max(staleness, default=0):5.2f} s  "
+          f"{dict(sorted(statuses.items()))}")
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--recordings', type=Path)
+    arg_parser.add_argument('--cadence', type=int, default=2)
+    arg_parser.add_argument('--duration', type=float, default=40)
+    arg_parser.add_argument('--fixed-interval', type=float, default=6)
+    args = arg_parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp, FixtureServer() as server:
+        if args.recordings:
+            recordings = sorted(args.recordings.glob('*.pb'))
+        else:
+            recordings = write_vehicle_positions(tmp, int(args.duration / args.cadence) + 2, cadence=args.cadence)
+        
+        url = server.url(FEED_PATH)
+        realtime = GTFSRealtimeParser(vehicle_positions_url=url, static_parser=SimpleNamespace(route_data={}))
+        print(f"{len(recordings)} recordings, published every {args.cadence} s, outage from "
+              f"{args.duration * 0.4:.0f} s to {args.duration * 0.55:.0f} s")
+        
+        def poll_fixed():
+            # What update_bus_data did before: an unconditional GET and a full parse every interval
+            try:
+                response = requests.get(url, timeout=5)
+            except requests.RequestException:
+                return 'error', None, args.fixed_interval
+            if response.status_code != 200:
+                return 'error', None, args.fixed_interval
+            return 'updated', response.content, args.fixed_interval
+        
+        run_poller('fixed', server, recordings, args, poll_fixed, realtime)
+        
+        # Scaled down from the production intervals to match the replay cadence
+        schedule = PollSchedule(min_interval=args.cadence / 8, max_interval=args.fixed_interval,
+                                learning_interval=args.cadence / 4, publish_lag=args.cadence / 10)
+        fetcher = FeedFetcher(url, schedule=schedule)
+        
+        def poll_adaptive():
+            body = fetcher.fetch()
+            return fetcher.status, body, fetcher.next_delay()
+        
+        run_poller('adaptive', server, recordings, args, poll_adaptive, realtime)
+        print(f"  learned cadence {fetcher.schedule.cadence} s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# hamilton-transit-map/backend/benchmarks/bench_map_matching.py
+#
+# Cost of snapping the fleet onto trip shapes. Places vehicles a GPS-like distance off their
+# trip's shape, then times building every shape's segment index, the per-poll snap_to_shapes
+# pass over the decoded columns, and the same snap done by scanning every segment of the shape.
+#
+#   python3 backend/benchmarks/bench_map_matching.py --vehicles 2000 --points-per-shape 1000
+import argparse
+import math
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from google.transit import gtfs_realtime_pb2
+from gtfs_realtime_parser import GTFSRealtimeParser
+from gtfs_static_parser import StaticDataset, directory_opener
+from map_matching import SEGMENT_CELL_SIZE, ShapeSegments, snap_to_shapes
+from spatial_index import METERS_PER_DEGREE_LAT, METERS_PER_DEGREE_LON
+from synthetic_feed import write_static_feed
+
+def scan_snap(segments, lat, lon):
+    # Nearest point over every segment of the shape
+    px = (lon - segments.origin_lon) * segments.scale_x
+    py = (lat - segments.origin_lat) * METERS_PER_DEGREE_LAT
+    best = math.inf
+    x, y = segments.x, segments.y
+    for i in range(len(x) - 1):
+        dx, dy = x[i + 1] - x[i], y[i + 1] - y[i]
+        length2 = dx * dx + dy * dy
+        t = min(max(((px - x[i]) * dx + (py - y[i]) * dy) / length2, 0.0), 1.0) if length2 else 0.0
+        best = min(best, math.hypot(px - x[i] - t * dx, py - y[i] - t * dy))
+    return best
+
+def check_corner_clip():
+    # A segment that crosses cell (1, 1) only across its corner, for 4% of a cell, must still be
+    # listed there; sampling along it every half cell steps from (1, 0) straight to (2, 1)
+    size = SEGMENT_CELL_SIZE
+    segments = ShapeSegments([1.26 * size, 2.76 * size], [0.3 * size, 1.8 * size])
+    cells = {cell for cell in segments.grid.cells if 0 in segments.grid.cell_entries(cell)}
+    assert cells == {(1, 0), (1, 1), (2, 1)}, f"segment listed in cells {sorted(cells)}"
+    
+    # A vehicle in that corner snaps to the segment from its own cell
+    snapped = segments.snap(1.985 * size, 1.015 * size, max_distance=10.0)
+    assert snapped is not None and snapped[3] < 10.0, "vehicle in the clipped corner did not snap"
+
+def build_feed(dataset, vehicles, noise, seed=1):
+    rng = random.Random(seed)
+    trips = [(trip_idx, route_id) for trip_idx, route_id, shape_id in dataset.trips_data.iter_trips() if shape_id]
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = '2.0'
+    feed.header.timestamp = 1700000000
+    for v in range(vehicles):
+        trip_idx, route_id = rng.choice(trips)
+        lats, lons = dataset.shapes_data.coords(dataset.trips_data.shape_of(trip_idx))
+        i = rng.randrange(len(lats))
+        entity = feed.entity.add()
+        entity.id = str(v)
+        entity.vehicle.vehicle.id = str(v)
+        entity.vehicle.trip.trip_id = dataset.trip_ids[trip_idx]
+        entity.vehicle.trip.route_id = route_id
+        entity.vehicle.position.latitude = lats[i] + rng.gauss(0, noise) / METERS_PER_DEGREE_LAT
+        entity.vehicle.position.longitude = lons[i] + rng.gauss(0, noise) / (METERS_PER_DEGREE_LON * math.cos(math.radians(lats[i])))
+    return feed.SerializeToString()
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--vehicles', type=int, default=2000)
+    arg_parser.add_argument('--routes', type=int, default=60)
+    arg_parser.add_argument('--points-per-shape', type=int, default=1000)
+    arg_parser.add_argument('--noise', type=float, default=15.0, help="GPS error in metres (standard deviation)")
+    arg_parser.add_argument('--polls', type=int, default=5)
+    args = arg_parser.parse_args()
+    check_corner_clip()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        write_static_feed(tmp, routes=args.routes, points_per_shape=args.points_per_shape, trips_per_route=50)
+        dataset = StaticDataset()
+        dataset.load(directory_opener(tmp))
+    
+    start = time.perf_counter()
+    for shape_id in dataset.shapes_data:
+        dataset.get_shape_segments(shape_id)
+    build_time = time.perf_counter() - start
+    
+    realtime = GTFSRealtimeParser(static_parser=SimpleNamespace(route_data=dataset.route_data))
+    columns = realtime.decode_vehicle_positions(build_feed(dataset, args.vehicles, args.noise))
+    
+    start = time.perf_counter()
+    for _ in range(args.polls):
+        matched = snap_to_shapes(columns, dataset)
+    snap_time = (time.perf_counter() - start) / args.polls
+    
+    sample = range(0, len(columns), max(1, len(columns) // 200))
+    start = time.perf_counter()
+    errors = []
+    for row in sample:
+        trip_idx = dataset.trip_ids.lookup(columns.trip_ids[columns.trips[row]])
+        segments = dataset.get_shape_segments(dataset.trips_data.shape_of(trip_idx))
+        best = scan_snap(segments, columns.latitude[row], columns.longitude[row])
+        indexed = segments.snap(columns.latitude[row], columns.longitude[row])
+        if indexed is not None:
+            errors.append(abs(indexed[3] - best))
+    scan_time = (time.perf_counter() - start) / len(sample)
+    
+    print(f"{len(dataset.shapes_data)} shapes of {args.points_per_shape} points, {len(columns)} vehicles "
+          f"with {args.noise:.0f} m GPS noise")
+    print(f"  segment indexes built in {build_time * 1000:.0f} ms")
+    print(f"  snap_to_shapes  {snap_time * 1000:7.1f} ms/poll  {snap_time / len(columns) * 1e6:6.1f} us/vehicle  "
+          f"({matched} matched)")
+    print(f"  segment scan                       {scan_time * 1e6:6.1f} us/vehicle  "
+          f"(max offset difference {max(errors, default=0):.3f} m)")
+
+if __name__ == '__main__':
+    main()
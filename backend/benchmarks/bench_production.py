@@ -0,0 +1,138 @@
+# hamilton-transit-map/backend/benchmarks/bench_production.py
+#
+# Load test of production.py. For each worker count, starts the production server in replay
+# mode on synthetic (or --recordings/--static) feeds, waits until the fetcher has published,
+# then has --clients processes send keep-alive requests round-robin over the main endpoints for
+# --duration seconds and reports the total throughput. Throughput should grow with the worker
+# count up to the number of cores, less whatever the load generator itself takes.
+#
+#   python3 backend/benchmarks/bench_production.py --workers 1,2,4 --clients 8 --duration 10
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_replay import write_recordings
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def get_json(port, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        connection.request('GET', path)
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+def wait_until_published(port, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            status = get_json(port, '/api/status')
+            if status['bus_count'] and status['predicted_trips']:
+                return status
+        except (OSError, ValueError, KeyError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("Production server did not publish realtime data in time")
+
+def client(port, paths, duration, results):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    requests_sent = 0
+    errors = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        path = paths[requests_sent % len(paths)]
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        requests_sent += 1
+    results.put((requests_sent, errors))
+
+def run_load(port, paths, clients, duration):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client, args=(port, paths, duration, results)) for _ in range(clients)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+    return sum(sent for sent, errors in totals) / elapsed, sum(errors for sent, errors in totals)
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--workers', default=None, help="Comma-separated worker counts (default 1, 2, 4, ... up to the cores)")
+    arg_parser.add_argument('--clients', type=int, default=None, help="Load generator processes (default twice the cores)")
+    arg_parser.add_argument('--duration', type=float, default=10.0)
+    arg_parser.add_argument('--recordings', type=Path)
+    arg_parser.add_argument('--static', type=Path)
+    arg_parser.add_argument('--polls', type=int, default=4)
+    args = arg_parser.parse_args()
+    
+    cores = os.cpu_count() or 1
+    if args.workers:
+        worker_counts = [int(count) for count in args.workers.split(',')]
+    else:
+        worker_counts = [count for count in (1, 2, 4, 8, 16, 32) if count < cores] + [cores]
+    clients = args.clients or 2 * cores
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.recordings and args.static:
+            recordings, zip_path = args.recordings, args.static
+        else:
+            recordings, zip_path = write_recordings(tmp, args.polls, 30, 60, 250)
+        
+        print(f"{cores} cores, {clients} client processes, {args.duration:.0f} s per run")
+        baseline = None
+        for workers in worker_counts:
+            port = free_port()
+            env = dict(os.environ, WORKERS=str(workers), PORT=str(port), HOST='127.0.0.1', PUSH_PORT=str(free_port()),
+                       REPLAY_DIR=str(recordings), REPLAY_STATIC_ZIP=str(zip_path), REPLAY_SPEED='100',
+                       REPLAY_DATA_DIR=str(Path(tmp) / 'data'))
+            process = subprocess.Popen([sys.executable, str(BACKEND_DIR / 'production.py')], env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_until_published(port)
+                buses = get_json(port, '/api/buses')
+                stops = get_json(port, '/api/stops')
+                paths = [
+                    '/api/buses',
+                    f"/api/buses?route_id={buses[0]['route_id']}",
+                    f"/api/stops/{stops[0]['stop_id']}/arrivals",
+                    f"/api/stops/nearest?lat={buses[0]['latitude']}&lon={buses[0]['longitude']}",
+                    '/api/routes',
+                    '/api/status'
+                ]
+                throughput, errors = run_load(port, paths, clients, args.duration)
+            finally:
+                process.terminate()
+                process.wait()
+            
+            baseline = baseline or throughput
+            print(f"  {workers:3d} workers  {throughput:9.0f} req/s  {throughput / baseline:5.2f}x  ({errors} errors)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+# hamilton-transit-map/backend/benchmarks/bench_push_fanout.py
+#
+# Load test for the /api/stream push channel. Starts a PushServer in this process, opens
+# thousands of Server-Sent Events connections from separate client processes (a share of
+# them filtered to one route), publishes synthetic vehicle snapshots and reports:
+#   - fan-out latency: publish -> event received, over every connection and poll
+#   - server memory per connection: RSS growth of this process divided by connections
+# Linux only (reads /proc/self/status).
+#
+#   python3 backend/benchmarks/bench_push_fanout.py --clients 2000 --polls 10
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import resource
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gtfs_realtime_parser import BusRouteIndex
+from push_server import PushServer
+from vehicle_deltas import SnapshotHistory
+
+class StreamAgency:
+    # What the push server needs of an agency: its snapshots and route names
+    def __init__(self, bus_history, route_data):
+        self.bus_history = bus_history
+        self.route_data = route_data
+    
+    def get_route_short_name(self, route_id):
+        return self.route_data.get(route_id, {}).get('route_short_name')
+
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+def build_routes(routes):
+    return {str(r): {'route_short_name': str(r), 'route_color': '#FF0000'} for r in range(1, routes + 1)}
+
+def build_fleet(route_data, buses, poll, seed=1):
+    rng = random.Random(seed)
+    route_ids = list(route_data)
+    fleet = []
+    for b in range(buses):
+        route_id = rng.choice(route_ids)
+        fleet.append({
+            'vehicle_id': str(b),
+            'route_id': route_id,
+            'trip_id': f"{route_id}_{b}",
+            'route_short_name': route_data[route_id]['route_short_name'],
+            'route_color': '#FF0000',
+            'latitude': 43.25 + rng.uniform(-0.1, 0.1) + poll * 0.0005,
+            'longitude': -79.87 + rng.uniform(-0.1, 0.1),
+            'timestamp': 1700000000 + poll * 60
+        })
+    return fleet
+
+async def stream_client(host, port, route_id, arrivals, final_version, connected):
+    reader, writer = await asyncio.open_connection(host, port)
+    target = f"/api/stream?route_id={route_id}" if route_id else "/api/stream"
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    connected.append(1)
+    
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if line.startswith(b'id: '):
+            version = int(line[4:])
+            arrivals.append((version, time.time()))
+            if version >= final_version:
+                break
+    writer.close()
+
+async def run_clients(host, port, count, route_share, routes, final_version, seed):
+    rng = random.Random(seed)
+    arrivals = []
+    connected = []
+    tasks = []
+    for _ in range(count):
+        route_id = str(rng.randint(1, routes)) if rng.random() < route_share else None
+        tasks.append(asyncio.ensure_future(stream_client(host, port, route_id, arrivals, final_version, connected)))
+        # Stagger connects a little so the listen backlog is not overrun
+        if len(tasks) % 200 == 0:
+            await asyncio.sleep(0.05)
+    done, pending = await asyncio.wait(tasks, timeout=600)
+    for task in pending:
+        task.cancel()
+    failed = sum(1 for task in done if task.exception() is not None)
+    return arrivals, len(connected), failed
+
+def client_process(host, port, count, route_share, routes, final_version, seed, results):
+    raise_file_limit()
+    results.put(asyncio.run(run_clients(host, port, count, route_share, routes, final_version, seed)))
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--clients', type=int, default=2000)
+    arg_parser.add_argument('--processes', type=int, default=4)
+    arg_parser.add_argument('--polls', type=int, default=10)
+    arg_parser.add_argument('--interval', type=float, default=1.0)
+    arg_parser.add_argument('--buses', type=int, default=250)
+    arg_parser.add_argument('--routes', type=int, default=60)
+    arg_parser.add_argument('--route-share', type=float, default=0.3)
+    args = arg_parser.parse_args()
+    
+    limit = raise_file_limit()
+    if args.clients + 100 > limit:
+        print(f"Open file limit is {limit}; lower --clients")
+        return
+    
+    route_data = build_routes(args.routes)
+    history = SnapshotHistory()
+    fleet = build_fleet(route_data, args.buses, 0)
+    history.publish(fleet, BusRouteIndex(fleet, route_data), json.dumps(fleet).encode('utf-8'), time.time())
+    
+    agency = StreamAgency(history, route_data)
+    server = PushServer(lambda agency_id: agency, host='127.0.0.1', port=0).start()
+    baseline = rss_kb()
+    
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    final_version = 1 + args.polls
+    per_process = [args.clients // args.processes + (1 if i < args.clients % args.processes else 0) for i in range(args.processes)]
+    processes = [context.Process(target=client_process,
+                                 args=('127.0.0.1', server.port, count, args.route_share, args.routes, final_version, i, results))
+                 for i, count in enumerate(per_process)]
+    for process in processes:
+        process.start()
+    
+    deadline = time.time() + 120
+    while server.subscriber_count < args.clients and time.time() < deadline:
+        time.sleep(0.1)
+    time.sleep(0.5)
+    connections = server.subscriber_count
+    connected_rss = rss_kb()
+    
+    published = {}
+    for poll in range(1, args.polls + 1):
+        time.sleep(args.interval)
+        fleet = build_fleet(route_data, args.buses, poll)
+        version = history.publish(fleet, BusRouteIndex(fleet, route_data), json.dumps(fleet).encode('utf-8'),
+                                  time.time()).version
+        published[version] = time.time()
+        server.notify(agency)
+    
+    arrivals = []
+    failed = 0
+    for _ in processes:
+        process_arrivals, process_connected, process_failed = results.get()
+        arrivals.extend(process_arrivals)
+        failed += process_failed
+    for process in processes:
+        process.join()
+    server.stop()
+    
+    latencies = [(received - published[version]) * 1000 for version, received in arrivals if version in published]
+    expected = connections * args.polls
+    
+    print(f"{connections} connections ({args.route_share:.0%} route-filtered), {args.buses} vehicles, {args.polls} polls")
+    print(f"  memory           {(connected_rss - baseline) / max(connections, 1):8.1f} KB/connection "
+          f"({baseline / 1024:.1f} MB -> {connected_rss / 1024:.1f} MB)")
+    print(f"  events received  {len(latencies)} of {expected}, {failed} failed connections")
+    if latencies:
+        print(f"  fan-out latency  p50 {percentile(latencies, 0.5):7.1f} ms  p95 {percentile(latencies, 0.95):7.1f} ms  "
+              f"p99 {percentile(latencies, 0.99):7.1f} ms  max {max(latencies):7.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# hamilton-transit-map/backend/benchmarks/bench_replay.py
+#
+# Offline throughput of the whole server. Starts server.py in replay mode as fast as it can
+# ingest (REPLAY_SPEED=0), plays every recording through the same ingest functions the polling
+# threads use, then times requests against the resulting state through the Flask test client.
+# Without --recordings and --static a synthetic network with a morning of VehiclePositions and
+# TripUpdates recordings is generated.
+#
+#   python3 backend/benchmarks/bench_replay.py --polls 20 --requests 200
+#   python3 backend/benchmarks/bench_replay.py --recordings DIR --static google_transit.zip
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from synthetic_feed import write_static_zip, write_vehicle_positions, write_trip_updates
+from service_calendar import DEFAULT_TIMEZONE
+from trip_updates import service_day_start
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def write_recordings(directory, polls, cadence, routes, vehicles, clock=8 * 3600, trips_per_route=300,
+                     stops_per_trip=40, **static_options):
+    # A static zip and polls of VehiclePositions and TripUpdates recordings starting at clock
+    # (seconds after midnight) today; static_options go to write_static_feed
+    service_date = datetime.now(DEFAULT_TIMEZONE).date()
+    start = service_day_start(service_date) + clock
+    zip_path = write_static_zip(Path(directory) / 'google_transit.zip', routes=routes, trips_per_route=trips_per_route,
+                                stops_per_trip=stops_per_trip, **static_options)
+    recordings = Path(directory) / 'recordings'
+    write_vehicle_positions(recordings, polls, cadence=cadence, start=start, routes=routes, vehicles=vehicles,
+                            trips_per_route=trips_per_route)
+    write_trip_updates(recordings, polls, start, service_date.strftime('%Y%m%d'), clock, cadence=cadence, routes=routes,
+                       trips_per_route=trips_per_route, stops_per_trip=stops_per_trip)
+    return recordings, zip_path
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--recordings', type=Path)
+    arg_parser.add_argument('--static', type=Path, help="GTFS static zip the recordings were taken against")
+    arg_parser.add_argument('--polls', type=int, default=20)
+    arg_parser.add_argument('--cadence', type=int, default=30)
+    arg_parser.add_argument('--routes', type=int, default=60)
+    arg_parser.add_argument('--vehicles', type=int, default=250)
+    arg_parser.add_argument('--requests', type=int, default=200)
+    args = arg_parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.recordings and args.static:
+            recordings, zip_path = args.recordings, args.static
+        else:
+            recordings, zip_path = write_recordings(tmp, args.polls, args.cadence, args.routes, args.vehicles)
+        
+        os.environ.update(REPLAY_DIR=str(recordings), REPLAY_STATIC_ZIP=str(zip_path), REPLAY_SPEED='0',
+                          REPLAY_DATA_DIR=str(Path(tmp) / 'data'))
+        start = time.perf_counter()
+        import server
+        logging.disable(logging.INFO)
+        print(f"server started (static feed loaded) in {time.perf_counter() - start:.2f} s")
+        
+        agency = server.agencies.default
+        parser = agency.parser
+        feeds = [(feed_timestamp, 'vehicle_positions', path) for feed_timestamp, path in parser.vehicle_positions_feed.recordings]
+        feeds += [(feed_timestamp, 'trip_updates', path) for feed_timestamp, path in parser.trip_updates_feed.recordings]
+        feeds.sort()
+        ingest = {'vehicle_positions': server.ingest_bus_data, 'trip_updates': server.ingest_trip_updates}
+        
+        timings = {'vehicle_positions': [], 'trip_updates': []}
+        replay_start = time.perf_counter()
+        for feed_timestamp, kind, path in feeds:
+            start = time.perf_counter()
+            ingest[kind]()
+            timings[kind].append(time.perf_counter() - start)
+        replay_time = time.perf_counter() - replay_start
+        
+        span = feeds[-1][0] - feeds[0][0] if feeds else 0
+        print(f"{len(feeds)} recordings covering {span} s of feed time replayed in {replay_time:.2f} s "
+              f"({span / replay_time if replay_time else 0:.0f}x real time)")
+        for kind, values in timings.items():
+            if values:
+                print(f"  ingest {kind:20s} p50 {percentile(values, 0.5) * 1000:8.1f} ms  "
+                      f"max {max(values) * 1000:8.1f} ms")
+        
+        client = server.app.test_client()
+        route_id = next(iter(parser.route_data), '')
+        stop_id = next(iter(agency.trip_predictions.by_stop), '')
+        buses = agency.bus_history.latest.buses
+        bus = buses[0] if buses else {}
+        endpoints = [
+            '/api/buses',
+            f"/api/buses?route_id={route_id}",
+            f"/api/buses?since={max(agency.bus_history.version - 1, 0)}",
+            f"/api/stops/{stop_id}/arrivals",
+            f"/api/history?vehicle_id={bus.get('vehicle_id', '')}&from={feeds[0][0] if feeds else 0}",
+            f"/api/history/snapshot?t={int(parser.clock())}",
+            '/api/stops',
+            '/api/routes',
+            '/api/status'
+        ]
+        for endpoint in endpoints:
+            latencies = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                response = client.get(endpoint)
+                latencies.append(time.perf_counter() - start)
+            print(f"  {endpoint[:48]:48s} {response.status_code}  p50 {percentile(latencies, 0.5) * 1000:7.2f} ms  "
+                  f"{len(latencies) / sum(latencies):7.0f} req/s")
+
+        # route_id comes straight from the query string; a quote in it must still give a valid ETag
+        for endpoint in ['/api/buses?route_id=a%22b', '/api/buses?route_id=a%22b&since=0']:
+            response = client.get(endpoint)
+            assert response.status_code == 200, f"{endpoint} returned {response.status_code}"
+            revalidated = client.get(endpoint, headers={'If-None-Match': response.headers['ETag']})
+            assert revalidated.status_code == 304, f"{endpoint} did not revalidate its ETag"
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# hamilton-transit-map/backend/benchmarks/bench_route_filter.py
+#
+# Microbenchmark for /api/buses?route_id= filtering at peak load (50+ routes, ~250 vehicles).
+# Compares the original scan over route_data and every bus with the precomputed route index
+# and per-snapshot short name buckets. JSON serialisation is excluded from both.
+#
+#   python3 backend/benchmarks/bench_route_filter.py --routes 60 --buses 250
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gtfs_static_parser import StaticDataset
+from gtfs_realtime_parser import BusRouteIndex
+
+def legacy_filter(route_data, bus_data, route_id):
+    route_short_name = None
+    for rid, route_info in route_data.items():
+        if rid == route_id:
+            route_short_name = route_info.get('route_short_name')
+            break
+    
+    if route_short_name:
+        filtered_buses = []
+        for bus in bus_data:
+            bus_route_id = bus.get('route_id')
+            if bus_route_id in route_data:
+                if route_data[bus_route_id].get('route_short_name') == route_short_name:
+                    filtered_buses.append(bus)
+        return filtered_buses
+    return [bus for bus in bus_data if bus.get('route_id') == route_id]
+
+def indexed_filter(dataset, buses_by_route, route_id):
+    return buses_by_route.get_buses(route_id, dataset.get_route_short_name(route_id))
+
+def build_fixtures(routes, buses, variants, seed=1):
+    rng = random.Random(seed)
+    dataset = StaticDataset()
+    for r in range(1, routes + 1):
+        for v in range(variants):
+            dataset.route_data[f"{r}-{v}"] = {'route_short_name': str(r), 'route_color': '#FF0000'}
+    dataset.build_route_index()
+    
+    route_ids = list(dataset.route_data)
+    bus_data = []
+    for b in range(buses):
+        route_id = rng.choice(route_ids)
+        bus_data.append({
+            'vehicle_id': str(b),
+            'route_id': route_id,
+            'route_short_name': dataset.route_data[route_id]['route_short_name'],
+            'latitude': 43.25,
+            'longitude': -79.87
+        })
+    return dataset, bus_data, route_ids
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--routes', type=int, default=60)
+    arg_parser.add_argument('--variants', type=int, default=3)
+    arg_parser.add_argument('--buses', type=int, default=250)
+    arg_parser.add_argument('--requests', type=int, default=20000)
+    args = arg_parser.parse_args()
+    
+    dataset, bus_data, route_ids = build_fixtures(args.routes, args.buses, args.variants)
+    buses_by_route = BusRouteIndex(bus_data, dataset.route_data)
+    
+    for route_id in route_ids:
+        expected = legacy_filter(dataset.route_data, bus_data, route_id)
+        assert indexed_filter(dataset, buses_by_route, route_id) == expected
+    
+    rng = random.Random(2)
+    queries = [rng.choice(route_ids) for _ in range(args.requests)]
+    
+    legacy = timeit.timeit(lambda: [legacy_filter(dataset.route_data, bus_data, q) for q in queries], number=1)
+    indexed = timeit.timeit(lambda: [indexed_filter(dataset, buses_by_route, q) for q in queries], number=1)
+    ingest = timeit.timeit(lambda: BusRouteIndex(bus_data, dataset.route_data), number=200) / 200
+    
+    print(f"{len(dataset.route_data)} route ids ({args.routes} short names), {len(bus_data)} vehicles")
+    print(f"  legacy filter   {legacy / args.requests * 1e6:8.2f} us/request")
+    print(f"  indexed filter  {indexed / args.requests * 1e6:8.2f} us/request  ({legacy / indexed:.0f}x)")
+    print(f"  bucket build    {ingest * 1e6:8.2f} us/poll")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# hamilton-transit-map/backend/benchmarks/bench_service_window.py
+#
+# What serving only today's and tomorrow's services saves. A synthetic feed is written with
+# several back-to-back service periods in calendar.txt, then the Python heap held by a freshly
+# parsed dataset is compared with a dataset mapped from its snapshot plus its service window,
+# and the route relations of the window with those of the whole feed. Times are taken under
+# tracemalloc, so they only compare with each other.
+#
+#   python3 backend/benchmarks/bench_service_window.py --service-periods 4 --trips-per-route 1000
+import argparse
+import gc
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gtfs_snapshot import save_dataset_snapshot, load_dataset_snapshot
+from gtfs_static_parser import StaticDataset, directory_opener
+from synthetic_feed import write_static_feed
+
+def traced(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--routes', type=int, default=60)
+    arg_parser.add_argument('--trips-per-route', type=int, default=500)
+    arg_parser.add_argument('--stops-per-trip', type=int, default=40)
+    arg_parser.add_argument('--service-periods', type=int, default=4)
+    args = arg_parser.parse_args()
+    logging.disable(logging.INFO)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        write_static_feed(data_dir, routes=args.routes, trips_per_route=args.trips_per_route,
+                          stops_per_trip=args.stops_per_trip, shapes_per_route=args.service_periods,
+                          service_periods=args.service_periods)
+        source_paths = sorted(data_dir.glob('*.txt'))
+        snapshot_path = data_dir / 'static_snapshot.bin'
+        
+        def parse():
+            dataset = StaticDataset()
+            dataset.load(directory_opener(data_dir))
+            return dataset
+        
+        parsed, parsed_size, parse_time = traced(parse)
+        save_dataset_snapshot(parsed, snapshot_path, source_paths)
+        full_routes = sum(len(stops) for stops in parsed.route_stops.values())
+        full_shapes = sum(len(shape_ids) for shape_ids in parsed.route_shapes.values())
+        del parsed
+        
+        def mapped():
+            dataset = StaticDataset()
+            load_dataset_snapshot(dataset, snapshot_path, source_paths)
+            return dataset
+        
+        dataset, mapped_size, map_time = traced(mapped)
+        window, window_size, window_time = traced(dataset.service_window)
+        
+        print(f"{args.routes} routes x {args.trips_per_route} trips in {args.service_periods} service periods")
+        print(f"  parsed dataset            {parsed_size / 1e6:8.1f} MB heap  {parse_time * 1000:8.1f} ms")
+        print(f"  mapped dataset            {mapped_size / 1e6:8.1f} MB heap  {map_time * 1000:8.1f} ms")
+        print(f"  + service window          {window_size / 1e6:8.1f} MB heap  {window_time * 1000:8.1f} ms")
+        print(f"  active trips              {window.trip_count} of {window.total_trips}")
+        print(f"  route stops               {sum(len(stops) for stops in window.route_stops.values())} "
+              f"of {full_routes}")
+        print(f"  route shapes              {sum(len(shape_ids) for shape_ids in window.route_shapes.values())} "
+              f"of {full_shapes}")
+
+if __name__ == '__main__':
+    main()
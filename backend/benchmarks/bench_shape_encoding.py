@@ -0,0 +1,66 @@
+# hamilton-transit-map/backend/benchmarks/bench_shape_encoding.py
+#
+# Payload size and serialisation latency of /api/shapes for each precomputed simplification
+# level and output format, against the original full-precision [[lat, lon], ...] output.
+#
+#   python3 backend/benchmarks/bench_shape_encoding.py --routes 60 --points-per-shape 1500
+import argparse
+import gzip
+import json
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from synthetic_feed import write_static_feed
+from gtfs_static_parser import StaticDataset, directory_opener
+from shape_encoding import SHAPE_FORMATS, SHAPE_ZOOM_TOLERANCES
+
+def serialize(data):
+    return (json.dumps(data, separators=(',', ':')) + '\n').encode('utf-8')
+
+def measure(build, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = serialize(build())
+    return (time.perf_counter() - start) / repeat, body
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--routes', type=int, default=60)
+    arg_parser.add_argument('--shapes-per-route', type=int, default=4)
+    arg_parser.add_argument('--points-per-shape', type=int, default=1500)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+    
+    logging.basicConfig(level=logging.WARNING)
+    
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_static_feed(data_dir, routes=args.routes, shapes_per_route=args.shapes_per_route,
+                          points_per_shape=args.points_per_shape, trips_per_route=1, stops_per_trip=2)
+        dataset = StaticDataset()
+        dataset.load_shapes_data(directory_opener(data_dir))
+    
+    start = time.perf_counter()
+    dataset.simplify_shapes()
+    print(f"{len(dataset.shapes_data)} shapes, {len(dataset.shapes_data.lat)} points; "
+          f"simplification precomputed in {time.perf_counter() - start:.2f} s")
+    
+    baseline, body = measure(lambda: dict(dataset.shapes_data.items()), args.repeat)
+    baseline_size = len(body)
+    print(f"{'zoom':>6} {'format':<9} {'bytes':>12} {'gzip':>10} {'vs raw':>8} {'serialize':>11}")
+    print(f"{'full':>6} {'legacy':<9} {baseline_size:>12,} {len(gzip.compress(body)):>10,} {1:>7.3f}x {baseline * 1000:>8.1f} ms")
+    
+    for level in sorted(SHAPE_ZOOM_TOLERANCES) + [None]:
+        for shape_format in SHAPE_FORMATS:
+            elapsed, body = measure(lambda: dataset.get_shapes(level, shape_format), args.repeat)
+            print(f"{level or 'full':>6} {shape_format:<9} {len(body):>12,} {len(gzip.compress(body)):>10,} "
+                  f"{len(body) / baseline_size:>7.3f}x {elapsed * 1000:>8.1f} ms")
+    
+    print("Cached responses are served without re-serialising; the latency column is the one-off cost per dataset.")
+
+if __name__ == '__main__':
+    main()
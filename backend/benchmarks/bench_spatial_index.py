@@ -0,0 +1,108 @@
+# hamilton-transit-map/backend/benchmarks/bench_spatial_index.py
+#
+# Viewport (bbox) and nearest-stop queries at full-network size. Compares a linear scan over
+# stop_data / every shape point with the grid indexes built by StaticDataset. Queries are
+# drawn around real stops, with viewports of roughly street-to-neighbourhood size.
+#
+#   python3 backend/benchmarks/bench_spatial_index.py --stops 2500 --routes 60
+import argparse
+import random
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gtfs_static_parser import StaticDataset, directory_opener
+from spatial_index import distance_meters
+from synthetic_feed import write_static_feed
+
+def scan_stops_in_bbox(stop_data, bbox):
+    min_lat, min_lon, max_lat, max_lon = bbox
+    return [stop for stop in stop_data
+            if min_lat <= stop['latitude'] <= max_lat and min_lon <= stop['longitude'] <= max_lon]
+
+def scan_nearest_stops(stop_data, lat, lon, k):
+    distances = sorted((distance_meters(lat, lon, stop['latitude'], stop['longitude']), i) for i, stop in enumerate(stop_data))
+    return [stop_data[i]['stop_id'] for distance, i in distances[:k]]
+
+def scan_shapes_in_bbox(shapes_data, bbox):
+    min_lat, min_lon, max_lat, max_lon = bbox
+    return [shape_id for shape_id, points in shapes_data.items()
+            if any(min_lat <= lat <= max_lat and min_lon <= lon <= max_lon for lat, lon in points)]
+
+# Points nowhere near the network, as a client can send to /api/stops/nearest; each must cost
+# about as much as a query inside it rather than a walk across every cell in between
+FAR_QUERIES = [(0.0, 0.0), (43.25, 120.0), (-89.9, -179.9), (89.9, -79.85), (1e6, -1e6)]
+
+def build_queries(stop_data, count, seed=2):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        stop = rng.choice(stop_data)
+        half = rng.uniform(0.002, 0.02)
+        lat = stop['latitude'] + rng.uniform(-0.005, 0.005)
+        lon = stop['longitude'] + rng.uniform(-0.005, 0.005)
+        queries.append((lat, lon, (lat - half, lon - half, lat + half, lon + half)))
+    return queries
+
+def report(name, scan, indexed, count):
+    print(f"  {name:16s} scan {scan / count * 1e6:9.1f} us  indexed {indexed / count * 1e6:7.1f} us  ({scan / indexed:.0f}x)")
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--routes', type=int, default=60)
+    arg_parser.add_argument('--stops', type=int, default=2500)
+    arg_parser.add_argument('--points-per-shape', type=int, default=400)
+    arg_parser.add_argument('--queries', type=int, default=2000)
+    arg_parser.add_argument('--k', type=int, default=5)
+    args = arg_parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        write_static_feed(tmp, routes=args.routes, stops=args.stops, points_per_shape=args.points_per_shape, trips_per_route=20)
+        dataset = StaticDataset()
+        dataset.load(directory_opener(Path(tmp)))
+    
+    start = time.perf_counter()
+    dataset.build_spatial_indexes()
+    build = time.perf_counter() - start
+    
+    stop_data = dataset.stop_data
+    queries = build_queries(stop_data, args.queries)
+    
+    for lat, lon, bbox in queries[:200]:
+        assert dataset.find_stops_in_bbox(bbox) == scan_stops_in_bbox(stop_data, bbox)
+        assert [stop['stop_id'] for stop in dataset.find_nearest_stops(lat, lon, args.k)] == scan_nearest_stops(stop_data, lat, lon, args.k)
+        # The index also returns shapes passing between points near the box, so it is a superset
+        assert set(dataset.shape_index.in_bbox(*bbox)) >= set(scan_shapes_in_bbox(dataset.shapes_data, bbox))
+    for lat, lon in FAR_QUERIES:
+        start = time.perf_counter()
+        nearest = [stop['stop_id'] for stop in dataset.find_nearest_stops(lat, lon, args.k)]
+        elapsed = time.perf_counter() - start
+        assert nearest == scan_nearest_stops(stop_data, lat, lon, args.k), f"wrong nearest stops for far point {lat},{lon}"
+        assert elapsed < 1, f"nearest stops to far point {lat},{lon} took {elapsed:.1f} s"
+    
+    print(f"{len(stop_data)} stops, {len(dataset.shapes_data)} shapes ({len(dataset.shapes_data.lat)} points), {args.queries} queries")
+    print(f"  index build      {build * 1e3:9.1f} ms")
+    
+    scan = timeit.timeit(lambda: [scan_stops_in_bbox(stop_data, bbox) for lat, lon, bbox in queries], number=1)
+    indexed = timeit.timeit(lambda: [dataset.find_stops_in_bbox(bbox) for lat, lon, bbox in queries], number=1)
+    report('stops in bbox', scan, indexed, args.queries)
+    
+    scan = timeit.timeit(lambda: [scan_nearest_stops(stop_data, lat, lon, args.k) for lat, lon, bbox in queries], number=1)
+    indexed = timeit.timeit(lambda: [dataset.find_nearest_stops(lat, lon, args.k) for lat, lon, bbox in queries], number=1)
+    report(f'nearest {args.k} stops', scan, indexed, args.queries)
+    
+    scan = timeit.timeit(lambda: [scan_nearest_stops(stop_data, lat, lon, args.k) for lat, lon in FAR_QUERIES], number=1)
+    indexed = timeit.timeit(lambda: [dataset.find_nearest_stops(lat, lon, args.k) for lat, lon in FAR_QUERIES], number=1)
+    report('nearest far away', scan, indexed, len(FAR_QUERIES))
+    
+    shape_queries = queries[:200]
+    scan = timeit.timeit(lambda: [scan_shapes_in_bbox(dataset.shapes_data, bbox) for lat, lon, bbox in shape_queries], number=1)
+    indexed = timeit.timeit(lambda: [dataset.shape_index.in_bbox(*bbox) for lat, lon, bbox in shape_queries], number=1)
+    report('shapes in bbox', scan, indexed, len(shape_queries))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# hamilton-transit-map/backend/benchmarks/bench_static_load.py
+#
+# Compares the streaming columnar loader against the original read-whole-file + csv.DictReader
+# parsers for shapes.txt and stop_times.txt. Each case runs in a fresh process so peak RSS
+# is not polluted by earlier cases.
+#
+#   python3 backend/benchmarks/bench_static_load.py --trips-per-route 2000
+import argparse
+import csv
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from synthetic_feed import write_static_feed
+
+def legacy_parse_shapes_data(text_data):
+    lines = text_data.strip().split('\n')
+    reader = csv.DictReader(lines)
+    
+    shape_points = {}
+    for row in reader:
+        shape_id = row['shape_id']
+        if shape_id not in shape_points:
+            shape_points[shape_id] = []
+        shape_points[shape_id].append({
+            'lat': float(row['shape_pt_lat']),
+            'lon': float(row['shape_pt_lon']),
+            'sequence': int(row['shape_pt_sequence'])
+        })
+    
+    shapes_data = {}
+    for shape_id, points in shape_points.items():
+        sorted_points = sorted(points, key=lambda x: x['sequence'])
+        shapes_data[shape_id] = [[p['lat'], p['lon']] for p in sorted_points]
+    return shapes_data
+
+def legacy_parse_stop_times_data(text_data):
+    lines = text_data.strip().split('\n')
+    reader = csv.DictReader(lines)
+    
+    stop_times_data = {}
+    for row in reader:
+        trip_id = row['trip_id']
+        if trip_id not in stop_times_data:
+            stop_times_data[trip_id] = []
+        stop_times_data[trip_id].append({
+            'stop_id': row['stop_id'],
+            'sequence': int(row['stop_sequence'])
+        })
+    
+    for trip_id, stops in stop_times_data.items():
+        stop_times_data[trip_id] = sorted(stops, key=lambda x: x['sequence'])
+    return stop_times_data
+
+def columnar_parse(file_name, path):
+    from gtfs_columnar import StringInterner, ShapeTable, StopTimesTable, open_gtfs_file, iter_columns
+    
+    with open_gtfs_file(path) as f:
+        if file_name == 'shapes.txt':
+            table = ShapeTable()
+            for shape_id, lat, lon, sequence in iter_columns(f, ['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence']):
+                table.append(shape_id, float(lat), float(lon), int(sequence))
+        else:
+            table = StopTimesTable(StringInterner(), StringInterner())
+            for trip_id, stop_id, sequence in iter_columns(f, ['trip_id', 'stop_id', 'stop_sequence']):
+                table.append(trip_id, stop_id, int(sequence))
+    table.finalize()
+    return table
+
+def legacy_parse(file_name, path):
+    with open(path, 'r') as f:
+        text_data = f.read()
+    if file_name == 'shapes.txt':
+        return legacy_parse_shapes_data(text_data)
+    return legacy_parse_stop_times_data(text_data)
+
+def run_case(loader, file_name, path, results):
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    data = loader(file_name, path)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((elapsed, baseline_rss, peak_rss, len(data)))
+
+def measure(loader, file_name, path):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_case, args=(loader, file_name, path, results))
+    process.start()
+    outcome = results.get()
+    process.join()
+    return outcome
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--routes', type=int, default=60)
+    arg_parser.add_argument('--trips-per-route', type=int, default=500)
+    arg_parser.add_argument('--stops-per-trip', type=int, default=40)
+    arg_parser.add_argument('--points-per-shape', type=int, default=1500)
+    args = arg_parser.parse_args()
+    
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    rss_unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_static_feed(data_dir, routes=args.routes, trips_per_route=args.trips_per_route,
+                          stops_per_trip=args.stops_per_trip, points_per_shape=args.points_per_shape)
+        
+        for file_name in ['shapes.txt', 'stop_times.txt']:
+            path = Path(data_dir) / file_name
+            size_mb = path.stat().st_size / (1024 * 1024)
+            print(f"{file_name} ({size_mb:.1f} MB)")
+            
+            for label, loader in [('legacy', legacy_parse), ('columnar', columnar_parse)]:
+                elapsed, baseline_rss, peak_rss, groups = measure(loader, file_name, path)
+                print(f"  {label:<9} {elapsed:7.2f} s   peak RSS {peak_rss / rss_unit:7.1f} MB "
+                      f"(+{(peak_rss - baseline_rss) / rss_unit:.1f} MB)   {groups} groups")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# hamilton-transit-map/backend/benchmarks/bench_static_refresh.py
+#
+# Runs GTFSStaticParser.refresh_static_data against the local fixture server and checks each
+# outcome: an unchanged zip (304) leaves the dataset alone, a changed zip is swapped in as one
+# assignment while a reader thread keeps querying, and a failed download (404, a body that is
+# not a zip, the server gone) keeps the old dataset and the old zip. Reports how long each
+# refresh took; any check that fails stops the run.
+#
+#   python3 backend/benchmarks/bench_static_refresh.py --routes 60
+import argparse
+import logging
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fixture_server import FixtureServer
+from gtfs_static_parser import GTFSStaticParser
+from synthetic_feed import write_static_zip
+
+ZIP_PATH = '/GTFS-Static/google_transit.zip'
+
+class Reader:
+    # Reads the served dataset in a loop, as request threads do, and records every dataset it
+    # saw and any read that found it half built
+    def __init__(self, parser):
+        self.parser = parser
+        self.seen = set()
+        self.errors = []
+        self.stopped = threading.Event()
+    
+    def run(self):
+        while not self.stopped.is_set():
+            dataset = self.parser.dataset
+            try:
+                route_ids = list(dataset.route_data)
+                if len(route_ids) != len(dataset.route_variants):
+                    self.errors.append(f"{len(route_ids)} routes but {len(dataset.route_variants)} variants")
+                for route_id in route_ids[:5]:
+                    dataset.get_route_stops(route_id)
+                self.seen.add(len(route_ids))
+            except Exception as e:
+                self.errors.append(repr(e))
+
+def timed_refresh(parser):
+    start = time.perf_counter()
+    refreshed = parser.refresh_static_data()
+    return refreshed, time.perf_counter() - start
+
+def report(case, refreshed, elapsed, dataset):
+    print(f"  {case:28s} refreshed={str(refreshed):5s} {elapsed * 1000:8.1f} ms  {len(dataset.route_data)} routes")
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--routes', type=int, default=20)
+    arg_parser.add_argument('--trips-per-route', type=int, default=50)
+    args = arg_parser.parse_args()
+    logging.disable(logging.WARNING)
+    
+    with tempfile.TemporaryDirectory() as tmp, FixtureServer() as server:
+        tmp = Path(tmp)
+        old_zip = write_static_zip(tmp / 'old.zip', routes=args.routes, trips_per_route=args.trips_per_route,
+                                   points_per_shape=50)
+        new_zip = write_static_zip(tmp / 'new.zip', routes=args.routes + 5, trips_per_route=args.trips_per_route,
+                                   points_per_shape=50, seed=2)
+        server.set_fixture(ZIP_PATH, old_zip)
+        
+        parser = GTFSStaticParser(static_zip_url=server.url(ZIP_PATH), data_dir=tmp / 'data')
+        old_dataset = parser.dataset
+        assert len(old_dataset.route_data) == args.routes, "initial download was not loaded"
+        print(f"Loaded {args.routes} routes from {server.url(ZIP_PATH)}")
+        
+        # Unchanged upstream: a conditional request answered 304, and nothing is rebuilt
+        refreshed, elapsed = timed_refresh(parser)
+        report('not modified (304)', refreshed, elapsed, parser.dataset)
+        assert not refreshed and parser.dataset is old_dataset, "a 304 replaced the dataset"
+        assert 'If-None-Match' in server.request_log[-1][1], "refresh did not send the zip's ETag"
+        
+        # Changed upstream: the new dataset is built aside and swapped in while a reader runs
+        server.set_fixture(ZIP_PATH, new_zip)
+        reader = Reader(parser)
+        reader_thread = threading.Thread(target=reader.run, daemon=True)
+        reader_thread.start()
+        refreshed, elapsed = timed_refresh(parser)
+        time.sleep(0.1)
+        reader.stopped.set()
+        reader_thread.join()
+        report('changed zip', refreshed, elapsed, parser.dataset)
+        assert refreshed and parser.dataset is not old_dataset, "a changed zip was not swapped in"
+        assert len(parser.dataset.route_data) == args.routes + 5, "the swapped-in dataset is not the new zip's"
+        assert not reader.errors, f"readers saw a partial dataset: {reader.errors[:3]}"
+        assert reader.seen == {args.routes, args.routes + 5}, f"readers saw {sorted(reader.seen)} routes"
+        new_dataset = parser.dataset
+        new_zip_bytes = parser.backup_zip_path.read_bytes()
+        
+        # Failed downloads: the dataset being served and the zip on disk are both kept
+        failures = [
+            ('missing upstream (404)', lambda: server.remove_fixture(ZIP_PATH)),
+            ('corrupt download', lambda: server.set_fixture(ZIP_PATH, b'not a zip file')),
+            ('server unreachable', server.stop)
+        ]
+        for case, fail in failures:
+            fail()
+            refreshed, elapsed = timed_refresh(parser)
+            report(case, refreshed, elapsed, parser.dataset)
+            assert not refreshed and parser.dataset is new_dataset, f"{case} replaced the dataset"
+            assert parser.backup_zip_path.read_bytes() == new_zip_bytes, f"{case} replaced the zip on disk"
+            assert not list(parser.data_dir.glob('*.part')), f"{case} left a partial download behind"
+        print("All refresh checks passed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# hamilton-transit-map/backend/benchmarks/bench_stop_times.py
+#
+# Memory held by stop_times and the route <-> stop relations once loaded: the original dict of
+# lists of {'stop_id', 'sequence'} dicts plus per-route lists of stop dicts, against the
+# deduplicated stop patterns of StopTimesTable and the CSR arrays of RouteStopIndex. Sizes are
+# what tracemalloc still sees allocated after each build, so parser temporaries do not count.
+#
+#   python3 backend/benchmarks/bench_stop_times.py --trips-per-route 2000
+import argparse
+import gc
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_static_load import legacy_parse_stop_times_data
+from synthetic_feed import write_static_feed
+from gtfs_columnar import StringInterner, StopTimesTable, TripTable, RouteStopIndex, open_gtfs_file, iter_columns
+
+def load_stops(path):
+    stop_ids = StringInterner()
+    stop_data = []
+    with open_gtfs_file(path) as f:
+        for stop_id, stop_name, lat, lon in iter_columns(f, ['stop_id', 'stop_name', 'stop_lat', 'stop_lon']):
+            stop_ids.intern(stop_id)
+            stop_data.append({'stop_id': stop_id, 'stop_name': stop_name, 'latitude': float(lat), 'longitude': float(lon)})
+    return stop_ids, stop_data
+
+def load_trips(path, trip_ids):
+    trips_data = TripTable(trip_ids)
+    with open_gtfs_file(path) as f:
+        for trip_id, route_id, shape_id in iter_columns(f, ['trip_id', 'route_id'], ['shape_id']):
+            trips_data.append(trip_id, route_id, shape_id)
+    return trips_data
+
+def legacy_build(data_dir, stop_data, trips_data):
+    with open(Path(data_dir) / 'stop_times.txt', 'r') as f:
+        stop_times_data = legacy_parse_stop_times_data(f.read())
+    
+    route_to_stops = {}
+    for trip_id, stops in stop_times_data.items():
+        if trip_id in trips_data:
+            route_id = trips_data[trip_id]['route_id']
+            if route_id not in route_to_stops:
+                route_to_stops[route_id] = set()
+            for stop in stops:
+                route_to_stops[route_id].add(stop['stop_id'])
+    
+    stop_dict = {stop['stop_id']: stop for stop in stop_data}
+    route_stops = {}
+    for route_id, stop_ids in route_to_stops.items():
+        route_stops[route_id] = [stop_dict[stop_id] for stop_id in stop_ids if stop_id in stop_dict]
+    return stop_times_data, route_stops
+
+def compact_build(data_dir, stop_ids, stop_data, trips_data):
+    stop_times_data = StopTimesTable(trips_data.trip_ids, stop_ids)
+    with open_gtfs_file(Path(data_dir) / 'stop_times.txt') as f:
+        for trip_id, stop_id, sequence in iter_columns(f, ['trip_id', 'stop_id', 'stop_sequence']):
+            stop_times_data.append(trip_id, stop_id, int(sequence))
+    stop_times_data.finalize()
+    
+    route_stops = RouteStopIndex(trips_data.route_ids, stop_ids, stop_data, stop_times_data)
+    route_stops.build(trips_data)
+    return stop_times_data, route_stops
+
+def measure(build):
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    return result, tracemalloc.get_traced_memory()[0] - before, elapsed
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--routes', type=int, default=60)
+    arg_parser.add_argument('--trips-per-route', type=int, default=500)
+    arg_parser.add_argument('--stops-per-trip', type=int, default=40)
+    arg_parser.add_argument('--shapes-per-route', type=int, default=4)
+    args = arg_parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_static_feed(data_dir, routes=args.routes, trips_per_route=args.trips_per_route,
+                          stops_per_trip=args.stops_per_trip, shapes_per_route=args.shapes_per_route,
+                          points_per_shape=2)
+        stop_ids, stop_data = load_stops(Path(data_dir) / 'stops.txt')
+        trips_data = load_trips(Path(data_dir) / 'trips.txt', StringInterner())
+        
+        tracemalloc.start()
+        legacy, legacy_bytes, legacy_time = measure(lambda: legacy_build(data_dir, stop_data, trips_data))
+        compact, compact_bytes, compact_time = measure(lambda: compact_build(data_dir, stop_ids, stop_data, trips_data))
+        tracemalloc.stop()
+        
+        stop_times_data, route_stops = compact
+        rows = len(stop_times_data.departures)
+        print(f"{rows} stop times, {len(stop_times_data)} trips, {stop_times_data.pattern_count} stop patterns, "
+              f"{len(route_stops)} routes")
+        print(f"  legacy   {legacy_bytes / (1024 * 1024):8.1f} MB  {legacy_bytes / rows:6.1f} B/stop time  "
+              f"built in {legacy_time:.2f} s")
+        print(f"  compact  {compact_bytes / (1024 * 1024):8.1f} MB  {compact_bytes / rows:6.1f} B/stop time  "
+              f"built in {compact_time:.2f} s")
+        print(f"  {legacy_bytes / compact_bytes:.1f}x less memory")
+        
+        # Both layouts must describe the same network
+        legacy_stop_times, legacy_route_stops = legacy
+        for trip_id in list(legacy_stop_times)[::max(1, len(legacy_stop_times) // 100)]:
+            expected = [(stop['stop_id'], stop['sequence']) for stop in legacy_stop_times[trip_id]]
+            assert stop_times_data[trip_id] == expected, trip_id
+        for route_id, stops in legacy_route_stops.items():
+            assert sorted(stop['stop_id'] for stop in stops) == sorted(stop['stop_id'] for stop in route_stops[route_id])
+
+if __name__ == '__main__':
+    main()
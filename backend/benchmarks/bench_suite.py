@@ -0,0 +1,264 @@
+# hamilton-transit-map/backend/benchmarks/bench_suite.py
+#
+# The whole backend at a chosen scale, with results saved as JSON so runs can be compared
+# offline. Generates (or reuses, with --fixtures) a synthetic static feed and realtime
+# recordings, then times in one process:
+#   - each GTFSStaticParser load phase, parsing the zip cold and then from the snapshot
+#   - parse_vehicle_positions on every VehiclePositions recording
+#   - ingesting each recording through the server's own ingest functions
+#   - every /api/* route of the Flask app through the test client
+# Fixtures are seeded, so the same scale generates the same feed. Pass --compare with an
+# earlier run's JSON to list what got slower; the exit status is 1 if anything regressed.
+#
+#   python3 backend/benchmarks/bench_suite.py --scale full --fixtures /tmp/gtfs-full --output full.json
+#   python3 backend/benchmarks/bench_suite.py --scale full --fixtures /tmp/gtfs-full --compare full.json
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_replay import percentile, write_recordings
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# stop_times rows are routes * trips_per_route * stops_per_trip; full is 50k trips, 5M stop times
+SCALES = {
+    'small': {'routes': 20, 'trips_per_route': 100, 'stops_per_trip': 30, 'stops': 1000, 'vehicles': 200},
+    'medium': {'routes': 60, 'trips_per_route': 300, 'stops_per_trip': 40, 'stops': 2500, 'vehicles': 500},
+    'full': {'routes': 100, 'trips_per_route': 500, 'stops_per_trip': 100, 'stops': 8000, 'vehicles': 2000}
+}
+# Differences smaller than this are noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.0002
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def summarize(latencies, **extra):
+    # 'seconds' is the figure --compare looks at
+    result = {
+        'seconds': percentile(latencies, 0.5),
+        'p90': percentile(latencies, 0.9),
+        'mean': sum(latencies) / len(latencies),
+        'samples': len(latencies)
+    }
+    result.update(extra)
+    return result
+
+def phase_seconds(histogram, before):
+    # Seconds added to each label of a histogram since its totals were `before`
+    seconds = {}
+    for label_values, (count, total) in histogram.totals().items():
+        previous = before.get(label_values, (0, 0.0))[1]
+        if total > previous:
+            seconds[label_values[0]] = total - previous
+    return seconds
+
+def prepare_fixtures(directory, scale, polls, cadence):
+    directory = Path(directory)
+    recordings, zip_path = directory / 'recordings', directory / 'google_transit.zip'
+    if zip_path.exists() and recordings.is_dir():
+        print(f"Using fixtures in {directory}")
+        return recordings, zip_path, 0.0
+    
+    print(f"Generating {scale['routes'] * scale['trips_per_route']} trips, "
+          f"{scale['routes'] * scale['trips_per_route'] * scale['stops_per_trip']} stop times, "
+          f"{scale['vehicles']} vehicles and {polls} polls of each feed in {directory}")
+    start = time.perf_counter()
+    directory.mkdir(parents=True, exist_ok=True)
+    write_recordings(directory, polls, cadence, scale['routes'], scale['vehicles'],
+                     trips_per_route=scale['trips_per_route'], stops_per_trip=scale['stops_per_trip'],
+                     stops=scale['stops'])
+    return recordings, zip_path, time.perf_counter() - start
+
+def sample_requests(server, feeds):
+    # Example requests for every /api route as (variant, url); results are named by route and
+    # variant, since urls carry ids and times that differ between fixtures. Routes left out
+    # here are reported as unbenchmarked.
+    agency = server.agencies.default
+    parser = agency.parser
+    dataset = parser.static_dataset
+    route_id = next(iter(dataset.route_stops), '')
+    stop_id = dataset.stop_data[0]['stop_id'] if dataset.stop_data else ''
+    buses = agency.bus_history.latest.buses
+    bus = buses[0] if buses else {'vehicle_id': '', 'latitude': 0, 'longitude': 0}
+    min_lat, min_lon, max_lat, max_lon = dataset.get_network_bounds() or (0, 0, 0, 0)
+    mid_lat, mid_lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+    bbox = f"{mid_lon - 0.02},{mid_lat - 0.02},{mid_lon + 0.02},{mid_lat + 0.02}"
+    z, x, y = next(server.tiles_covering((mid_lat, mid_lon, mid_lat, mid_lon), 14))
+    
+    return {
+        '/api/buses': [('all', '/api/buses'), ('route', f"/api/buses?route_id={route_id}"),
+                       ('since', f"/api/buses?since={max(agency.bus_history.version - 1, 0)}")],
+        '/api/history': [('vehicle', f"/api/history?vehicle_id={bus['vehicle_id']}&from={feeds[0][0] if feeds else 0}")],
+        '/api/history/snapshot': [('latest', f"/api/history/snapshot?t={int(parser.clock())}")],
+        '/api/stops': [('all', '/api/stops'), ('route', f"/api/stops?route_id={route_id}"),
+                       ('bbox', f"/api/stops?bbox={bbox}")],
+        '/api/stops/nearest': [('bus', f"/api/stops/nearest?lat={bus['latitude']}&lon={bus['longitude']}")],
+        '/api/stops/<stop_id>/arrivals': [('stop', f"/api/stops/{stop_id}/arrivals")],
+        '/api/stops/<stop_id>/routes': [('stop', f"/api/stops/{stop_id}/routes")],
+        '/api/shapes': [('all', '/api/shapes?zoom=12&format=polyline'), ('route', f"/api/shapes?route_id={route_id}"),
+                        ('bbox', f"/api/shapes?bbox={bbox}&zoom=14&format=polyline")],
+        '/api/tiles/<int:z>/<int:x>/<int:y>': [('z14', f"/api/tiles/{z}/{x}/{y}")],
+        '/api/routes': [('all', '/api/routes')],
+        '/api/routes/<route_id>/pattern': [('route', f"/api/routes/{route_id}/pattern")],
+        '/api/agencies': [('all', '/api/agencies')],
+        '/api/metrics': [('all', '/api/metrics')],
+        '/api/status': [('all', '/api/status')]
+    }
+
+def run(args, scale, recordings, zip_path, data_dir):
+    results = {}
+    
+    os.environ.update(REPLAY_DIR=str(recordings), REPLAY_STATIC_ZIP=str(zip_path), REPLAY_SPEED='0',
+                      REPLAY_DATA_DIR=str(data_dir), ARCHIVE_RETENTION_DAYS='1')
+    from metrics import static_load_seconds, realtime_stage_seconds
+    
+    # Importing server parses the static zip: the cold load, phase by phase
+    before = static_load_seconds.totals()
+    logging.disable(logging.INFO)
+    start = time.perf_counter()
+    import server
+    results['server.import'] = {'seconds': time.perf_counter() - start}
+    for phase, seconds in phase_seconds(static_load_seconds, before).items():
+        results[f"static.cold.{phase}"] = {'seconds': seconds}
+    
+    # Then the same feed again from the snapshot the cold load wrote
+    before = static_load_seconds.totals()
+    start = time.perf_counter()
+    server.agencies.default.parser.static_parser.build_dataset()
+    results['static.warm.total'] = {'seconds': time.perf_counter() - start}
+    for phase, seconds in phase_seconds(static_load_seconds, before).items():
+        results[f"static.warm.{phase}"] = {'seconds': seconds}
+    
+    parser = server.agencies.default.parser
+    vehicle_feeds = [path.read_bytes() for feed_timestamp, path in parser.vehicle_positions_feed.recordings]
+    latencies = []
+    for data in vehicle_feeds:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            parser.parse_vehicle_positions(data)
+            latencies.append(time.perf_counter() - start)
+    results['realtime.parse_vehicle_positions'] = summarize(latencies, bytes=len(vehicle_feeds[0]) if vehicle_feeds else 0)
+    
+    feeds = [(feed_timestamp, 'vehicle_positions', path) for feed_timestamp, path in parser.vehicle_positions_feed.recordings]
+    feeds += [(feed_timestamp, 'trip_updates', path) for feed_timestamp, path in parser.trip_updates_feed.recordings]
+    feeds.sort()
+    ingest = {'vehicle_positions': server.ingest_bus_data, 'trip_updates': server.ingest_trip_updates}
+    timings = {'vehicle_positions': [], 'trip_updates': []}
+    stages_before = realtime_stage_seconds.totals()
+    for feed_timestamp, kind, path in feeds:
+        start = time.perf_counter()
+        ingest[kind]()
+        timings[kind].append(time.perf_counter() - start)
+    for kind, latencies in timings.items():
+        if latencies:
+            results[f"realtime.ingest.{kind}"] = summarize(latencies)
+    stage_counts = {label_values[0]: count for label_values, (count, total) in realtime_stage_seconds.totals().items()}
+    for stage, seconds in phase_seconds(realtime_stage_seconds, stages_before).items():
+        results[f"realtime.stage.{stage}"] = {'seconds': seconds / max(stage_counts.get(stage, 1), 1)}
+    
+    client = server.app.test_client()
+    samples = sample_requests(server, feeds)
+    api_rules = sorted({rule.rule for rule in server.app.url_map.iter_rules() if rule.rule.startswith('/api/')})
+    unbenchmarked = [rule for rule in api_rules if rule not in samples]
+    for rule in api_rules:
+        for variant, url in samples.get(rule, []):
+            start = time.perf_counter()
+            response = client.get(url)
+            first = time.perf_counter() - start
+            latencies = []
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                response = client.get(url)
+                latencies.append(time.perf_counter() - start)
+            results[f"endpoint {rule} {variant}"] = summarize(latencies, url=url, first=first, status=response.status_code,
+                                                              bytes=len(response.get_data()))
+    return results, unbenchmarked
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('git_commit') or 'baseline'} ({baseline['meta'].get('created')})")
+    for name, result in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None or not previous.get('seconds'):
+            continue
+        ratio = result['seconds'] / previous['seconds']
+        regressed = ratio > 1 + tolerance and result['seconds'] - previous['seconds'] > MIN_REGRESSION_SECONDS
+        flag = '  REGRESSED' if regressed else ''
+        print(f"  {name[:60]:60s} {previous['seconds'] * 1000:10.3f} ms -> {result['seconds'] * 1000:10.3f} ms  "
+              f"{ratio:5.2f}x{flag}")
+        if regressed:
+            regressions.append(name)
+    missing = [name for name in baseline['results'] if name not in results]
+    if missing:
+        print(f"  not measured this run: {', '.join(missing)}")
+    return regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    for name in ('routes', 'trips-per-route', 'stops-per-trip', 'stops', 'vehicles'):
+        arg_parser.add_argument(f"--{name}", type=int, help="Overrides the scale's value")
+    arg_parser.add_argument('--polls', type=int, default=4)
+    arg_parser.add_argument('--cadence', type=int, default=30)
+    arg_parser.add_argument('--requests', type=int, default=50, help="Timed requests per endpoint URL")
+    arg_parser.add_argument('--repeat', type=int, default=5, help="Decodes of each VehiclePositions recording")
+    arg_parser.add_argument('--fixtures', type=Path, help="Directory to generate fixtures in, or reuse them from")
+    arg_parser.add_argument('--output', type=Path, help="Write the results here as JSON")
+    arg_parser.add_argument('--compare', type=Path, help="Results JSON of an earlier run to compare against")
+    arg_parser.add_argument('--tolerance', type=float, default=0.25, help="Slowdown allowed before flagging, as a fraction")
+    args = arg_parser.parse_args()
+    
+    scale = dict(SCALES[args.scale])
+    for name in scale:
+        if getattr(args, name) is not None:
+            scale[name] = getattr(args, name)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        recordings, zip_path, generate_time = prepare_fixtures(args.fixtures or tmp, scale, args.polls, args.cadence)
+        results, unbenchmarked = run(args, scale, recordings, zip_path, Path(tmp) / 'data')
+    
+    for name, result in results.items():
+        extra = f"  p90 {result['p90'] * 1000:9.3f} ms" if 'p90' in result else ''
+        print(f"  {name[:60]:60s} {result['seconds'] * 1000:10.3f} ms{extra}")
+    for rule in unbenchmarked:
+        print(f"  no sample request for {rule}")
+    
+    report = {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'scale': dict(scale, name=args.scale, polls=args.polls, cadence=args.cadence),
+            'fixture_seconds': generate_time,
+            'unbenchmarked': unbenchmarked
+        },
+        'results': results
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + '\n')
+        print(f"Wrote {args.output}")
+    
+    if args.compare:
+        regressions = compare(results, json.loads(args.compare.read_text()), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# hamilton-transit-map/backend/benchmarks/bench_trip_updates.py
+#
+# Ingest and query cost of the TripUpdates predictions index. Feeds a sequence of TripUpdates
+# polls through PredictionIndex and reports, per poll, what a full FeedMessage decode costs next
+# to the whole incremental ingest; then /api/stops/<stop_id>/arrivals lookups against a scan
+# over every predicted trip per request.
+# Without --static and --recordings a synthetic network and a day-time feed are generated at
+# HSR scale; with them, a GTFS directory and a directory of recorded TripUpdates .pb files
+# (sorted by name, header timestamps used as the clock) are replayed instead.
+#
+#   python3 backend/benchmarks/bench_trip_updates.py --polls 10
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from google.transit import gtfs_realtime_pb2
+from feed_fetcher import read_feed_timestamp
+from gtfs_static_parser import StaticDataset, directory_opener
+from synthetic_feed import write_static_feed, build_trip_updates
+from service_calendar import DEFAULT_TIMEZONE
+from trip_updates import PredictionIndex, service_day_start
+
+def scan_arrivals(index, stop_id, count, now):
+    # What an unindexed endpoint would do: walk every trip's predictions on each request
+    departures = []
+    for trip_id, (signature, route_id, predictions) in index.trips.items():
+        for departure, prediction_stop_id, stop_sequence, delay in predictions:
+            if prediction_stop_id == stop_id and departure >= now - 60:
+                departures.append((departure, trip_id, route_id, stop_sequence, delay))
+    departures.sort()
+    return departures[:count]
+
+def synthetic_polls(polls, cadence, clock=8 * 3600):
+    service_date = datetime.now(DEFAULT_TIMEZONE).date()
+    start = service_day_start(service_date) + clock
+    for poll in range(polls):
+        yield build_trip_updates(start + poll * cadence, service_date.strftime('%Y%m%d'),
+                                 clock + poll * cadence, poll=poll)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--static', type=Path)
+    arg_parser.add_argument('--recordings', type=Path)
+    arg_parser.add_argument('--polls', type=int, default=10)
+    arg_parser.add_argument('--cadence', type=int, default=30)
+    arg_parser.add_argument('--queries', type=int, default=2000)
+    arg_parser.add_argument('--count', type=int, default=5)
+    args = arg_parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.static or write_static_feed(tmp)
+        dataset = StaticDataset()
+        dataset.load(directory_opener(data_dir))
+        
+        if args.recordings:
+            polls = [path.read_bytes() for path in sorted(args.recordings.glob('*.pb'))]
+        else:
+            polls = list(synthetic_polls(args.polls, args.cadence))
+    
+    index = PredictionIndex()
+    ingests = []
+    for i, body in enumerate(polls):
+        start = time.perf_counter()
+        feed = gtfs_realtime_pb2.FeedMessage.FromString(body)
+        decoded = time.perf_counter()
+        now = read_feed_timestamp(body)
+        changed, removed = index.update(body, dataset, now=now)
+        done = time.perf_counter()
+        ingests.append(done - decoded)
+        updates = sum(len(entity.trip_update.stop_time_update) for entity in feed.entity)
+        print(f"  poll {i:2d}  {len(body) // 1024:5d} KB  {len(feed.entity):5d} trips  {updates:6d} stop updates  "
+              f"full decode {(decoded - start) * 1000:6.1f} ms  ingest {(done - decoded) * 1000:6.1f} ms  "
+              f"({changed} changed, {removed} removed)")
+    
+    if len(ingests) > 1:
+        incremental = sorted(ingests[1:])
+        print(f"first ingest {ingests[0] * 1000:.1f} ms, incremental median {incremental[len(incremental) // 2] * 1000:.1f} ms")
+    
+    rng = random.Random(3)
+    stop_ids = list(index.by_stop) or [stop['stop_id'] for stop in dataset.stop_data]
+    queries = [rng.choice(stop_ids) for _ in range(args.queries)]
+    print(f"{len(index.by_stop)} stops with predictions, {len(index.trips)} trips")
+    
+    for name, query in (('indexed', lambda stop_id: index.arrivals(stop_id, args.count, now)),
+                        ('scan', lambda stop_id: scan_arrivals(index, stop_id, args.count, now))):
+        latencies = []
+        for stop_id in queries[:args.queries if name == 'indexed' else min(args.queries, 200)]:
+            start = time.perf_counter()
+            query(stop_id)
+            latencies.append((time.perf_counter() - start) * 1e6)
+        print(f"  {name:8s} p50 {percentile(latencies, 0.5):9.1f} us  p99 {percentile(latencies, 0.99):9.1f} us")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# hamilton-transit-map/backend/benchmarks/bench_vehicle_archive.py
+#
+# Writes --days of polls for a synthetic fleet into a VehicleArchive, then reports append cost,
+# bytes on disk per day (and what --retention days of it would take), and the latency of
+# /api/history style vehicle queries and /api/history/snapshot lookups against a scan of the
+# day's records.
+#
+#   python3 backend/benchmarks/bench_vehicle_archive.py --days 3 --vehicles 250 --cadence 30
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gtfs_realtime_parser import GTFSRealtimeParser
+from synthetic_feed import build_vehicle_positions
+from vehicle_archive import VehicleArchive, RECORD, segment_day
+
+def scan_vehicle_history(segment, vehicle, start, end):
+    # Every record of the segment, filtered
+    return [i for i, record in enumerate(RECORD.iter_unpack(segment.mapped))
+            if record[2] == vehicle and start <= record[0] <= end]
+
+def day_bounds(day):
+    start = int(datetime.strptime(day, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp())
+    return start, start + 86400 - 1
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def time_queries(name, queries, run):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        run(*query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(f"  {name:26s} p50 {percentile(latencies, 0.5):8.2f} ms  p99 {percentile(latencies, 0.99):8.2f} ms")
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--days', type=int, default=3)
+    arg_parser.add_argument('--vehicles', type=int, default=250)
+    arg_parser.add_argument('--cadence', type=int, default=30)
+    arg_parser.add_argument('--retention', type=int, default=90)
+    arg_parser.add_argument('--queries', type=int, default=200)
+    args = arg_parser.parse_args()
+    
+    realtime = GTFSRealtimeParser(static_parser=SimpleNamespace(route_data={}))
+    # A handful of decoded polls, replayed round-robin; only the archive is being timed
+    fleets = [realtime.decode_vehicle_positions(build_vehicle_positions(1700000000, vehicles=args.vehicles, poll=poll))
+              for poll in range(8)]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = VehicleArchive(Path(tmp), retention_days=args.retention)
+        first = 1700006400 - 1700006400 % 86400
+        polls = args.days * 86400 // args.cadence
+        
+        start = time.perf_counter()
+        for poll in range(polls):
+            archive.append(first + poll * args.cadence, fleets[poll % len(fleets)])
+        append_time = time.perf_counter() - start
+        last = first + (polls - 1) * args.cadence
+        
+        day_bytes = sum(path.stat().st_size for path in Path(tmp).iterdir()) / args.days
+        print(f"{polls} polls of {args.vehicles} vehicles over {args.days} days")
+        print(f"  append           {append_time / polls * 1000:8.2f} ms/poll")
+        print(f"  on disk          {day_bytes / 1024 / 1024:8.1f} MB/day, {day_bytes * args.retention / 1024 ** 3:.2f} GB "
+              f"for {args.retention} days")
+        
+        rng = random.Random(4)
+        vehicle_ids = [str(v) for v in range(args.vehicles)]
+        hours = [(rng.choice(vehicle_ids), t, t + 3600) for t in (rng.randrange(first, last - 3600) for _ in range(args.queries))]
+        days = [(rng.choice(vehicle_ids), t, t + 86400 - 1) for t in (first + 86400 * rng.randrange(args.days) for _ in range(args.queries))]
+        snapshots = [(rng.randrange(first, last),) for _ in range(args.queries)]
+        
+        # The per-vehicle row index of a segment is built on its first query, once
+        start = time.perf_counter()
+        for day in archive.days():
+            archive.vehicle_history('0', *day_bounds(day))
+        print(f"  vehicle index    {(time.perf_counter() - start) / args.days * 1000:8.1f} ms/day, first query only")
+        
+        time_queries("vehicle, 1 hour", hours, archive.vehicle_history)
+        time_queries("vehicle, 1 day", days, archive.vehicle_history)
+        time_queries("snapshot", snapshots, archive.snapshot)
+        
+        def scan(vehicle_id, start, end):
+            segment = archive.segment(segment_day(start))
+            segment.refresh()
+            return scan_vehicle_history(segment, segment.vehicle_ids.lookup(vehicle_id), start, end)
+        
+        time_queries("scan, vehicle, 1 hour", hours[:20], scan)
+
+if __name__ == '__main__':
+    main()
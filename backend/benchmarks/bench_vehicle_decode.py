@@ -0,0 +1,102 @@
+# hamilton-transit-map/backend/benchmarks/bench_vehicle_decode.py
+#
+# Per-poll decode cost of VehiclePositions. Compares the original parser (FeedMessage decode,
+# HasField checks and a route_data lookup per vehicle, then json.dumps of the dicts) with
+# VehicleColumns (a direct walk of the encoded feed into columns, routes joined once, JSON
+# written from the columns). Runs over a directory of recorded .pb files (--recordings DIR),
+# or over synthetic recordings of --vehicles entities.
+#
+#   python3 backend/benchmarks/bench_vehicle_decode.py --vehicles 12000 --polls 5
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from google.transit import gtfs_realtime_pb2
+from gtfs_realtime_parser import GTFSRealtimeParser
+from synthetic_feed import write_vehicle_positions
+
+def legacy_parse_vehicle_positions(binary_data, route_data):
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(binary_data)
+    
+    results = []
+    for entity in feed.entity:
+        if entity.HasField('vehicle'):
+            vehicle = entity.vehicle
+            if not vehicle.HasField('position'):
+                continue
+            
+            route_id = vehicle.trip.route_id if vehicle.HasField('trip') else None
+            trip_id = vehicle.trip.trip_id if vehicle.HasField('trip') else None
+            
+            route_info = route_data.get(route_id, {})
+            bus_data = {
+                'vehicle_id': vehicle.vehicle.id if vehicle.HasField('vehicle') else f"unknown_{len(results)}",
+                'route_id': route_id,
+                'trip_id': trip_id,
+                'route_short_name': route_info.get('route_short_name', route_id if route_id else 'Unknown'),
+                'route_color': route_info.get('route_color', '#FF0000'),
+                'latitude': vehicle.position.latitude,
+                'longitude': vehicle.position.longitude,
+                'timestamp': vehicle.timestamp
+            }
+            if vehicle.position.HasField('bearing'):
+                bus_data['bearing'] = vehicle.position.bearing
+            if vehicle.position.HasField('speed'):
+                bus_data['speed'] = vehicle.position.speed
+            results.append(bus_data)
+    return results
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--recordings', type=Path)
+    arg_parser.add_argument('--vehicles', type=int, default=12000)
+    arg_parser.add_argument('--routes', type=int, default=60)
+    arg_parser.add_argument('--polls', type=int, default=5)
+    args = arg_parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.recordings:
+            recordings = sorted(args.recordings.glob('*.pb'))
+        else:
+            recordings = write_vehicle_positions(tmp, args.polls, routes=args.routes, vehicles=args.vehicles)
+        bodies = [path.read_bytes() for path in recordings]
+    
+    route_data = {str(r): {'route_short_name': str(r), 'route_color': '#00AA00'} for r in range(1, args.routes + 1)}
+    realtime = GTFSRealtimeParser(static_parser=SimpleNamespace(route_data=route_data))
+    
+    totals = {}
+    for body in bodies:
+        legacy, legacy_time = timed(legacy_parse_vehicle_positions, body, route_data)
+        legacy_json, legacy_json_time = timed(json.dumps, legacy)
+        columns, decode_time = timed(realtime.decode_vehicle_positions, body)
+        records, records_time = timed(columns.records)
+        columnar_json, json_time = timed(columns.to_json)
+        
+        assert records == legacy and json.loads(columnar_json) == legacy
+        for name, value in (('legacy parse', legacy_time), ('legacy json', legacy_json_time),
+                            ('columnar decode', decode_time), ('records', records_time), ('columnar json', json_time)):
+            totals[name] = totals.get(name, 0) + value
+    
+    polls = len(bodies)
+    print(f"{polls} feeds, {len(columns)} vehicles in the last ({len(bodies[-1]) // 1024} KB)")
+    for name, total in totals.items():
+        print(f"  {name:16s} {total / polls * 1000:8.1f} ms/poll")
+    legacy_total = totals['legacy parse'] + totals['legacy json']
+    columnar_total = totals['columnar decode'] + totals['records'] + totals['columnar json']
+    print(f"  decode + records + json: {legacy_total / polls * 1000:.1f} -> {columnar_total / polls * 1000:.1f} ms/poll "
+          f"({legacy_total / columnar_total:.1f}x)")
+
+if __name__ == '__main__':
+    main()
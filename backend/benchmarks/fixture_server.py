@@ -0,0 +1,128 @@
+# hamilton-transit-map/backend/benchmarks/fixture_server.py
+#
+# Local stand-in for opendata.hamilton.ca. Serves fixture files (GTFS static zips, recorded
+# .pb feeds) with ETag / Last-Modified validators and honours conditional requests, so the
+# fetch and refresh code paths can be exercised without network access.
+#
+#   python3 backend/benchmarks/fixture_server.py path/to/fixtures --port 8100
+import argparse
+import hashlib
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+class Fixture:
+    def __init__(self, body, modified=None):
+        self.body = body
+        self.modified = int(modified if modified is not None else time.time())
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+class FixtureRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.request_log.append((self.path, dict(self.headers)))
+        fixture = server.fixtures.get(self.path.split('?', 1)[0])
+        
+        if fixture is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        
+        if self.not_modified(fixture):
+            self.send_response(304)
+            self.send_header('ETag', fixture.etag)
+            self.end_headers()
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(fixture.body)))
+        self.send_header('ETag', fixture.etag)
+        self.send_header('Last-Modified', formatdate(fixture.modified, usegmt=True))
+        self.end_headers()
+        self.wfile.write(fixture.body)
+    
+    def not_modified(self, fixture):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return fixture.etag in [tag.strip() for tag in if_none_match.split(',')]
+        
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            try:
+                return fixture.modified <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+    
+    def log_message(self, format, *args):
+        pass
+
+class FixtureServer:
+    def __init__(self, host='127.0.0.1', port=0):
+        self.httpd = ThreadingHTTPServer((host, port), FixtureRequestHandler)
+        self.httpd.fixtures = {}
+        self.httpd.request_log = []
+        self.thread = None
+    
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    @property
+    def request_log(self):
+        return self.httpd.request_log
+    
+    def url(self, path):
+        return self.base_url + path
+    
+    def set_fixture(self, path, body, modified=None):
+        if isinstance(body, (str, Path)):
+            source = Path(body)
+            body = source.read_bytes()
+            modified = modified if modified is not None else source.stat().st_mtime
+        self.httpd.fixtures[path] = Fixture(body, modified)
+    
+    def remove_fixture(self, path):
+        self.httpd.fixtures.pop(path, None)
+    
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('directory', type=Path)
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8100)
+    args = arg_parser.parse_args()
+    
+    server = FixtureServer(args.host, args.port)
+    for path in sorted(args.directory.rglob('*')):
+        if path.is_file():
+            url_path = '/' + path.relative_to(args.directory).as_posix()
+            server.set_fixture(url_path, path)
+            print(f"Serving {server.url(url_path)}")
+    
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
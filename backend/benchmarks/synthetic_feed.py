@@ -0,0 +1,213 @@
+# hamilton-transit-map/backend/benchmarks/synthetic_feed.py
+import csv
+import random
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from pathlib import Path
+from google.transit import gtfs_realtime_pb2
+from service_calendar import service_date_at
+
+# Roughly the area covered by the HSR network
+MIN_LAT, MAX_LAT = 43.15, 43.32
+MIN_LON, MAX_LON = -80.05, -79.70
+# Days covered by each service period of a feed written with service_periods
+SERVICE_PERIOD_DAYS = 14
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+def random_walk(rng, count, step=0.0008):
+    lat = rng.uniform(MIN_LAT, MAX_LAT)
+    lon = rng.uniform(MIN_LON, MAX_LON)
+    for _ in range(count):
+        lat = min(max(lat + rng.uniform(-step, step), MIN_LAT), MAX_LAT)
+        lon = min(max(lon + rng.uniform(-step, step), MIN_LON), MAX_LON)
+        yield round(lat, 6), round(lon, 6)
+
+def route_path(rng, count, waypoints=12, noise=0.00002):
+    # Densely sampled straight runs between turns, like a shape traced from GPS
+    corners = list(random_walk(rng, waypoints, step=0.01))
+    per_leg = max(count // (waypoints - 1), 1)
+    emitted = 0
+    for (lat1, lon1), (lat2, lon2) in zip(corners, corners[1:]):
+        for i in range(per_leg):
+            if emitted == count:
+                return
+            t = i / per_leg
+            yield (round(lat1 + (lat2 - lat1) * t + rng.uniform(-noise, noise), 6),
+                   round(lon1 + (lon2 - lon1) * t + rng.uniform(-noise, noise), 6))
+            emitted += 1
+    while emitted < count:
+        yield corners[-1]
+        emitted += 1
+
+def trip_start_minutes(trip_id):
+    # Trips of a route leave every 3 minutes from 05:00, so the schedule covers the whole day
+    return 300 + int(trip_id.rsplit('_', 1)[1]) * 3
+
+def write_static_feed(data_dir, routes=60, shapes_per_route=4, points_per_shape=400,
+                      stops=2500, trips_per_route=300, stops_per_trip=40, service_periods=None, seed=1):
+    # With service_periods, trips are split between that many back-to-back periods in a
+    # calendar.txt, the first starting today, like a feed carrying its next few board periods;
+    # the trips of a shape all belong to one period when service_periods == shapes_per_route
+    rng = random.Random(seed)
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    
+    route_ids = [str(r + 1) for r in range(routes)]
+    write_csv(data_dir / 'routes.txt', ['route_id', 'route_short_name', 'route_color'],
+              ((route_id, route_id, format(rng.randrange(0xFFFFFF), '06X')) for route_id in route_ids))
+    
+    stop_points = list(random_walk(rng, stops, step=0.01))
+    write_csv(data_dir / 'stops.txt', ['stop_id', 'stop_name', 'stop_lat', 'stop_lon'],
+              ((str(1000 + i), f"Stop {i}", lat, lon) for i, (lat, lon) in enumerate(stop_points)))
+    
+    def shape_rows():
+        for route_id in route_ids:
+            for s in range(shapes_per_route):
+                shape_id = f"{route_id}_{s}"
+                for sequence, (lat, lon) in enumerate(route_path(rng, points_per_shape), 1):
+                    yield shape_id, lat, lon, sequence
+    
+    write_csv(data_dir / 'shapes.txt', ['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence'], shape_rows())
+    
+    trips = [(route_id, f"{route_id}_{t}", f"{route_id}_{t % shapes_per_route}")
+             for route_id in route_ids for t in range(trips_per_route)]
+    
+    def service_of(trip_id):
+        if not service_periods:
+            return 'WEEKDAY'
+        return f"S{int(trip_id.rsplit('_', 1)[1]) % service_periods}"
+    
+    write_csv(data_dir / 'trips.txt', ['route_id', 'service_id', 'trip_id', 'shape_id'],
+              ((route_id, service_of(trip_id), trip_id, shape_id) for route_id, trip_id, shape_id in trips))
+    
+    if service_periods:
+        today = service_date_at(time.time())
+        
+        def calendar_rows():
+            for period in range(service_periods):
+                start = today + timedelta(days=period * SERVICE_PERIOD_DAYS)
+                end = start + timedelta(days=SERVICE_PERIOD_DAYS - 1)
+                yield [f"S{period}"] + [1] * 7 + [start.strftime('%Y%m%d'), end.strftime('%Y%m%d')]
+        
+        write_csv(data_dir / 'calendar.txt', ['service_id', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday',
+                                              'saturday', 'sunday', 'start_date', 'end_date'], calendar_rows())
+    
+    # Every trip of a route/shape pair follows the same stop pattern, as in a real feed
+    patterns = {}
+    for route_id, trip_id, shape_id in trips:
+        if shape_id not in patterns:
+            start = rng.randrange(stops)
+            patterns[shape_id] = [str(1000 + (start + i) % stops) for i in range(stops_per_trip)]
+    
+    def stop_time_rows():
+        for route_id, trip_id, shape_id in trips:
+            for sequence, stop_id in enumerate(patterns[shape_id], 1):
+                minutes = trip_start_minutes(trip_id) + sequence * 2
+                time_text = f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+                yield trip_id, time_text, time_text, stop_id, sequence
+    
+    write_csv(data_dir / 'stop_times.txt', ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence'],
+              stop_time_rows())
+    
+    return data_dir
+
+def write_static_zip(zip_path, **feed_options):
+    with tempfile.TemporaryDirectory() as data_dir:
+        write_static_feed(data_dir, **feed_options)
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+            for path in sorted(Path(data_dir).iterdir()):
+                zip_ref.write(path, path.name)
+    return zip_path
+
+def build_vehicle_positions(timestamp, routes=60, vehicles=250, trips_per_route=300, poll=0, seed=1):
+    # Trip and route ids match write_static_feed with the same routes / trips_per_route
+    rng = random.Random(seed)
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = '2.0'
+    feed.header.timestamp = timestamp
+    
+    for v in range(vehicles):
+        route_id = str(rng.randrange(routes) + 1)
+        entity = feed.entity.add()
+        entity.id = str(v)
+        vehicle = entity.vehicle
+        vehicle.vehicle.id = str(v)
+        vehicle.trip.route_id = route_id
+        vehicle.trip.trip_id = f"{route_id}_{rng.randrange(trips_per_route)}"
+        heading = rng.uniform(0, 360)
+        vehicle.position.latitude = rng.uniform(MIN_LAT, MAX_LAT) + poll * 0.0003
+        vehicle.position.longitude = rng.uniform(MIN_LON, MAX_LON) + poll * 0.0003
+        vehicle.position.bearing = heading
+        vehicle.position.speed = rng.uniform(0, 15)
+        vehicle.timestamp = timestamp - rng.randrange(30)
+    
+    return feed.SerializeToString()
+
+def write_vehicle_positions(directory, polls, cadence=30, start=1700000000, **feed_options):
+    # A directory of recorded feeds, one file per publish, named so they sort in order
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for poll in range(polls):
+        timestamp = start + poll * cadence
+        path = directory / f"VehiclePositions_{timestamp}.pb"
+        path.write_bytes(build_vehicle_positions(timestamp, poll=poll, **feed_options))
+        paths.append(path)
+    return paths
+
+def build_trip_updates(timestamp, service_date, clock, routes=60, trips_per_route=300, stops_per_trip=40,
+                       poll=0, seed=1):
+    # Updates for every trip of write_static_feed that is running or about to leave at clock
+    # (seconds after midnight), one StopTimeUpdate per stop still ahead. Each poll a third of
+    # the trips report a new delay, as a real feed does between publishes.
+    rng = random.Random(seed)
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = '2.0'
+    feed.header.timestamp = timestamp
+    
+    for r in range(routes):
+        route_id = str(r + 1)
+        for t in range(trips_per_route):
+            trip_id = f"{route_id}_{t}"
+            start = trip_start_minutes(trip_id) * 60
+            base_delay = rng.randrange(-60, 300)
+            if not start - 1800 <= clock <= start + stops_per_trip * 120:
+                continue
+            
+            delay = base_delay + 30 * ((poll + t) // 3)
+            entity = feed.entity.add()
+            entity.id = trip_id
+            trip_update = entity.trip_update
+            trip_update.trip.trip_id = trip_id
+            trip_update.trip.route_id = route_id
+            trip_update.trip.start_date = service_date
+            trip_update.timestamp = timestamp
+            
+            current = max(1, (clock - start) // 120 + 1)
+            for sequence in range(current, stops_per_trip + 1):
+                update = trip_update.stop_time_update.add()
+                update.stop_sequence = sequence
+                update.arrival.delay = delay
+                update.departure.delay = delay
+    
+    return feed.SerializeToString()
+
+def write_trip_updates(directory, polls, start, service_date, clock, cadence=30, **feed_options):
+    # TripUpdates recordings to go with write_vehicle_positions; start is the Unix time of clock
+    # (seconds after midnight) on service_date, a YYYYMMDD string
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for poll in range(polls):
+        timestamp = start + poll * cadence
+        path = directory / f"TripUpdates_{timestamp}.pb"
+        path.write_bytes(build_trip_updates(timestamp, service_date, clock + poll * cadence, poll=poll, **feed_options))
+        paths.append(path)
+    return paths
@@ -0,0 +1,194 @@
+# hamilton-transit-map/backend/feed_fetcher.py
+import logging
+import random
+import statistics
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from google.transit import gtfs_realtime_pb2
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) seconds; the realtime feeds are a few hundred KB at most
+FEED_TIMEOUT = (5, 20)
+
+# Polls are scheduled this long after the feed is next expected to be published
+PUBLISH_LAG = 2.0
+MIN_INTERVAL = 5.0
+MAX_INTERVAL = 60.0
+# Until the publish cadence has been observed, poll often enough to measure it
+LEARNING_INTERVAL = 10.0
+MAX_BACKOFF = 300.0
+CADENCE_SAMPLES = 8
+
+def create_session(pool_size=4):
+    # One keep-alive connection pool shared by every feed on the same host
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+def iter_fields(data, pos=0, end=None):
+    # The top-level fields of an encoded message as (field, wire type, field start, value start,
+    # value end), without decoding any of the values
+    end = len(data) if end is None else end
+    while pos < end:
+        start = pos
+        key, pos = read_varint(data, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            _, value_end = read_varint(data, pos)
+        elif wire_type == 1:
+            value_end = pos + 8
+        elif wire_type == 5:
+            value_end = pos + 4
+        elif wire_type == 2:
+            length, pos = read_varint(data, pos)
+            value_end = pos + length
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type}")
+        yield field, wire_type, start, pos, value_end
+        pos = value_end
+
+def read_feed_timestamp(data):
+    # Decode only the FeedHeader (field 1 of FeedMessage), not the entities, so an unchanged
+    # feed costs a few bytes of parsing instead of the whole message
+    try:
+        for field, wire_type, start, value_start, value_end in iter_fields(data):
+            if field == 1 and wire_type == 2:
+                header = gtfs_realtime_pb2.FeedHeader.FromString(data[value_start:value_end])
+                return header.timestamp if header.HasField('timestamp') else None
+    except Exception as e:
+        logger.warning(f"Could not read the feed header: {e}")
+    return None
+
+class PollSchedule:
+    # Learns how often the feed publishes from the gaps between distinct header timestamps
+    # and schedules the next poll just after the next expected publish. Header timestamps are
+    # moved onto the local clock with the smallest (seen - published) offset observed, i.e.
+    # the poll that landed soonest after a publish. Overdue polls retry at a quarter of the
+    # cadence; errors back off exponentially.
+    def __init__(self, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, learning_interval=LEARNING_INTERVAL,
+                 publish_lag=PUBLISH_LAG):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.learning_interval = min(learning_interval, max_interval)
+        self.publish_lag = publish_lag
+        self.feed_timestamps = []
+        self.offsets = []
+        self.errors = 0
+        self.delay = self.learning_interval
+    
+    @property
+    def cadence(self):
+        gaps = [b - a for a, b in zip(self.feed_timestamps, self.feed_timestamps[1:]) if b > a]
+        return statistics.median(gaps) if gaps else None
+    
+    def clamp(self, delay):
+        return min(max(delay, self.min_interval), self.max_interval)
+    
+    def schedule(self, now):
+        cadence = self.cadence
+        if not cadence:
+            return self.learning_interval
+        
+        expected = self.feed_timestamps[-1] + min(self.offsets) + cadence
+        delay = expected + self.publish_lag - now
+        if delay <= 0:
+            delay = cadence / 4
+        return self.clamp(delay)
+    
+    def record_update(self, feed_timestamp, now=None):
+        now = time.time() if now is None else now
+        self.errors = 0
+        if feed_timestamp:
+            self.feed_timestamps = (self.feed_timestamps + [feed_timestamp])[-(CADENCE_SAMPLES + 1):]
+            self.offsets = (self.offsets + [now - feed_timestamp])[-(CADENCE_SAMPLES + 1):]
+        self.delay = self.schedule(now)
+    
+    def record_unchanged(self, now=None):
+        now = time.time() if now is None else now
+        self.errors = 0
+        self.delay = self.schedule(now)
+    
+    def record_error(self):
+        self.errors += 1
+        backoff = min(self.min_interval * 2 ** self.errors, MAX_BACKOFF)
+        self.delay = backoff * random.uniform(0.8, 1.2)
+    
+    def next_delay(self):
+        return self.delay
+
+class FeedFetcher:
+    # Conditional, keep-alive polling of one GTFS-RT feed. fetch() returns the body only when
+    # the feed has been republished; 304s and repeats of the last header timestamp return None.
+    def __init__(self, url, session=None, timeout=FEED_TIMEOUT, schedule=None):
+        self.url = url
+        self.session = session or create_session()
+        self.timeout = timeout
+        self.schedule = schedule or PollSchedule()
+        self.etag = None
+        self.last_modified = None
+        self.feed_timestamp = None
+        self.status = None
+    
+    def fetch(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        
+        try:
+            response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.error(f"Error fetching data from {self.url}: {e}")
+            return self.finish('error')
+        
+        if response.status_code == 304:
+            return self.finish('not_modified')
+        
+        if response.status_code != 200:
+            logger.warning(f"Failed to fetch data from {self.url}: {response.status_code}")
+            return self.finish('error')
+        
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        
+        feed_timestamp = read_feed_timestamp(response.content)
+        if feed_timestamp is not None and feed_timestamp == self.feed_timestamp:
+            return self.finish('unchanged')
+        
+        self.feed_timestamp = feed_timestamp
+        return self.finish('updated', feed_timestamp, response.content)
+    
+    def reset(self):
+        # Forgets the last version seen, so the next fetch returns the feed even if unchanged
+        self.etag = None
+        self.last_modified = None
+        self.feed_timestamp = None
+    
+    def finish(self, status, feed_timestamp=None, content=None):
+        self.status = status
+        if status == 'updated':
+            self.schedule.record_update(feed_timestamp)
+        elif status == 'error':
+            self.schedule.record_error()
+        else:
+            self.schedule.record_unchanged()
+        return content
+    
+    def next_delay(self):
+        return self.schedule.next_delay()
@@ -0,0 +1,488 @@
+# hamilton-transit-map/backend/gtfs_columnar.py
+import csv
+import sys
+import logging
+from array import array
+from collections.abc import Mapping
+from operator import itemgetter
+
+logger = logging.getLogger(__name__)
+
+def open_gtfs_file(path):
+    # GTFS exports frequently start with a UTF-8 byte order mark
+    return open(path, 'r', newline='', encoding='utf-8-sig')
+
+def iter_columns(lines, required, optional=()):
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    
+    header = [name.strip().lstrip('\ufeff') for name in header]
+    missing = [name for name in required if name not in header]
+    if missing:
+        raise KeyError(f"Missing required columns: {missing}")
+    
+    # Absent optional columns point one past the end of the row, which is padded with ''
+    pad_index = len(header)
+    positions = [header.index(name) for name in required]
+    positions += [header.index(name) if name in header else pad_index for name in optional]
+    needs_padding = pad_index in positions
+    getter = itemgetter(*positions)
+    
+    for row in reader:
+        if not row:
+            continue
+        if needs_padding:
+            row.append('')
+        try:
+            yield getter(row)
+        except IndexError:
+            logger.warning(f"Skipping short row on line {reader.line_num}: {row}")
+
+def parse_gtfs_time(text):
+    # Seconds after midnight of the service day; may run past 24:00:00 for late trips.
+    # Non-timepoint stops leave the time blank, which is stored as -1.
+    if not text:
+        return -1
+    hours, minutes, seconds = text.strip().split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+def zeroed_array(typecode, length):
+    return array(typecode, bytes(array(typecode).itemsize * length))
+
+def grouped_offsets(groups, group_count):
+    offsets = zeroed_array('I', group_count + 1)
+    for group in groups:
+        offsets[group + 1] += 1
+    
+    for i in range(group_count):
+        offsets[i + 1] += offsets[i]
+    return offsets
+
+def grouped_order(groups, keys, offsets):
+    # Counting sort by group, then a stable sort on the key within each (small) group
+    cursor = array('I', offsets[:-1])
+    order = zeroed_array('I', len(groups))
+    for row, group in enumerate(groups):
+        order[cursor[group]] = row
+        cursor[group] += 1
+    
+    for i in range(len(offsets) - 1):
+        start, end = offsets[i], offsets[i + 1]
+        if end - start > 1:
+            order[start:end] = array('I', sorted(order[start:end], key=keys.__getitem__))
+    return order
+
+def permute(column, order):
+    return array(column.typecode, map(column.__getitem__, order))
+
+class StringInterner:
+    def __init__(self):
+        self.index = {}
+        self.values = []
+    
+    @classmethod
+    def from_values(cls, values):
+        interner = cls()
+        interner.values = [sys.intern(value) for value in values]
+        interner.index = {value: idx for idx, value in enumerate(interner.values)}
+        return interner
+    
+    def intern(self, value):
+        idx = self.index.get(value)
+        if idx is None:
+            idx = len(self.values)
+            value = sys.intern(value)
+            self.index[value] = idx
+            self.values.append(value)
+        return idx
+    
+    def lookup(self, value):
+        return self.index.get(value)
+    
+    def __getitem__(self, idx):
+        return self.values[idx]
+    
+    def __len__(self):
+        return len(self.values)
+    
+    def __contains__(self, value):
+        return value in self.index
+
+class GroupedColumns:
+    # Rows are appended as they stream in and grouped by an interned key on finalize().
+    # Feeds are almost always already grouped and ordered, in which case no sort is needed.
+    column_names = ()
+    
+    def __init__(self, key_ids):
+        self.key_ids = key_ids
+        self.groups = array('I')
+        self.sequence = array('I')
+        self.offsets = array('I', [0])
+        self.in_order = True
+        self._last_group = -1
+        self._last_sequence = -1
+    
+    def append_key(self, key, sequence):
+        group = self.key_ids.intern(key)
+        if group < self._last_group or (group == self._last_group and sequence < self._last_sequence):
+            self.in_order = False
+        self._last_group = group
+        self._last_sequence = sequence
+        self.groups.append(group)
+        self.sequence.append(sequence)
+    
+    def export_columns(self):
+        names = ('sequence', 'offsets') + self.column_names
+        return {name: getattr(self, name) for name in names}
+    
+    def import_columns(self, columns):
+        for name, column in columns.items():
+            setattr(self, name, column)
+    
+    def finalize(self):
+        self.offsets = grouped_offsets(self.groups, len(self.key_ids))
+        
+        if not self.in_order:
+            order = grouped_order(self.groups, self.sequence, self.offsets)
+            for name in ('sequence',) + self.column_names:
+                setattr(self, name, permute(getattr(self, name), order))
+            self.in_order = True
+        
+        # Group membership is fully described by the offsets once rows are ordered
+        self.groups = array('I')
+    
+    def row_range(self, group):
+        if group is None or group + 1 >= len(self.offsets):
+            return 0, 0
+        return self.offsets[group], self.offsets[group + 1]
+    
+    def __len__(self):
+        return sum(1 for i in range(len(self.offsets) - 1) if self.offsets[i + 1] > self.offsets[i])
+    
+    def __iter__(self):
+        for i in range(len(self.offsets) - 1):
+            if self.offsets[i + 1] > self.offsets[i]:
+                yield self.key_ids[i]
+
+class ShapeTable(GroupedColumns, Mapping):
+    column_names = ('lat', 'lon')
+    
+    def __init__(self, shape_ids=None):
+        super().__init__(shape_ids if shape_ids is not None else StringInterner())
+        self.lat = array('d')
+        self.lon = array('d')
+    
+    def append(self, shape_id, lat, lon, sequence):
+        self.append_key(shape_id, sequence)
+        self.lat.append(lat)
+        self.lon.append(lon)
+    
+    def coords(self, shape_id):
+        start, end = self.row_range(self.key_ids.lookup(shape_id))
+        return self.lat[start:end], self.lon[start:end]
+    
+    def __getitem__(self, shape_id):
+        start, end = self.row_range(self.key_ids.lookup(shape_id))
+        if start == end:
+            raise KeyError(shape_id)
+        return [list(point) for point in zip(self.lat[start:end].tolist(), self.lon[start:end].tolist())]
+    
+    def __contains__(self, shape_id):
+        start, end = self.row_range(self.key_ids.lookup(shape_id))
+        return end > start
+
+class StopTimesTable(GroupedColumns, Mapping):
+    # Trips of a route mostly run the same few stop patterns, so once the rows are grouped the
+    # (stop, stop_sequence) runs are deduplicated into shared patterns: a trip keeps only its
+    # pattern number and its departures, which stay per row as the one column trips differ in
+    column_names = ('stops', 'departures')
+    
+    def __init__(self, trip_ids, stop_ids):
+        super().__init__(trip_ids)
+        self.stop_ids = stop_ids
+        self.stops = array('I')
+        self.departures = array('i')
+        self.trip_patterns = array('i')
+        self.pattern_offsets = array('I', [0])
+        self.pattern_stops = array('I')
+        self.pattern_sequence = array('I')
+    
+    def append(self, trip_id, stop_id, sequence, departure=-1):
+        self.append_key(trip_id, sequence)
+        self.stops.append(self.stop_ids.intern(stop_id))
+        self.departures.append(departure)
+    
+    def export_columns(self):
+        names = ('offsets', 'departures', 'trip_patterns', 'pattern_offsets', 'pattern_stops', 'pattern_sequence')
+        return {name: getattr(self, name) for name in names}
+    
+    def finalize(self):
+        super().finalize()
+        
+        patterns = {}
+        self.trip_patterns = array('i', [-1]) * (len(self.offsets) - 1)
+        self.pattern_offsets = array('I', [0])
+        self.pattern_stops = array('I')
+        self.pattern_sequence = array('I')
+        for trip_idx in range(len(self.offsets) - 1):
+            start, end = self.offsets[trip_idx], self.offsets[trip_idx + 1]
+            if start == end:
+                continue
+            stops = self.stops[start:end]
+            sequence = self.sequence[start:end]
+            key = stops.tobytes() + sequence.tobytes()
+            pattern = patterns.get(key)
+            if pattern is None:
+                pattern = len(patterns)
+                patterns[key] = pattern
+                self.pattern_stops.extend(stops)
+                self.pattern_sequence.extend(sequence)
+                self.pattern_offsets.append(len(self.pattern_stops))
+            self.trip_patterns[trip_idx] = pattern
+        
+        self.stops = array('I')
+        self.sequence = array('I')
+    
+    @property
+    def pattern_count(self):
+        return len(self.pattern_offsets) - 1
+    
+    def pattern_of(self, trip_idx):
+        if trip_idx is None or trip_idx >= len(self.trip_patterns):
+            return -1
+        return self.trip_patterns[trip_idx]
+    
+    def pattern_range(self, pattern):
+        if pattern < 0:
+            return 0, 0
+        return self.pattern_offsets[pattern], self.pattern_offsets[pattern + 1]
+    
+    def pattern_stop_indices(self, pattern):
+        start, end = self.pattern_range(pattern)
+        return self.pattern_stops[start:end]
+    
+    def stop_indices(self, trip_idx):
+        return self.pattern_stop_indices(self.pattern_of(trip_idx))
+    
+    def schedule(self, trip_idx):
+        # (stop_idx, stop_sequence, scheduled departure seconds or -1) in trip order
+        start, end = self.pattern_range(self.pattern_of(trip_idx))
+        row_start, row_end = self.row_range(trip_idx)
+        return list(zip(self.pattern_stops[start:end], self.pattern_sequence[start:end],
+                        self.departures[row_start:row_end]))
+    
+    def __getitem__(self, trip_id):
+        start, end = self.pattern_range(self.pattern_of(self.key_ids.lookup(trip_id)))
+        if start == end:
+            raise KeyError(trip_id)
+        stop_ids = self.stop_ids.values
+        return [(stop_ids[stop], sequence)
+                for stop, sequence in zip(self.pattern_stops[start:end], self.pattern_sequence[start:end])]
+    
+    def __contains__(self, trip_id):
+        start, end = self.row_range(self.key_ids.lookup(trip_id))
+        return end > start
+
+class TripTable(Mapping):
+    column_names = ('routes', 'shapes', 'services')
+    
+    def __init__(self, trip_ids):
+        self.trip_ids = trip_ids
+        self.route_ids = StringInterner()
+        self.shape_ids = StringInterner()
+        self.service_ids = StringInterner()
+        self.routes = array('i')
+        self.shapes = array('i')
+        self.services = array('i')
+        self.count = 0
+    
+    def append(self, trip_id, route_id, shape_id, service_id=None):
+        trip_idx = self.trip_ids.intern(trip_id)
+        while len(self.routes) <= trip_idx:
+            self.routes.append(-1)
+            self.shapes.append(-1)
+            self.services.append(-1)
+        
+        if self.routes[trip_idx] < 0:
+            self.count += 1
+        self.routes[trip_idx] = self.route_ids.intern(route_id)
+        self.shapes[trip_idx] = self.shape_ids.intern(shape_id) if shape_id else -1
+        self.services[trip_idx] = self.service_ids.intern(service_id) if service_id else -1
+    
+    def export_columns(self):
+        return {name: getattr(self, name) for name in self.column_names}
+    
+    def import_columns(self, columns):
+        for name, column in columns.items():
+            setattr(self, name, column)
+        self.count = sum(1 for route in self.routes if route >= 0)
+    
+    def route_of(self, trip_idx):
+        if trip_idx < len(self.routes) and self.routes[trip_idx] >= 0:
+            return self.route_ids[self.routes[trip_idx]]
+        return None
+    
+    def shape_of(self, trip_idx):
+        if trip_idx < len(self.shapes) and self.shapes[trip_idx] >= 0:
+            return self.shape_ids[self.shapes[trip_idx]]
+        return None
+    
+    def iter_trips(self):
+        route_ids = self.route_ids.values
+        shape_ids = self.shape_ids.values
+        for trip_idx, (route, shape) in enumerate(zip(self.routes, self.shapes)):
+            if route >= 0:
+                yield trip_idx, route_ids[route], shape_ids[shape] if shape >= 0 else None
+    
+    def route_shape_ids(self, shapes_data, trip_mask=None):
+        # route_id -> the shapes its trips follow, of the trips set in trip_mask if one is given
+        route_shapes = {}
+        for trip_idx, route_id, shape_id in self.iter_trips():
+            if trip_mask is not None and not trip_mask[trip_idx]:
+                continue
+            if shape_id and shape_id in shapes_data:
+                if route_id not in route_shapes:
+                    route_shapes[route_id] = set()
+                route_shapes[route_id].add(shape_id)
+        return {route_id: list(shapes) for route_id, shapes in route_shapes.items()}
+    
+    def __getitem__(self, trip_id):
+        trip_idx = self.trip_ids.lookup(trip_id)
+        route_id = self.route_of(trip_idx) if trip_idx is not None else None
+        if route_id is None:
+            raise KeyError(trip_id)
+        return {
+            'route_id': route_id,
+            'shape_id': self.shape_of(trip_idx)
+        }
+    
+    def __contains__(self, trip_id):
+        trip_idx = self.trip_ids.lookup(trip_id)
+        return trip_idx is not None and self.route_of(trip_idx) is not None
+    
+    def __len__(self):
+        return self.count
+    
+    def __iter__(self):
+        for trip_idx, route in enumerate(self.routes):
+            if route >= 0:
+                yield self.trip_ids[trip_idx]
+
+class RouteStopIndex(Mapping):
+    # route -> stops and stop -> routes as two CSR arrays over the interned ids of a TripTable's
+    # routes and the dataset's stops, built once from the distinct stop patterns rather than
+    # from every trip. As a mapping, route_id -> the set of stops the route serves, as stop
+    # records in stops.txt order rather than visiting order. The visiting order is in
+    # patterns(): each route lists its distinct ordered stop patterns, most trips first, with
+    # the number of trips running each.
+    column_names = ('route_offsets', 'route_stop_indices', 'stop_offsets', 'stop_routes',
+                    'route_pattern_offsets', 'route_patterns', 'route_pattern_trips')
+    
+    def __init__(self, route_ids, stop_ids, stop_data, stop_times_data):
+        self.route_ids = route_ids
+        self.stop_ids = stop_ids
+        self.stop_data = stop_data
+        self.stop_times_data = stop_times_data
+        self.route_offsets = array('I', [0])
+        self.route_stop_indices = array('I')
+        self.stop_offsets = array('I', [0])
+        self.stop_routes = array('I')
+        self.route_pattern_offsets = array('I', [0])
+        self.route_patterns = array('I')
+        self.route_pattern_trips = array('I')
+    
+    def build(self, trips_data, trip_mask=None):
+        # With a trip_mask, only the trips set in it count
+        stop_times_data = self.stop_times_data
+        stop_count = len(self.stop_data)
+        route_patterns = [{} for _ in range(len(self.route_ids))]
+        for trip_idx, route in enumerate(trips_data.routes):
+            if trip_mask is not None and not trip_mask[trip_idx]:
+                continue
+            pattern = stop_times_data.pattern_of(trip_idx)
+            if route >= 0 and pattern >= 0:
+                route_patterns[route][pattern] = route_patterns[route].get(pattern, 0) + 1
+        
+        self.route_offsets = array('I', [0])
+        self.route_stop_indices = array('I')
+        self.route_pattern_offsets = array('I', [0])
+        self.route_patterns = array('I')
+        self.route_pattern_trips = array('I')
+        for patterns in route_patterns:
+            stops = set()
+            # Patterns that differ only in their stop_sequence numbering visit the same stops
+            by_stops = {}
+            for pattern in sorted(patterns):
+                stop_indices = stop_times_data.pattern_stop_indices(pattern)
+                stops.update(stop_indices)
+                key = stop_indices.tobytes()
+                if key in by_stops:
+                    by_stops[key][1] += patterns[pattern]
+                else:
+                    by_stops[key] = [pattern, patterns[pattern]]
+            self.route_stop_indices.extend(sorted(stop for stop in stops if stop < stop_count))
+            self.route_offsets.append(len(self.route_stop_indices))
+            
+            for pattern, trips in sorted(by_stops.values(), key=lambda item: (-item[1], item[0])):
+                self.route_patterns.append(pattern)
+                self.route_pattern_trips.append(trips)
+            self.route_pattern_offsets.append(len(self.route_patterns))
+        
+        # Filling stops route by route leaves each stop's routes in route order
+        self.stop_offsets = grouped_offsets(self.route_stop_indices, stop_count)
+        self.stop_routes = zeroed_array('I', len(self.route_stop_indices))
+        cursor = array('I', self.stop_offsets[:-1])
+        for route in range(len(self.route_offsets) - 1):
+            for stop in self.route_stop_indices[self.route_offsets[route]:self.route_offsets[route + 1]]:
+                self.stop_routes[cursor[stop]] = route
+                cursor[stop] += 1
+    
+    def export_columns(self):
+        return {name: getattr(self, name) for name in self.column_names}
+    
+    def import_columns(self, columns):
+        for name, column in columns.items():
+            setattr(self, name, column)
+    
+    def stop_indices(self, route_id):
+        route = self.route_ids.lookup(route_id)
+        if route is None or route + 1 >= len(self.route_offsets):
+            return array('I')
+        return self.route_stop_indices[self.route_offsets[route]:self.route_offsets[route + 1]]
+    
+    def route_indices(self, stop_idx):
+        if stop_idx is None or stop_idx + 1 >= len(self.stop_offsets):
+            return array('I')
+        return self.stop_routes[self.stop_offsets[stop_idx]:self.stop_offsets[stop_idx + 1]]
+    
+    def routes_of_stop(self, stop_id):
+        route_ids = self.route_ids.values
+        return [route_ids[route] for route in self.route_indices(self.stop_ids.lookup(stop_id))]
+    
+    def patterns(self, route_id):
+        # [(stop indices in visiting order, trips), ...] for a route, most trips first
+        route = self.route_ids.lookup(route_id)
+        if route is None or route + 1 >= len(self.route_pattern_offsets):
+            return []
+        start, end = self.route_pattern_offsets[route], self.route_pattern_offsets[route + 1]
+        return [(self.stop_times_data.pattern_stop_indices(pattern), trips)
+                for pattern, trips in zip(self.route_patterns[start:end], self.route_pattern_trips[start:end])]
+    
+    def __getitem__(self, route_id):
+        stop_indices = self.stop_indices(route_id)
+        if not stop_indices:
+            raise KeyError(route_id)
+        return [self.stop_data[i] for i in stop_indices]
+    
+    def __contains__(self, route_id):
+        return len(self.stop_indices(route_id)) > 0
+    
+    def __len__(self):
+        return sum(1 for i in range(len(self.route_offsets) - 1) if self.route_offsets[i + 1] > self.route_offsets[i])
+    
+    def __iter__(self):
+        for i in range(len(self.route_offsets) - 1):
+            if self.route_offsets[i + 1] > self.route_offsets[i]:
+                yield self.route_ids[i]
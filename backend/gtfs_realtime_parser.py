@@ -1,91 +1,125 @@
 # hamilton-transit-map/backend/gtfs_realtime_parser.py
-import requests
-import traceback
 import logging
-from google.transit import gtfs_realtime_pb2
+import time
 from gtfs_static_parser import GTFSStaticParser
+from feed_fetcher import FeedFetcher, create_session
+from gtfs_columnar import StringInterner
+from vehicle_columns import VehicleColumns
+from map_matching import snap_to_shapes
+from metrics import feed_fetch_seconds, feed_bytes, realtime_stage_seconds
 
 logger = logging.getLogger(__name__)
 
+HAMILTON_VEHICLE_POSITIONS_URL = "https://opendata.hamilton.ca/GTFS-RT/GTFS_VehiclePositions.pb"
+HAMILTON_TRIP_UPDATES_URL = "https://opendata.hamilton.ca/GTFS-RT/GTFS_TripUpdates.pb"
+
+class BusRouteIndex:
+    # Buckets one vehicle snapshot by route short name when it is ingested, so filtering by
+    # route is a single lookup. Vehicles on routes missing from routes.txt are kept by route_id.
+    def __init__(self, buses, route_data):
+        self.by_short_name = {}
+        self.by_route_id = {}
+        
+        for bus in buses:
+            route_id = bus.get('route_id')
+            route_info = route_data.get(route_id)
+            route_short_name = route_info.get('route_short_name') if route_info else None
+            
+            if route_short_name:
+                if route_short_name not in self.by_short_name:
+                    self.by_short_name[route_short_name] = []
+                self.by_short_name[route_short_name].append(bus)
+            else:
+                if route_id not in self.by_route_id:
+                    self.by_route_id[route_id] = []
+                self.by_route_id[route_id].append(bus)
+    
+    def get_buses(self, route_id, route_short_name):
+        if route_short_name:
+            return self.by_short_name.get(route_short_name, [])
+        return self.by_route_id.get(route_id, [])
+    
+    def has_route_id(self, route_id):
+        return route_id in self.by_route_id
+
 class GTFSRealtimeParser:
-    def __init__(self):
-        self.vehicle_positions_url = "https://opendata.hamilton.ca/GTFS-RT/GTFS_VehiclePositions.pb"
-        self.trip_updates_url = "https://opendata.hamilton.ca/GTFS-RT/GTFS_TripUpdates.pb"
-        self.static_parser = GTFSStaticParser()
+    def __init__(self, vehicle_positions_url=None, trip_updates_url=None, static_parser=None,
+                 vehicle_positions_feed=None, trip_updates_feed=None, clock=None, agency_id=None):
+        # A feed without a URL is not polled
+        self.vehicle_positions_url = vehicle_positions_url
+        self.trip_updates_url = trip_updates_url
+        self.static_parser = static_parser or GTFSStaticParser()
+        # Labels this parser's feed metrics when several agencies are polled
+        self.agency_id = agency_id or ''
+        self.session = create_session()
+        # Replay passes recorded feeds and its own clock here; see replay.py
+        self.vehicle_positions_feed = vehicle_positions_feed or FeedFetcher(self.vehicle_positions_url, self.session)
+        self.trip_updates_feed = trip_updates_feed or FeedFetcher(self.trip_updates_url, self.session)
+        self.clock = clock or time.time
+        if clock:
+            # So the static feed serves the services running at the replayed time
+            self.static_parser.clock = clock
+        # Shared by every decoded snapshot, so a vehicle or route keeps its index between polls
+        self.vehicle_ids = StringInterner()
+        self.route_ids = StringInterner()
+        self.trip_ids = StringInterner()
     
-    def fetch_protobuf_data(self, url):
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                return response.content
-            else:
-                logger.warning(f"Failed to fetch data from {url}: {response.status_code}")
-                return None
-        except Exception as e:
-            logger.error(f"Error fetching data from {url}: {e}")
-            traceback.print_exc()
-            return None
+    def decode_vehicle_positions(self, binary_data):
+        columns = VehicleColumns(self.vehicle_ids, self.route_ids, self.trip_ids).decode(binary_data)
+        return columns.join_routes(self.static_parser.route_data)
     
     def parse_vehicle_positions(self, binary_data):
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(binary_data)
-        
-        results = []
-        
-        for entity in feed.entity:
-            if entity.HasField('vehicle'):
-                vehicle = entity.vehicle
-                
-                if not vehicle.HasField('position'):
-                    continue
-                
-                route_id = vehicle.trip.route_id if vehicle.HasField('trip') else None
-                trip_id = vehicle.trip.trip_id if vehicle.HasField('trip') else None
-                
-                route_info = self.static_parser.route_data.get(route_id, {})
-                route_short_name = route_info.get('route_short_name', route_id if route_id else 'Unknown')
-                route_color = route_info.get('route_color', '#FF0000')
-                
-                bus_data = {
-                    'vehicle_id': vehicle.vehicle.id if vehicle.HasField('vehicle') else f"unknown_{len(results)}",
-                    'route_id': route_id,
-                    'trip_id': trip_id,
-                    'route_short_name': route_short_name,
-                    'route_color': route_color,
-                    'latitude': vehicle.position.latitude,
-                    'longitude': vehicle.position.longitude,
-                    'timestamp': vehicle.timestamp
-                }
-                
-                if vehicle.position.HasField('bearing'):
-                    bus_data['bearing'] = vehicle.position.bearing
-                
-                if vehicle.position.HasField('speed'):
-                    bus_data['speed'] = vehicle.position.speed
-                
-                results.append(bus_data)
-        
-        return results
+        return self.decode_vehicle_positions(binary_data).records()
+    
+    def poll_feed(self, feed, name):
+        start = time.perf_counter()
+        binary_data = feed.fetch()
+        feed_fetch_seconds.observe(time.perf_counter() - start, self.agency_id, name, feed.status or 'unknown')
+        if binary_data is not None:
+            feed_bytes.observe(len(binary_data), self.agency_id, name)
+        return binary_data
+    
+    def poll_vehicle_positions(self):
+        # None when the feed has not been republished since the last poll, or could not be fetched
+        binary_data = self.poll_feed(self.vehicle_positions_feed, 'vehicle_positions')
+        if binary_data is None:
+            return None
+        with realtime_stage_seconds.time('decode'):
+            columns = self.decode_vehicle_positions(binary_data)
+        with realtime_stage_seconds.time('snap'):
+            snap_to_shapes(columns, self.static_dataset)
+        return columns
+    
+    def poll_trip_updates(self):
+        # Left encoded: PredictionIndex.update only decodes the trips that changed
+        return self.poll_feed(self.trip_updates_feed, 'trip_updates')
+    
+    def index_buses_by_route(self, buses):
+        return BusRouteIndex(buses, self.static_parser.route_data)
     
-    def get_vehicle_positions(self):
-        binary_data = self.fetch_protobuf_data(self.vehicle_positions_url)
-        if binary_data:
-            return self.parse_vehicle_positions(binary_data)
-        return []
-
     # Pass-through methods to access the static data
+    def refresh_static_data(self):
+        return self.static_parser.refresh_static_data()
+    
     def get_stop_positions(self):
         return self.static_parser.get_stop_positions()
     
     def get_route_stops(self, route_id=None):
         return self.static_parser.get_route_stops(route_id)
     
-    def get_shapes(self):
-        return self.static_parser.get_shapes()
+    def get_shapes(self, level=None, shape_format='raw'):
+        return self.static_parser.get_shapes(level, shape_format)
+    
+    def get_route_shapes(self, route_id=None, level=None, shape_format='raw'):
+        return self.static_parser.get_route_shapes(route_id, level, shape_format)
     
-    def get_route_shapes(self, route_id=None):
-        return self.static_parser.get_route_shapes(route_id)
+    def get_route_short_name(self, route_id):
+        return self.static_dataset.get_route_short_name(route_id)
     
     @property
     def route_data(self):
         return self.static_parser.route_data
+
+    @property
+    def static_dataset(self):
+        return self.static_parser.dataset
@@ -0,0 +1,222 @@
+# hamilton-transit-map/backend/gtfs_snapshot.py
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import sys
+import traceback
+from zoneinfo import ZoneInfo
+from gtfs_columnar import StringInterner, ShapeTable, StopTimesTable, TripTable, RouteStopIndex
+from service_calendar import ServiceCalendar
+from shape_encoding import SimplifiedShapes
+from spatial_index import StopIndex, ShapeIndex
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the layout of the columnar tables or the pickled objects changes
+SNAPSHOT_VERSION = 10
+SNAPSHOT_MAGIC = b'HTMSNAP\0'
+PREAMBLE = struct.Struct('<8sIQ')
+ALIGNMENT = 8
+
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def source_fingerprint(paths, with_digest=True):
+    fingerprint = {}
+    for path in paths:
+        if not path.exists():
+            fingerprint[path.name] = None
+            continue
+        stat = path.stat()
+        fingerprint[path.name] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha1': file_digest(path) if with_digest else None
+        }
+    return fingerprint
+
+def fingerprint_matches(stored, paths):
+    # size + mtime is the fast path; the digest is only computed when the mtime moved
+    # (e.g. the same zip was extracted again), so warm restarts never read the CSVs
+    current = source_fingerprint(paths, with_digest=False)
+    if set(current) != set(stored):
+        return False
+    
+    for path in paths:
+        now, then = current[path.name], stored[path.name]
+        if now is None or then is None:
+            if now is not then:
+                return False
+            continue
+        if now['size'] != then['size']:
+            return False
+        if now['mtime_ns'] != then['mtime_ns'] and file_digest(path) != then['sha1']:
+            return False
+    return True
+
+def write_snapshot(snapshot_path, sources, columns, objects):
+    header = {
+        'version': SNAPSHOT_VERSION,
+        'byteorder': sys.byteorder,
+        'sources': sources,
+        'sections': {}
+    }
+    
+    payload = pickle.dumps(objects, protocol=pickle.HIGHEST_PROTOCOL)
+    offset = 0
+    for name, column in columns.items():
+        length = len(column) * column.itemsize
+        header['sections'][name] = [offset, length, column.typecode]
+        offset += length + (-length % ALIGNMENT)
+    header['sections']['objects'] = [offset, len(payload), None]
+    
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (-(PREAMBLE.size + len(header_bytes)) % ALIGNMENT)
+    
+    # Write next to the target and rename, so concurrent readers only ever map a complete file;
+    # the temporary name is per process so two writers never share one
+    tmp_path = snapshot_path.with_name(f"{snapshot_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for column in columns.values():
+            data = column.tobytes()
+            f.write(data)
+            f.write(b'\0' * (-len(data) % ALIGNMENT))
+        f.write(payload)
+    os.replace(tmp_path, snapshot_path)
+
+def read_snapshot(snapshot_path, source_paths):
+    with open(snapshot_path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    magic, version, header_length = PREAMBLE.unpack_from(mapped)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        logger.info(f"Ignoring static snapshot with version {version}, expected {SNAPSHOT_VERSION}")
+        return None
+    
+    header = json.loads(mapped[PREAMBLE.size:PREAMBLE.size + header_length])
+    if header['byteorder'] != sys.byteorder:
+        logger.info("Ignoring static snapshot written on a machine with a different byte order")
+        return None
+    
+    if not fingerprint_matches(header['sources'], source_paths):
+        logger.info("Static GTFS files changed since the snapshot was written")
+        return None
+    
+    # Columns stay backed by the mapping, so processes loading the same snapshot share its pages
+    base = PREAMBLE.size + header_length
+    view = memoryview(mapped)
+    columns = {}
+    for name, (offset, length, typecode) in header['sections'].items():
+        if typecode is not None:
+            columns[name] = view[base + offset:base + offset + length].cast(typecode)
+    
+    offset, length, typecode = header['sections']['objects']
+    objects = pickle.loads(view[base + offset:base + offset + length])
+    return columns, objects
+
+def save_dataset_snapshot(dataset, snapshot_path, source_paths):
+    try:
+        columns = {}
+        tables = [
+            ('shapes', dataset.shapes_data),
+            ('simplified', dataset.simplified_shapes),
+            ('trips', dataset.trips_data),
+            ('stop_times', dataset.stop_times_data),
+            ('route_stops', dataset.route_stops),
+            ('stop_index', dataset.stop_index),
+            ('shape_index', dataset.shape_index)
+        ]
+        for prefix, table in tables:
+            for name, column in table.export_columns().items():
+                columns[f"{prefix}.{name}"] = column
+        
+        objects = {
+            'route_data': dataset.route_data,
+            'stop_data': dataset.stop_data,
+            'route_shapes': dataset.route_shapes,
+            'route_variants': dataset.route_variants,
+            'stop_ids': dataset.stop_ids.values,
+            'trip_ids': dataset.trip_ids.values,
+            'shape_ids': dataset.shapes_data.key_ids.values,
+            'trip_route_ids': dataset.trips_data.route_ids.values,
+            'trip_shape_ids': dataset.trips_data.shape_ids.values,
+            'trip_service_ids': dataset.trips_data.service_ids.values,
+            'calendar': dataset.calendar.export(),
+            'feed_timezone': dataset.feed_timezone.key if dataset.feed_timezone else None
+        }
+        
+        sources = source_fingerprint(source_paths)
+        write_snapshot(snapshot_path, sources, columns, objects)
+        logger.info(f"Wrote static snapshot to {snapshot_path}")
+        return True
+    except Exception as e:
+        logger.error(f"Error writing static snapshot: {e}")
+        traceback.print_exc()
+        return False
+
+def load_dataset_snapshot(dataset, snapshot_path, source_paths):
+    try:
+        if not snapshot_path.exists():
+            return False
+        
+        snapshot = read_snapshot(snapshot_path, source_paths)
+        if snapshot is None:
+            return False
+        columns, objects = snapshot
+        
+        def table_columns(prefix):
+            return {name.split('.', 1)[1]: column for name, column in columns.items() if name.startswith(prefix + '.')}
+        
+        dataset.stop_ids = StringInterner.from_values(objects['stop_ids'])
+        dataset.trip_ids = StringInterner.from_values(objects['trip_ids'])
+        
+        shapes_data = ShapeTable(StringInterner.from_values(objects['shape_ids']))
+        shapes_data.import_columns(table_columns('shapes'))
+        
+        simplified_shapes = SimplifiedShapes(shapes_data)
+        simplified_shapes.import_columns(table_columns('simplified'))
+        
+        trips_data = TripTable(dataset.trip_ids)
+        trips_data.route_ids = StringInterner.from_values(objects['trip_route_ids'])
+        trips_data.shape_ids = StringInterner.from_values(objects['trip_shape_ids'])
+        trips_data.service_ids = StringInterner.from_values(objects['trip_service_ids'])
+        trips_data.import_columns(table_columns('trips'))
+        
+        calendar = ServiceCalendar(trips_data.service_ids)
+        calendar.import_objects(objects['calendar'])
+        
+        stop_times_data = StopTimesTable(dataset.trip_ids, dataset.stop_ids)
+        stop_times_data.import_columns(table_columns('stop_times'))
+        
+        dataset.route_data = objects['route_data']
+        dataset.stop_data = objects['stop_data']
+        dataset.shapes_data = shapes_data
+        dataset.simplified_shapes = simplified_shapes
+        dataset.trips_data = trips_data
+        dataset.stop_times_data = stop_times_data
+        dataset.route_shapes = objects['route_shapes']
+        dataset.route_stops = RouteStopIndex(trips_data.route_ids, dataset.stop_ids, dataset.stop_data, stop_times_data)
+        dataset.route_stops.import_columns(table_columns('route_stops'))
+        dataset.route_variants = objects['route_variants']
+        dataset.calendar = calendar
+        dataset.feed_timezone = ZoneInfo(objects['feed_timezone']) if objects['feed_timezone'] else None
+        
+        dataset.stop_index = StopIndex(dataset.stop_data)
+        dataset.stop_index.import_columns(table_columns('stop_index'))
+        dataset.shape_index = ShapeIndex(shapes_data)
+        dataset.shape_index.import_columns(table_columns('shape_index'))
+        return True
+    except Exception as e:
+        logger.warning(f"Could not load static snapshot, re-parsing GTFS files: {e}")
+        traceback.print_exc()
+        return False
@@ -1,95 +1,126 @@
 # hamilton-transit-map/backend/gtfs_static_parser.py
 import requests
+import fcntl
 import logging
 import os
-import csv
+import threading
+import time
+import io
+import json
 import zipfile
 import traceback
+from contextlib import contextmanager
 from pathlib import Path
+from zoneinfo import ZoneInfo
+from gtfs_columnar import (
+    StringInterner, ShapeTable, StopTimesTable, TripTable, RouteStopIndex,
+    open_gtfs_file, iter_columns, parse_gtfs_time
+)
+from gtfs_snapshot import save_dataset_snapshot, load_dataset_snapshot
+from shape_encoding import SimplifiedShapes, format_points, encode_polyline, level_for_zoom
+from spatial_index import StopIndex, ShapeIndex
+from vector_tiles import tile_bounds, clip_points
+from map_matching import ShapeSegments
+from metrics import static_load_seconds
+from service_calendar import ServiceCalendar, ServiceWindow, window_dates, DEFAULT_TIMEZONE
 
 logger = logging.getLogger(__name__)
 
-class GTFSStaticParser:
+STATIC_FILES = ['routes.txt', 'stops.txt', 'shapes.txt', 'trips.txt', 'stop_times.txt']
+HAMILTON_STATIC_ZIP_URL = "https://opendata.hamilton.ca/GTFS-Static/google_transit.zip"
+
+def directory_opener(data_dir):
+    def open_member(file_name):
+        path = Path(data_dir) / file_name
+        return open_gtfs_file(path) if path.exists() else None
+    return open_member
+
+def zip_opener(zip_ref):
+    members = {Path(name).name: name for name in zip_ref.namelist()}
+    
+    def open_member(file_name):
+        if file_name not in members:
+            return None
+        return io.TextIOWrapper(zip_ref.open(members[file_name]), encoding='utf-8-sig', newline='')
+    return open_member
+
+class StaticDataset:
     def __init__(self):
+        self.stop_ids = StringInterner()
+        self.trip_ids = StringInterner()
+        
         self.route_data = {}
         self.stop_data = []
-        self.shapes_data = {}
-        self.trips_data = {}
-        self.stop_times_data = {}
+        self.shapes_data = ShapeTable()
+        self.simplified_shapes = SimplifiedShapes(self.shapes_data)
+        self.trips_data = TripTable(self.trip_ids)
+        self.stop_times_data = StopTimesTable(self.trip_ids, self.stop_ids)
         self.route_shapes = {}
-        self.route_stops = {}
-        
-        self.static_zip_url = "https://opendata.hamilton.ca/GTFS-Static/google_transit.zip"
+        self.route_stops = RouteStopIndex(self.trips_data.route_ids, self.stop_ids, self.stop_data, self.stop_times_data)
+        self.route_variants = {}
+        self.calendar = ServiceCalendar(self.trips_data.service_ids)
+        # Service days follow the agency's configured timezone, else agency.txt's agency_timezone
+        self.configured_timezone = None
+        self.feed_timezone = None
+        self.stop_index = StopIndex(self.stop_data)
+        self.shape_index = ShapeIndex(self.shapes_data)
+        self.shape_segments = {}
+        # Route-level queries answer for the trips of the current ServiceWindow, by this clock
+        self.clock = time.time
+        self.window = None
+        self.window_lock = threading.Lock()
         
-        self.data_dir = Path(__file__).parent / "data"
-        self.backup_zip_path = self.data_dir / "google_transit.zip"
-        self.backup_routes_path = self.data_dir / "routes.txt"
-        self.backup_stops_path = self.data_dir / "stops.txt"
-        self.backup_shapes_path = self.data_dir / "shapes.txt"
-        self.backup_trips_path = self.data_dir / "trips.txt"
-        self.backup_stop_times_path = self.data_dir / "stop_times.txt"
-        
-        os.makedirs(self.data_dir, exist_ok=True)
-        
-        self.load_static_data()
+    @property
+    def timezone(self):
+        return self.configured_timezone or self.feed_timezone or DEFAULT_TIMEZONE
     
-    def load_static_data(self):
-        self.download_and_extract_static_data()
-        
-        self.load_route_data()
-        self.load_stop_data()
-        self.load_shapes_data()
-        self.load_trips_data()
-        self.load_stop_times_data()
+    def load(self, open_member):
+        with static_load_seconds.time('agency'):
+            self.load_agency_data(open_member)
+        with static_load_seconds.time('routes'):
+            self.load_route_data(open_member)
+            self.build_route_index()
+        with static_load_seconds.time('stops'):
+            self.load_stop_data(open_member)
+        with static_load_seconds.time('shapes'):
+            self.load_shapes_data(open_member)
+        with static_load_seconds.time('simplify'):
+            self.simplify_shapes()
+        with static_load_seconds.time('trips'):
+            self.load_trips_data(open_member)
+        with static_load_seconds.time('calendar'):
+            self.load_calendar_data(open_member)
+        with static_load_seconds.time('stop_times'):
+            self.load_stop_times_data(open_member)
         
-        self.process_relationships()
-        
-        logger.info("Static GTFS data loaded successfully")
+        with static_load_seconds.time('relationships'):
+            self.process_relationships()
+        with static_load_seconds.time('spatial_indexes'):
+            self.build_spatial_indexes()
     
-    def download_and_extract_static_data(self):
+    def load_agency_data(self, open_member):
         try:
-            files_to_extract = ['routes.txt', 'stops.txt', 'shapes.txt', 'trips.txt', 'stop_times.txt']
-            files_missing = []
-            
-            for file_name in files_to_extract:
-                file_path = self.data_dir / file_name
-                if not file_path.exists():
-                    files_missing.append(file_name)
-            
-            if files_missing:
-                logger.info(f"Downloading GTFS static data zip file. Missing files: {files_missing}")
-                response = requests.get(self.static_zip_url)
-                
-                if response.status_code == 200:
-                    with open(self.backup_zip_path, 'wb') as f:
-                        f.write(response.content)
-                    
-                    logger.info("Extracting GTFS static data from zip file")
-                    with zipfile.ZipFile(self.backup_zip_path, 'r') as zip_ref:
-                        for file_name in files_to_extract:
-                            try:
-                                zip_ref.extract(file_name, self.data_dir)
-                                logger.info(f"Extracted {file_name}")
-                            except KeyError:
-                                logger.warning(f"File {file_name} not found in zip")
-                    
-                    if self.backup_zip_path.exists():
-                        os.remove(self.backup_zip_path)
-                        logger.info("Deleted zip file after extraction")
-                else:
-                    logger.warning(f"Failed to download GTFS static data: {response.status_code}")
-            else:
-                logger.info("All static GTFS files already exist, skipping download")
+            f = open_member('agency.txt')
+            if f is not None:
+                with f:
+                    for agency_timezone in iter_columns(f, [], ['agency_timezone']):
+                        # The spec requires every agency in a feed to share one timezone
+                        if agency_timezone.strip():
+                            self.feed_timezone = ZoneInfo(agency_timezone.strip())
+                        break
+            if self.feed_timezone is None:
+                logger.warning(f"No agency_timezone in agency.txt. Service days will follow {self.timezone.key}.")
         except Exception as e:
-            logger.error(f"Error downloading or extracting GTFS static data: {e}")
+            logger.error(f"Error loading agency data: {e}")
             traceback.print_exc()
-    
-    def load_route_data(self):
+        
+    def load_route_data(self, open_member):
         try:
-            if self.backup_routes_path.exists():
+            f = open_member('routes.txt')
+            if f is not None:
                 logger.info("Loading route data from file")
-                with open(self.backup_routes_path, 'r') as f:
-                    self.parse_route_data(f.read())
+                with f:
+                    self.parse_route_data(f)
             else:
                 logger.warning("No routes.txt file found. Creating minimal route data")
                 self.create_fallback_route_data()
@@ -98,78 +129,95 @@ class GTFSStaticParser:
             traceback.print_exc()
             self.create_fallback_route_data()
     
-    def load_stop_data(self):
+    def load_stop_data(self, open_member):
         try:
-            if self.backup_stops_path.exists():
+            f = open_member('stops.txt')
+            if f is not None:
                 logger.info("Loading stop data from file")
-                with open(self.backup_stops_path, 'r') as f:
-                    self.parse_stop_data(f.read())
+                with f:
+                    self.parse_stop_data(f)
             else:
                 logger.warning("No stops.txt file found. No stop data will be available.")
         except Exception as e:
             logger.error(f"Error loading stop data: {e}")
             traceback.print_exc()
     
-    def load_shapes_data(self):
+    def load_shapes_data(self, open_member):
         try:
-            if self.backup_shapes_path.exists():
+            f = open_member('shapes.txt')
+            if f is not None:
                 logger.info("Loading shapes data from file")
-                with open(self.backup_shapes_path, 'r') as f:
-                    self.parse_shapes_data(f.read())
+                with f:
+                    self.parse_shapes_data(f)
             else:
                 logger.warning("No shapes.txt file found. No shape data will be available.")
         except Exception as e:
             logger.error(f"Error loading shapes data: {e}")
             traceback.print_exc()
     
-    def load_trips_data(self):
+    def simplify_shapes(self):
+        try:
+            self.simplified_shapes.build()
+            for zoom, (indices, offsets) in sorted(self.simplified_shapes.levels.items()):
+                logger.info(f"Simplified shapes for zoom {zoom}: {len(indices)} of {len(self.shapes_data.lat)} points kept")
+        except Exception as e:
+            logger.error(f"Error simplifying shapes: {e}")
+            traceback.print_exc()
+    
+    def load_trips_data(self, open_member):
         try:
-            if self.backup_trips_path.exists():
+            f = open_member('trips.txt')
+            if f is not None:
                 logger.info("Loading trips data from file")
-                with open(self.backup_trips_path, 'r') as f:
-                    self.parse_trips_data(f.read())
+                with f:
+                    self.parse_trips_data(f)
             else:
                 logger.warning("No trips.txt file found. Route-shape mappings will not be available.")
         except Exception as e:
             logger.error(f"Error loading trips data: {e}")
             traceback.print_exc()
     
-    def load_stop_times_data(self):
+    def load_calendar_data(self, open_member):
+        # Both files are optional; a feed may have either, both or neither
+        parsers = {'calendar.txt': self.calendar.parse_calendar, 'calendar_dates.txt': self.calendar.parse_calendar_dates}
+        for file_name, parse in parsers.items():
+            try:
+                f = open_member(file_name)
+                if f is not None:
+                    logger.info(f"Loading service calendar from {file_name}")
+                    with f:
+                        parse(f)
+            except Exception as e:
+                logger.error(f"Error loading {file_name}: {e}")
+                traceback.print_exc()
+        if not self.calendar.has_calendar:
+            logger.warning("No calendar.txt or calendar_dates.txt found. Every trip will be treated as running daily.")
+    
+    def load_stop_times_data(self, open_member):
         try:
-            if self.backup_stop_times_path.exists():
+            f = open_member('stop_times.txt')
+            if f is not None:
                 logger.info("Loading stop_times data from file")
-                with open(self.backup_stop_times_path, 'r') as f:
-                    self.parse_stop_times_data(f.read())
+                with f:
+                    self.parse_stop_times_data(f)
             else:
                 logger.warning("No stop_times.txt file found. Route-stop mappings will not be available.")
         except Exception as e:
             logger.error(f"Error loading stop_times data: {e}")
             traceback.print_exc()
     
-    def parse_route_data(self, text_data):
+    def parse_route_data(self, lines):
         try:
-            lines = text_data.strip().split('\n')
-            reader = csv.DictReader(lines)
-            
             route_groups = {}
-            all_route_ids = {}
             
-            for row in reader:
-                try:
-                    route_id = row['route_id']
-                    route_short_name = row['route_short_name']
-                    route_color = row.get('route_color', '')
-                    
-                    if route_short_name not in route_groups:
-                        route_groups[route_short_name] = []
-                    
-                    route_groups[route_short_name].append({
-                        'route_id': route_id,
-                        'route_color': route_color,
-                    })
-                    
-                except KeyError as e:
-                    logger.warning(f"Missing key in route data: {e}")
+            for route_id, route_short_name, route_color in iter_columns(lines, ['route_id', 'route_short_name'], ['route_color']):
+                if route_short_name not in route_groups:
+                    route_groups[route_short_name] = []
+            
+                route_groups[route_short_name].append({
+                    'route_id': route_id,
+                    'route_color': route_color,
+                })
             
             for route_short_name, routes in route_groups.items():
                 route = routes[0]
@@ -203,17 +251,18 @@ class GTFSStaticParser:
             logger.error(f"Error parsing route data: {e}")
             traceback.print_exc()
     
-    def parse_stop_data(self, text_data):
+    def parse_stop_data(self, lines):
         try:
-            lines = text_data.strip().split('\n')
-            reader = csv.DictReader(lines)
-            
-            for row in reader:
+            for stop_id, stop_name, stop_lat, stop_lon in iter_columns(lines, ['stop_id', 'stop_name', 'stop_lat', 'stop_lon']):
                 try:
-                    stop_id = row['stop_id']
-                    stop_name = row['stop_name']
-                    stop_lat = float(row['stop_lat'])
-                    stop_lon = float(row['stop_lon'])
+                    stop_lat = float(stop_lat)
+                    stop_lon = float(stop_lon)
+            
+                    # stop_data is indexed by interned stop id, so stop_times can refer to stops by position
+                    if stop_id in self.stop_ids:
+                        logger.warning(f"Skipping duplicate stop {stop_id}")
+                        continue
+                    self.stop_ids.intern(stop_id)
                     
                     self.stop_data.append({
                         'stop_id': stop_id,
@@ -221,95 +270,53 @@ class GTFSStaticParser:
                         'latitude': stop_lat,
                         'longitude': stop_lon
                     })
-                except (KeyError, ValueError) as e:
+                except ValueError as e:
                     logger.warning(f"Error processing stop data row: {e}")
         except Exception as e:
             logger.error(f"Error parsing stop data: {e}")
             traceback.print_exc()
     
-    def parse_shapes_data(self, text_data):
+    def parse_shapes_data(self, lines):
         try:
-            lines = text_data.strip().split('\n')
-            reader = csv.DictReader(lines)
-            
-            shape_points = {}
-            
-            for row in reader:
+            columns = ['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence']
+            for shape_id, lat, lon, sequence in iter_columns(lines, columns):
                 try:
-                    shape_id = row['shape_id']
-                    lat = float(row['shape_pt_lat'])
-                    lon = float(row['shape_pt_lon'])
-                    sequence = int(row['shape_pt_sequence'])
-                    
-                    if shape_id not in shape_points:
-                        shape_points[shape_id] = []
-                    
-                    shape_points[shape_id].append({
-                        'lat': lat,
-                        'lon': lon,
-                        'sequence': sequence
-                    })
-                except (KeyError, ValueError) as e:
+                    self.shapes_data.append(shape_id, float(lat), float(lon), int(sequence))
+                except (ValueError, OverflowError) as e:
                     logger.warning(f"Error processing shape data row: {e}")
             
-            for shape_id, points in shape_points.items():
-                sorted_points = sorted(points, key=lambda x: x['sequence'])
-                self.shapes_data[shape_id] = [[p['lat'], p['lon']] for p in sorted_points]
+            self.shapes_data.finalize()
             
             logger.info(f"Loaded {len(self.shapes_data)} shapes")
         except Exception as e:
             logger.error(f"Error parsing shapes data: {e}")
             traceback.print_exc()
             
-    def parse_trips_data(self, text_data):
+    def parse_trips_data(self, lines):
         try:
-            lines = text_data.strip().split('\n')
-            reader = csv.DictReader(lines)
-            
-            for row in reader:
-                try:
-                    trip_id = row['trip_id']
-                    route_id = row['route_id']
-                    shape_id = row.get('shape_id', None)
-                    
-                    self.trips_data[trip_id] = {
-                        'route_id': route_id,
-                        'shape_id': shape_id
-                    }
-                    
-                except KeyError as e:
-                    logger.warning(f"Missing key in trips data: {e}")
+            for trip_id, route_id, shape_id, service_id in iter_columns(lines, ['trip_id', 'route_id'],
+                                                                        ['shape_id', 'service_id']):
+                self.trips_data.append(trip_id, route_id, shape_id, service_id)
             
             logger.info(f"Loaded {len(self.trips_data)} trips")
         except Exception as e:
             logger.error(f"Error parsing trips data: {e}")
             traceback.print_exc()
     
-    def parse_stop_times_data(self, text_data):
+    def parse_stop_times_data(self, lines):
         try:
-            lines = text_data.strip().split('\n')
-            reader = csv.DictReader(lines)
-            
-            for row in reader:
+            columns = iter_columns(lines, ['trip_id', 'stop_id', 'stop_sequence'], ['departure_time', 'arrival_time'])
+            for trip_id, stop_id, stop_sequence, departure_time, arrival_time in columns:
                 try:
-                    trip_id = row['trip_id']
-                    stop_id = row['stop_id']
-                    stop_sequence = int(row['stop_sequence'])
-                    
-                    if trip_id not in self.stop_times_data:
-                        self.stop_times_data[trip_id] = []
-                    
-                    self.stop_times_data[trip_id].append({
-                        'stop_id': stop_id,
-                        'sequence': stop_sequence
-                    })
-                except (KeyError, ValueError) as e:
+                    departure = parse_gtfs_time(departure_time or arrival_time)
+                    self.stop_times_data.append(trip_id, stop_id, int(stop_sequence), departure)
+                except (ValueError, OverflowError) as e:
                     logger.warning(f"Error processing stop_times data row: {e}")
             
-            for trip_id, stops in self.stop_times_data.items():
-                self.stop_times_data[trip_id] = sorted(stops, key=lambda x: x['sequence'])
+            self.stop_times_data.finalize()
             
-            logger.info(f"Loaded stop times for {len(self.stop_times_data)} trips")
+            logger.info(f"Loaded stop times for {len(self.stop_times_data)} trips in "
+                        f"{self.stop_times_data.pattern_count} distinct stop patterns")
         except Exception as e:
             logger.error(f"Error parsing stop_times data: {e}")
             traceback.print_exc()
@@ -323,43 +330,26 @@ class GTFSStaticParser:
                 'route_color': '#' + format(hash(route_id) % 0xFFFFFF, '06x')
             }
     
+    def build_route_index(self):
+        # route_id -> short name is route_data itself; this adds short name -> [variant route_ids]
+        self.route_variants = {}
+        for route_id, route_info in self.route_data.items():
+            route_short_name = route_info.get('route_short_name', route_id)
+            if route_short_name not in self.route_variants:
+                self.route_variants[route_short_name] = []
+            self.route_variants[route_short_name].append(route_id)
+    
     def process_relationships(self):
         try:
             logger.info("Processing relationships between routes, shapes, and stops")
             
-            route_to_shapes = {}
-            for trip_id, trip in self.trips_data.items():
-                route_id = trip['route_id']
-                shape_id = trip['shape_id']
-                
-                if shape_id and shape_id in self.shapes_data:
-                    if route_id not in route_to_shapes:
-                        route_to_shapes[route_id] = set()
-                    route_to_shapes[route_id].add(shape_id)
-            
-            for route_id, shapes in route_to_shapes.items():
-                self.route_shapes[route_id] = list(shapes)
+            # Across every service; a ServiceWindow narrows these to the services running
+            self.route_shapes = self.trips_data.route_shape_ids(self.shapes_data)
             
             logger.info(f"Mapped {len(self.route_shapes)} routes to shapes")
             
-            route_to_stops = {}
-            for trip_id, stops in self.stop_times_data.items():
-                if trip_id in self.trips_data:
-                    route_id = self.trips_data[trip_id]['route_id']
-                    
-                    if route_id not in route_to_stops:
-                        route_to_stops[route_id] = set()
-                    
-                    for stop_data in stops:
-                        route_to_stops[route_id].add(stop_data['stop_id'])
-            
-            stop_dict = {stop['stop_id']: stop for stop in self.stop_data}
-            
-            for route_id, stop_ids in route_to_stops.items():
-                self.route_stops[route_id] = []
-                for stop_id in stop_ids:
-                    if stop_id in stop_dict:
-                        self.route_stops[route_id].append(stop_dict[stop_id])
+            self.route_stops = RouteStopIndex(self.trips_data.route_ids, self.stop_ids, self.stop_data, self.stop_times_data)
+            self.route_stops.build(self.trips_data)
             
             logger.info(f"Mapped {len(self.route_stops)} routes to stops")
             
@@ -367,19 +357,386 @@ class GTFSStaticParser:
             logger.error(f"Error processing relationships: {e}")
             traceback.print_exc()
     
+    def build_spatial_indexes(self):
+        try:
+            self.stop_index.build()
+            self.shape_index.build()
+            logger.info(f"Indexed {len(self.stop_data)} stops and {len(self.shape_index.bounds) // 4} shapes spatially")
+        except Exception as e:
+            logger.error(f"Error building spatial indexes: {e}")
+            traceback.print_exc()
+    
+    def find_stops_in_bbox(self, bbox, route_id=None):
+        min_lat, min_lon, max_lat, max_lon = bbox
+        if route_id:
+            return [stop for stop in self.get_route_stops(route_id)
+                    if min_lat <= stop['latitude'] <= max_lat and min_lon <= stop['longitude'] <= max_lon]
+        return self.stop_index.in_bbox(min_lat, min_lon, max_lat, max_lon)
+    
+    def find_nearest_stops(self, lat, lon, k):
+        return [dict(stop, distance=round(distance, 1)) for stop, distance in self.stop_index.nearest(lat, lon, k)]
+    
+    def service_window(self, now=None):
+        # Today's and tomorrow's services, built on the first request of each service day
+        timezone = self.timezone
+        service_dates = window_dates(self.clock() if now is None else now, timezone)
+        window = self.window
+        if window is None or window.service_dates != service_dates:
+            with self.window_lock:
+                window = self.window
+                if window is None or window.service_dates != service_dates:
+                    window = ServiceWindow(self, service_dates, timezone)
+                    self.window = window
+        return window
+    
+    def find_shapes_in_bbox(self, bbox, route_id=None, level=None, shape_format='raw'):
+        window = self.service_window()
+        shape_ids = [shape_id for shape_id in self.shape_index.in_bbox(*bbox) if window.has_shape(shape_id)]
+        if route_id:
+            route_shape_ids = set(window.route_shapes.get(route_id, []))
+            shape_ids = [shape_id for shape_id in shape_ids if shape_id in route_shape_ids]
+        return {shape_id: self.get_shape_points(shape_id, level, shape_format) for shape_id in shape_ids}
+    
+    def get_route_short_name(self, route_id):
+        route_info = self.route_data.get(route_id)
+        return route_info.get('route_short_name') if route_info else None
+    
+    def get_route_variants(self, route_id):
+        route_short_name = self.get_route_short_name(route_id)
+        return self.route_variants.get(route_short_name, []) if route_short_name else []
+    
     def get_stop_positions(self):
         return self.stop_data
     
     def get_route_stops(self, route_id=None):
+        route_stops = self.service_window().route_stops
         if route_id:
-            return self.route_stops.get(route_id, [])
-        return self.route_stops
+            return route_stops.get(route_id, [])
+        return route_stops
+    
+    def get_route_patterns(self, route_id):
+        stop_count = len(self.stop_data)
+        return [{
+            'trips': trips,
+            'stops': [self.stop_data[i] for i in stop_indices if i < stop_count]
+        } for stop_indices, trips in self.service_window().route_stops.patterns(route_id)]
+    
+    def get_stop_routes(self, stop_id):
+        routes = []
+        for route_id in self.service_window().route_stops.routes_of_stop(stop_id):
+            route_info = self.route_data.get(route_id, {})
+            routes.append({
+                'route_id': route_id,
+                'route_short_name': route_info.get('route_short_name', route_id),
+                'route_color': route_info.get('route_color', '#FF0000')
+            })
+        return routes
     
-    def get_shapes(self):
-        return self.shapes_data
+    def get_shape_points(self, shape_id, level=None, shape_format='raw'):
+        return format_points(self.simplified_shapes.points(shape_id, level), shape_format)
     
-    def get_route_shapes(self, route_id=None):
+    def get_shapes(self, level=None, shape_format='raw'):
+        window = self.service_window()
+        return {shape_id: self.get_shape_points(shape_id, level, shape_format)
+                for shape_id in self.shapes_data if window.has_shape(shape_id)}
+    
+    def get_route_shapes(self, route_id=None, level=None, shape_format='raw'):
+        route_shapes = self.service_window().route_shapes
         if route_id:
-            shape_ids = self.route_shapes.get(route_id, [])
-            return {shape_id: self.shapes_data[shape_id] for shape_id in shape_ids if shape_id in self.shapes_data}
-        return self.route_shapes
+            shape_ids = route_shapes.get(route_id, [])
+            return {shape_id: self.get_shape_points(shape_id, level, shape_format) for shape_id in shape_ids if shape_id in self.shapes_data}
+        return route_shapes
+
+    def get_shape_routes(self):
+        return self.service_window().get_shape_routes()
+    
+    def get_shape_segments(self, shape_id):
+        # Built the first time a vehicle is seen on the shape
+        segments = self.shape_segments.get(shape_id)
+        if segments is None and shape_id in self.shapes_data:
+            lats, lons = self.shapes_data.coords(shape_id)
+            segments = ShapeSegments(lats, lons)
+            self.shape_segments[shape_id] = segments
+        return segments
+    
+    def get_network_bounds(self):
+        if not self.stop_data:
+            return None
+        lats = [stop['latitude'] for stop in self.stop_data]
+        lons = [stop['longitude'] for stop in self.stop_data]
+        return min(lats), min(lons), max(lats), max(lons)
+    
+    def get_tile(self, z, x, y):
+        bounds = tile_bounds(z, x, y)
+        level = level_for_zoom(z)
+        window = self.service_window()
+        shape_routes = window.get_shape_routes()
+        
+        shapes = []
+        for shape_id in self.shape_index.in_bbox(*bounds):
+            if not window.has_shape(shape_id):
+                continue
+            for piece in clip_points(self.get_shape_points(shape_id, level), bounds):
+                shapes.append({
+                    'shape_id': shape_id,
+                    'route_ids': shape_routes.get(shape_id, []),
+                    'points': encode_polyline(piece)
+                })
+        
+        return {
+            'stops': self.find_stops_in_bbox(bounds),
+            'shapes': shapes
+        }
+
+class GTFSStaticParser:
+    # With load=False the dataset stays empty until ensure_loaded(), and unload() drops it again
+    def __init__(self, static_zip_url=None, data_dir=None, static_zip_path=None, load=True, timezone=None):
+        self.dataset = StaticDataset()
+        self.loaded = False
+        self.load_lock = threading.Lock()
+        # Decides which services are running; replay swaps in its own clock
+        self.clock = time.time
+        # Overrides agency.txt's agency_timezone when given
+        self.timezone = ZoneInfo(timezone) if timezone else None
+        
+        # Given a local static_zip_path, the feed is read from it and never downloaded
+        self.static_zip_url = None if static_zip_path else static_zip_url
+        self.request_timeout = 60
+        
+        self.data_dir = Path(data_dir) if data_dir else Path(__file__).parent / "data"
+        self.backup_zip_path = Path(static_zip_path) if static_zip_path else self.data_dir / "google_transit.zip"
+        self.backup_agency_path = self.data_dir / "agency.txt"
+        self.backup_routes_path = self.data_dir / "routes.txt"
+        self.backup_stops_path = self.data_dir / "stops.txt"
+        self.backup_shapes_path = self.data_dir / "shapes.txt"
+        self.backup_trips_path = self.data_dir / "trips.txt"
+        self.backup_stop_times_path = self.data_dir / "stop_times.txt"
+        self.backup_calendar_path = self.data_dir / "calendar.txt"
+        self.backup_calendar_dates_path = self.data_dir / "calendar_dates.txt"
+        self.snapshot_path = self.data_dir / "static_snapshot.bin"
+        self.zip_validators_path = self.data_dir / "google_transit.json"
+        self.lock_path = self.data_dir / "static.lock"
+        
+        os.makedirs(self.data_dir, exist_ok=True)
+        
+        if load:
+            self.load_static_data()
+    
+    # The current dataset is replaced with a single reference assignment on refresh, so
+    # callers that need several structures at once should read self.dataset once
+    @property
+    def route_data(self):
+        return self.dataset.route_data
+    
+    @property
+    def stop_data(self):
+        return self.dataset.stop_data
+    
+    @property
+    def shapes_data(self):
+        return self.dataset.shapes_data
+    
+    @property
+    def trips_data(self):
+        return self.dataset.trips_data
+    
+    @property
+    def stop_times_data(self):
+        return self.dataset.stop_times_data
+    
+    @property
+    def route_shapes(self):
+        return self.dataset.route_shapes
+    
+    @property
+    def route_stops(self):
+        return self.dataset.route_stops
+    
+    @property
+    def route_variants(self):
+        return self.dataset.route_variants
+    
+    @contextmanager
+    def static_files_lock(self):
+        # Held while the zip or the snapshot in data_dir may be written. Another process loading
+        # or refreshing the same data_dir waits for its snapshot and then maps it instead of
+        # parsing the feed again.
+        with open(self.lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+    
+    def load_static_data(self):
+        with self.static_files_lock():
+            with static_load_seconds.time('download'):
+                self.download_static_data()
+            with static_load_seconds.time('total') as timer:
+                self.dataset = self.build_dataset()
+        self.loaded = True
+        logger.info(f"Static GTFS data loaded successfully in {timer.elapsed:.2f}s")
+    
+    def ensure_loaded(self):
+        if self.loaded:
+            return False
+        with self.load_lock:
+            if self.loaded:
+                return False
+            self.load_static_data()
+            return True
+    
+    def unload(self):
+        with self.load_lock:
+            self.dataset = StaticDataset()
+            self.loaded = False
+    
+    def source_paths(self):
+        # A downloaded zip is read in place; extracted CSVs are only used when there is no zip
+        if self.backup_zip_path.exists():
+            return [self.backup_zip_path]
+        return [
+            self.backup_agency_path,
+            self.backup_routes_path,
+            self.backup_stops_path,
+            self.backup_shapes_path,
+            self.backup_trips_path,
+            self.backup_stop_times_path,
+            self.backup_calendar_path,
+            self.backup_calendar_dates_path
+        ]
+    
+    def build_dataset(self):
+        source_paths = self.source_paths()
+        
+        dataset = self.create_dataset()
+        with static_load_seconds.time('snapshot_read'):
+            loaded = load_dataset_snapshot(dataset, self.snapshot_path, source_paths)
+        if loaded:
+            logger.info("Static GTFS data loaded from snapshot")
+            return dataset
+        
+        if self.backup_zip_path.exists():
+            with zipfile.ZipFile(self.backup_zip_path, 'r') as zip_ref:
+                dataset.load(zip_opener(zip_ref))
+        else:
+            dataset.load(directory_opener(self.data_dir))
+        
+        with static_load_seconds.time('snapshot_write'):
+            saved = save_dataset_snapshot(dataset, self.snapshot_path, source_paths)
+        
+        # Serve the parse from the snapshot just written, so the trips and stop times of every
+        # service are paged in as they are read instead of staying on the heap
+        if saved:
+            mapped = self.create_dataset()
+            with static_load_seconds.time('snapshot_read'):
+                if load_dataset_snapshot(mapped, self.snapshot_path, source_paths):
+                    return mapped
+        return dataset
+    
+    def create_dataset(self):
+        dataset = StaticDataset()
+        dataset.clock = lambda: self.clock()
+        dataset.configured_timezone = self.timezone
+        return dataset
+    
+    def download_static_data(self):
+        try:
+            if self.backup_zip_path.exists():
+                logger.info("GTFS static zip file already exists, skipping download")
+                return
+            
+            files_missing = [file_name for file_name in STATIC_FILES if not (self.data_dir / file_name).exists()]
+            if not files_missing:
+                logger.info("All static GTFS files already exist, skipping download")
+                return
+            
+            logger.info(f"Downloading GTFS static data zip file. Missing files: {files_missing}")
+            self.fetch_static_zip()
+        except Exception as e:
+            logger.error(f"Error downloading GTFS static data: {e}")
+            traceback.print_exc()
+    
+    def load_zip_validators(self):
+        if not self.backup_zip_path.exists() or not self.zip_validators_path.exists():
+            return {}
+        try:
+            with open(self.zip_validators_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable zip validators: {e}")
+            return {}
+    
+    def fetch_static_zip(self):
+        if not self.static_zip_url:
+            return False
+        
+        validators = self.load_zip_validators()
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        
+        with requests.get(self.static_zip_url, headers=headers, stream=True, timeout=self.request_timeout) as response:
+            if response.status_code == 304:
+                logger.info("GTFS static zip file not modified")
+                return False
+            
+            if response.status_code != 200:
+                logger.warning(f"Failed to download GTFS static data: {response.status_code}")
+                return False
+            
+            # Stream to a temporary file so a partial download never replaces a good zip
+            download_path = self.backup_zip_path.with_name(self.backup_zip_path.name + '.part')
+            with open(download_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+            
+            validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }
+        
+        if not zipfile.is_zipfile(download_path):
+            logger.warning("Downloaded GTFS static data is not a valid zip file")
+            os.remove(download_path)
+            return False
+        
+        os.replace(download_path, self.backup_zip_path)
+        with open(self.zip_validators_path, 'w') as f:
+            json.dump(validators, f)
+        
+        logger.info(f"Downloaded GTFS static zip file ({self.backup_zip_path.stat().st_size} bytes)")
+        return True
+    
+    def refresh_static_data(self):
+        try:
+            with self.static_files_lock():
+                if not self.fetch_static_zip():
+                    return False
+            
+                # Build the new dataset off to the side; requests keep using the old one until the swap
+                dataset = self.build_dataset()
+            self.dataset = dataset
+            logger.info("Static GTFS data refreshed")
+            return True
+        except Exception as e:
+            logger.error(f"Error refreshing GTFS static data: {e}")
+            traceback.print_exc()
+            return False
+    
+    def reload_static_data(self):
+        # After another process has refreshed the feed: waits for its snapshot and maps it,
+        # and only parses the feed here if that snapshot is missing or stale
+        with self.static_files_lock():
+            self.dataset = self.build_dataset()
+    
+    def get_stop_positions(self):
+        return self.dataset.get_stop_positions()
+    
+    def get_route_stops(self, route_id=None):
+        return self.dataset.get_route_stops(route_id)
+    
+    def get_shapes(self, level=None, shape_format='raw'):
+        return self.dataset.get_shapes(level, shape_format)
+    
+    def get_route_shapes(self, route_id=None, level=None, shape_format='raw'):
+        return self.dataset.get_route_shapes(route_id, level, shape_format)
@@ -0,0 +1,120 @@
+# hamilton-transit-map/backend/map_matching.py
+import math
+from array import array
+from spatial_index import GridIndex, METERS_PER_DEGREE_LAT, METERS_PER_DEGREE_LON
+
+# About 220 m north-south and 160 m east-west, so the 3x3 block of cells around a vehicle
+# covers everything within MAX_SNAP_DISTANCE of it
+SEGMENT_CELL_SIZE = 0.002
+MAX_SNAP_DISTANCE = 150.0
+
+MISSING = float('nan')
+
+class ShapeSegments:
+    # One shape in a local metric projection (metres east/north of its first point), with the
+    # distance along the shape at every point and a grid over its segments. Segment i runs from
+    # point i to point i + 1 and is listed in every cell it passes through.
+    def __init__(self, lats, lons):
+        self.origin_lat = lats[0] if len(lats) else 0.0
+        self.origin_lon = lons[0] if len(lons) else 0.0
+        self.scale_x = METERS_PER_DEGREE_LON * math.cos(math.radians(self.origin_lat))
+        self.x = array('d', ((lon - self.origin_lon) * self.scale_x for lon in lons))
+        self.y = array('d', ((lat - self.origin_lat) * METERS_PER_DEGREE_LAT for lat in lats))
+        
+        self.distances = array('d', [0.0] * len(self.x))
+        for i in range(1, len(self.x)):
+            self.distances[i] = self.distances[i - 1] + math.hypot(self.x[i] - self.x[i - 1], self.y[i] - self.y[i - 1])
+        self.length = self.distances[-1] if len(self.distances) else 0.0
+        
+        self.grid = GridIndex(SEGMENT_CELL_SIZE)
+        self.grid.build(self.segment_cells(lats, lons), unique=True)
+    
+    def segment_cells(self, lats, lons):
+        # The centre of every cell each segment crosses, including ones it only clips at a corner
+        half = SEGMENT_CELL_SIZE / 2
+        for i in range(len(lats) - 1):
+            for row, col in self.grid.segment_cells(lats[i], lons[i], lats[i + 1], lons[i + 1]):
+                yield row * SEGMENT_CELL_SIZE + half, col * SEGMENT_CELL_SIZE + half, i
+    
+    def snap(self, lat, lon, max_distance=MAX_SNAP_DISTANCE):
+        # (snapped lat, snapped lon, distance along the shape, offset from it), or None when
+        # the shape does not pass within max_distance
+        row, col = self.grid.cell_of(lat, lon)
+        px = (lon - self.origin_lon) * self.scale_x
+        py = (lat - self.origin_lat) * METERS_PER_DEGREE_LAT
+        x, y = self.x, self.y
+        
+        # How far the vehicle is from each edge of its own cell, so a neighbouring cell is only
+        # searched when it could hold something closer than the best segment so far
+        size = SEGMENT_CELL_SIZE
+        gaps_lat = ((lat - row * size) * METERS_PER_DEGREE_LAT, 0.0, ((row + 1) * size - lat) * METERS_PER_DEGREE_LAT)
+        gaps_lon = ((lon - col * size) * self.scale_x, 0.0, ((col + 1) * size - lon) * self.scale_x)
+        cells = sorted((gaps_lat[dr] ** 2 + gaps_lon[dc] ** 2, row + dr - 1, col + dc - 1)
+                       for dr in range(3) for dc in range(3))
+        
+        best = None
+        best_d2 = max_distance * max_distance
+        for gap2, r, c in cells:
+            if gap2 > best_d2:
+                break
+            for i in self.grid.cell_entries((r, c)):
+                ax, ay = x[i], y[i]
+                dx, dy = x[i + 1] - ax, y[i + 1] - ay
+                length2 = dx * dx + dy * dy
+                t = ((px - ax) * dx + (py - ay) * dy) / length2 if length2 else 0.0
+                t = min(max(t, 0.0), 1.0)
+                sx, sy = ax + t * dx, ay + t * dy
+                d2 = (px - sx) ** 2 + (py - sy) ** 2
+                if d2 <= best_d2:
+                    best_d2 = d2
+                    best = (i, t, sx, sy)
+        
+        if best is None:
+            return None
+        i, t, sx, sy = best
+        along = self.distances[i] + t * (self.distances[i + 1] - self.distances[i])
+        return (self.origin_lat + sy / METERS_PER_DEGREE_LAT, self.origin_lon + sx / self.scale_x,
+                along, math.sqrt(best_d2))
+
+def snap_to_shapes(columns, dataset):
+    # One pass over the fleet: trips are resolved to shapes once per distinct trip, vehicles
+    # are grouped by shape, and each shape's segment index is fetched once for its group.
+    # Fills snapped_latitude / snapped_longitude / distance_along / progress on the columns,
+    # NaN where the vehicle has no known shape or is too far from it.
+    count = len(columns)
+    snapped_latitude = array('d', [MISSING]) * count
+    snapped_longitude = array('d', [MISSING]) * count
+    distance_along = array('d', [MISSING]) * count
+    progress = array('d', [MISSING]) * count
+    
+    shape_of_trip = {}
+    for trip in set(columns.trips):
+        trip_idx = dataset.trip_ids.lookup(columns.trip_ids[trip]) if trip >= 0 else None
+        shape_of_trip[trip] = dataset.trips_data.shape_of(trip_idx) if trip_idx is not None else None
+    
+    rows_by_shape = {}
+    for row, trip in enumerate(columns.trips):
+        shape_id = shape_of_trip[trip]
+        if shape_id:
+            if shape_id not in rows_by_shape:
+                rows_by_shape[shape_id] = []
+            rows_by_shape[shape_id].append(row)
+    
+    matched = 0
+    for shape_id, rows in rows_by_shape.items():
+        segments = dataset.get_shape_segments(shape_id)
+        if segments is None or segments.length <= 0:
+            continue
+        for row in rows:
+            snapped = segments.snap(columns.latitude[row], columns.longitude[row])
+            if snapped is None:
+                continue
+            snapped_latitude[row], snapped_longitude[row], distance_along[row], _ = snapped
+            progress[row] = distance_along[row] / segments.length
+            matched += 1
+    
+    columns.snapped_latitude = snapped_latitude
+    columns.snapped_longitude = snapped_longitude
+    columns.distance_along = distance_along
+    columns.progress = progress
+    return matched
@@ -0,0 +1,217 @@
+# hamilton-transit-map/backend/metrics.py
+import bisect
+import cProfile
+import logging
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from a cached response (tens of microseconds) up to a full static feed parse
+DURATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                    1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+# Slow-request profiles kept on disk; older ones are deleted
+PROFILES_KEPT = 50
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = {}
+        self.lock = threading.Lock()
+    
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+    
+    def collect(self):
+        with self.lock:
+            values = list(self.values.items())
+        return {
+            'name': self.name,
+            'type': 'counter',
+            'help': self.help_text,
+            'samples': [[f"{self.name}_total", dict(zip(self.label_names, label_values)), value]
+                        for label_values, value in values]
+        }
+
+class Histogram:
+    # Cumulative bucket counts, a count and a sum per label combination. Observing is a dict
+    # lookup and a bisect under a lock, cheap enough for every request and every poll.
+    def __init__(self, name, help_text, label_names=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+    
+    def observe(self, value, *label_values):
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                # Per-bucket counts, then the count and the sum
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bucket] += 1
+            series[-1] += value
+    
+    def time(self, *label_values):
+        return Timer(self, label_values)
+    
+    def totals(self):
+        # {label values: (count, sum)}
+        with self.lock:
+            return {label_values: (sum(counts[:-1]), counts[-1]) for label_values, counts in self.series.items()}
+    
+    def collect(self):
+        with self.lock:
+            series = [(label_values, list(counts)) for label_values, counts in self.series.items()]
+        
+        samples = []
+        for label_values, counts in series:
+            labels = dict(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append([f"{self.name}_bucket", dict(labels, le=format_value(bound)), cumulative])
+            cumulative += counts[len(self.buckets)]
+            samples.append([f"{self.name}_bucket", dict(labels, le='+Inf'), cumulative])
+            samples.append([f"{self.name}_count", labels, cumulative])
+            samples.append([f"{self.name}_sum", labels, counts[-1]])
+        return {'name': self.name, 'type': 'histogram', 'help': self.help_text, 'samples': samples}
+
+class Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+        self.histogram.observe(self.elapsed, *self.label_values)
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+    
+    def counter(self, name, help_text, label_names=()):
+        metric = Counter(name, help_text, label_names)
+        self.metrics.append(metric)
+        return metric
+    
+    def histogram(self, name, help_text, label_names=(), buckets=DURATION_BUCKETS):
+        metric = Histogram(name, help_text, label_names, buckets)
+        self.metrics.append(metric)
+        return metric
+    
+    def collect(self):
+        # Plain lists and dicts, so another process can publish them as JSON
+        return [metric.collect() for metric in self.metrics]
+
+def format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def render(collections):
+    # Prometheus text exposition of [(process label or None, registry.collect()), ...]; families
+    # of the same name from several processes are written once, told apart by a process label
+    families = {}
+    for process, collected in collections:
+        for family in collected:
+            merged = families.setdefault(family['name'], {'type': family['type'], 'help': family['help'], 'samples': []})
+            for name, labels, value in family['samples']:
+                if process is not None:
+                    labels = dict(labels, process=process)
+                merged['samples'].append((name, labels, value))
+    
+    lines = []
+    for name, family in families.items():
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for sample_name, labels, value in family['samples']:
+            if labels:
+                label_text = ','.join(f'{key}="{escape_label(label)}"' for key, label in labels.items())
+                lines.append(f"{sample_name}{{{label_text}}} {format_value(value)}")
+            else:
+                lines.append(f"{sample_name} {format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+class SlowRequestProfiler:
+    # Runs cProfile on a sample_rate fraction of requests and writes the profile of any that
+    # took threshold seconds or more to directory, for `python3 -m pstats` or snakeviz. One
+    # request is profiled at a time, so the overhead stays bounded under load.
+    def __init__(self, threshold=None, sample_rate=0.01, directory=None, keep=PROFILES_KEPT):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.directory = Path(directory) if directory else None
+        self.keep = keep
+        self.lock = threading.Lock()
+    
+    @property
+    def enabled(self):
+        return self.threshold is not None and self.directory is not None
+    
+    def start(self):
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        if not self.lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+    
+    def finish(self, profile, elapsed, name):
+        try:
+            profile.disable()
+            if elapsed < self.threshold:
+                return None
+            self.directory.mkdir(parents=True, exist_ok=True)
+            safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') or 'request'
+            path = self.directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{elapsed * 1000:.0f}ms-{safe_name}.prof"
+            profile.dump_stats(path)
+            logger.warning(f"Profiled slow request {name} ({elapsed * 1000:.0f} ms) to {path}")
+            self.prune()
+            return path
+        except Exception as e:
+            logger.error(f"Error saving request profile: {e}")
+            return None
+        finally:
+            self.lock.release()
+    
+    def prune(self):
+        profiles = sorted(self.directory.glob('*.prof'), key=lambda path: path.stat().st_mtime)
+        for path in profiles[:-self.keep]:
+            path.unlink(missing_ok=True)
+
+# Every module registers its metrics here; server.py exposes them at /api/metrics
+registry = MetricsRegistry()
+
+feed_fetch_seconds = registry.histogram('transit_feed_fetch_seconds', "Time to poll a realtime feed, by outcome",
+                                        ('agency', 'feed', 'status'))
+feed_bytes = registry.histogram('transit_feed_bytes', "Size of realtime feed bodies received", ('agency', 'feed'),
+                                SIZE_BUCKETS)
+realtime_stage_seconds = registry.histogram('transit_realtime_stage_seconds',
+                                            "Time spent in each stage of ingesting a realtime feed", ('stage',))
+static_load_seconds = registry.histogram('transit_static_load_seconds', "Time spent in each phase of loading the static feed",
+                                         ('phase',))
+response_build_seconds = registry.histogram('transit_response_build_seconds',
+                                            "Time to build, serialize and compress a cached static response", ('kind',))
+http_request_seconds = registry.histogram('transit_http_request_seconds', "Time to handle a request, by route",
+                                          ('endpoint',))
+http_response_bytes = registry.histogram('transit_http_response_bytes', "Size of response bodies, by route", ('endpoint',),
+                                         SIZE_BUCKETS)
+http_requests = registry.counter('transit_http_requests', "Requests handled, by route and status", ('endpoint', 'status'))
+profiled_requests = registry.counter('transit_profiled_requests', "Sampled requests run under cProfile")
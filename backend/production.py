@@ -0,0 +1,201 @@
+# hamilton-transit-map/backend/production.py
+#
+# Production entry point: WORKERS processes (default one per core) serve the Flask app from one
+# shared listening socket, and a single fetcher process polls the realtime feeds, keeps the
+# archive and the /api/stream push server, and publishes each update to the workers through
+# snapshot files on tmpfs (realtime_channel.py). The static feed is loaded once, before the
+# processes are forked, from the memory-mapped snapshot every process then shares.
+#
+# With several agencies configured (AGENCIES_FILE), each worker touches a mark file in the
+# channel directory for the agencies its requests use, and the fetcher only polls agencies
+# marked within the idle timeout. Agencies loaded after the fork are loaded by each process
+# that uses them, from the snapshot whichever loaded first wrote.
+#
+#   WORKERS=4 PORT=8000 python3 backend/production.py
+import gc
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import threading
+import time
+from multiprocessing.connection import wait
+from werkzeug.serving import WSGIRequestHandler, make_server
+from agencies import FeedScheduler
+from realtime_channel import ChannelPublisher, ChannelSubscriber, create_channel_directory
+import server
+
+logger = logging.getLogger(__name__)
+
+# A process that keeps dying is restarted no more often than this
+RESTART_DELAY = 1.0
+# How often the fetcher publishes its metrics for the workers' /api/metrics
+METRICS_INTERVAL = 5.0
+# How often workers mark the agencies they have served, and the fetcher reads the marks
+ACTIVITY_INTERVAL = 1.0
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    # Werkzeug answers HTTP/1.0 and closes every connection unless told otherwise
+    protocol_version = 'HTTP/1.1'
+    
+    def setup(self):
+        # Headers and body go out as separate writes; without this a kept-alive connection
+        # waits on the client's delayed ACK before every body
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super().setup()
+
+def reset_signals():
+    # Children stop on SIGTERM from the supervisor; Ctrl-C is left to the supervisor too
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def publishing_jobs(publisher):
+    # The server's feed jobs, publishing each update for the workers
+    publishers = {'vehicle_positions': server.publish_bus_data, 'trip_updates': server.publish_predictions}
+    
+    def publishing(ingest, publish):
+        def poll(agency):
+            if ingest(agency):
+                publish(publisher, agency)
+        return poll
+    
+    return {name: (publishing(ingest, publishers[name]), feed) for name, (ingest, feed) in server.feed_jobs.items()}
+
+def activity_path(channel_dir, agency):
+    return channel_dir / f"{agency.agency_id}.active"
+
+def report_activity(channel_dir):
+    reported = {}
+    while True:
+        for agency in server.agencies:
+            if agency.last_used > reported.get(agency.agency_id, 0):
+                activity_path(channel_dir, agency).touch()
+                reported[agency.agency_id] = agency.last_used
+        time.sleep(ACTIVITY_INTERVAL)
+
+def follow_activity(channel_dir):
+    while True:
+        for agency in server.agencies:
+            try:
+                agency.touch(activity_path(channel_dir, agency).stat().st_mtime)
+            except FileNotFoundError:
+                pass
+        time.sleep(ACTIVITY_INTERVAL)
+
+def refresh_static_data(publisher):
+    while True:
+        time.sleep(server.static_refresh_interval)
+        for agency in server.agencies.loaded():
+            if agency.parser.refresh_static_data():
+                logger.info(f"Switched to the updated GTFS static feed of {agency.agency_id}")
+                server.publish_static_data(publisher, agency)
+
+def report_metrics(publisher):
+    while True:
+        server.publish_metrics(publisher)
+        time.sleep(METRICS_INTERVAL)
+
+def run_fetcher(channel_dir):
+    reset_signals()
+    publisher = ChannelPublisher(channel_dir)
+    feed_scheduler = FeedScheduler(server.agencies, publishing_jobs(publisher))
+    threads = [
+        threading.Thread(target=feed_scheduler.run, daemon=True),
+        threading.Thread(target=follow_activity, daemon=True, args=(channel_dir,)),
+        threading.Thread(target=refresh_static_data, daemon=True, args=(publisher,)),
+        threading.Thread(target=report_metrics, daemon=True, args=(publisher,))
+    ]
+    for thread in threads:
+        thread.start()
+    server.agencies.watch_idle(server.push_server.has_subscribers)
+    server.push_server.start()
+    for thread in threads:
+        thread.join()
+
+def run_worker(listener, channel_dir):
+    reset_signals()
+    server.metrics_process = multiprocessing.current_process().name
+    subscriber = ChannelSubscriber(channel_dir, server.channel_handlers())
+    subscriber.poll()
+    subscriber.watch()
+    threading.Thread(target=server.prewarm_all_tiles, daemon=True).start()
+    threading.Thread(target=report_activity, daemon=True, args=(channel_dir,)).start()
+    server.agencies.watch_idle()
+    
+    http_server = make_server(listener.getsockname()[0], 0, server.app, threaded=True,
+                              request_handler=KeepAliveRequestHandler, fd=listener.fileno())
+    http_server.serve_forever()
+
+class Supervisor:
+    # Starts the fetcher and the workers as forked children and restarts any that exit
+    def __init__(self, workers, listener, channel_dir):
+        self.workers = workers
+        self.listener = listener
+        self.channel_dir = channel_dir
+        self.context = multiprocessing.get_context('fork')
+        self.processes = {}
+        self.stopping = False
+    
+    def start_process(self, name):
+        if name == 'fetcher':
+            process = self.context.Process(target=run_fetcher, args=(self.channel_dir,), name=name, daemon=True)
+        else:
+            process = self.context.Process(target=run_worker, args=(self.listener, self.channel_dir), name=name,
+                                           daemon=True)
+        process.start()
+        self.processes[name] = process
+        logger.info(f"Started {name} (pid {process.pid})")
+    
+    def run(self):
+        self.start_process('fetcher')
+        for i in range(self.workers):
+            self.start_process(f"worker-{i}")
+        
+        while not self.stopping:
+            sentinels = {process.sentinel: name for name, process in self.processes.items()}
+            for sentinel in wait(list(sentinels), timeout=1.0):
+                name = sentinels[sentinel]
+                if self.stopping:
+                    break
+                logger.warning(f"{name} exited with code {self.processes[name].exitcode}, restarting")
+                time.sleep(RESTART_DELAY)
+                self.start_process(name)
+    
+    def stop(self, *args):
+        self.stopping = True
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout=5)
+
+def main():
+    workers = int(os.environ.get('WORKERS', os.cpu_count() or 1))
+    host = os.environ.get('HOST', '0.0.0.0')
+    port = int(os.environ.get('PORT', 8000))
+    # Request lines at INFO from every worker would cost more than some of the requests
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    
+    listener = socket.create_server((host, port), backlog=1024)
+    channel_dir = create_channel_directory()
+    
+    # The static feed and everything else built by importing server is already in memory;
+    # frozen objects are left out of collections, so the workers' copy-on-write pages of
+    # them are not dirtied by the collector
+    gc.freeze()
+    
+    supervisor = Supervisor(workers, listener, channel_dir)
+    signal.signal(signal.SIGTERM, lambda *args: supervisor.stop())
+    logger.info(f"Serving on {host}:{listener.getsockname()[1]} with {workers} workers")
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+        shutil.rmtree(channel_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
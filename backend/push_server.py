@@ -0,0 +1,199 @@
+# hamilton-transit-map/backend/push_server.py
+import asyncio
+import json
+import logging
+import threading
+import time
+import traceback
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_INTERVAL = 15
+# A viewer this far behind is disconnected; EventSource reconnects with Last-Event-ID and
+# catches up with a single delta
+MAX_BUFFERED_BYTES = 256 * 1024
+
+STREAM_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/event-stream\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"Connection: keep-alive\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"\r\n"
+    b"retry: 5000\n\n"
+)
+NOT_FOUND = b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+class Subscriber:
+    __slots__ = ('writer', 'agency', 'route_id', 'route_short_name', 'version')
+    
+    def __init__(self, writer, agency, route_id, route_short_name, version):
+        self.writer = writer
+        self.agency = agency
+        self.route_id = route_id
+        self.route_short_name = route_short_name
+        self.version = version
+
+class PushServer:
+    # Server-Sent Events served from one asyncio loop, so a viewer costs a socket and a
+    # Subscriber rather than a thread. ingest_bus_data calls notify(agency) after each publish;
+    # every subscriber group of that agency (last version seen, route) gets one delta,
+    # serialized once. resolve(agency_id) returns the agency a viewer asked for (anything with
+    # bus_history and get_route_short_name), or None; it may block, so it runs off the loop.
+    def __init__(self, resolve, host='0.0.0.0', port=8001):
+        self.resolve = resolve
+        self.host = host
+        self.port = port
+        self.subscribers = {}
+        self.loop = None
+        self.server = None
+        self.ready = threading.Event()
+    
+    @property
+    def running(self):
+        return self.server is not None
+    
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        self.ready.wait()
+        return self
+    
+    def run(self):
+        try:
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self.handle, self.host, self.port, backlog=1024))
+            self.port = self.server.sockets[0].getsockname()[1]
+            self.loop.create_task(self.keepalive())
+            logger.info(f"Streaming vehicle positions on port {self.port}")
+        except Exception as e:
+            logger.error(f"Error starting push server: {e}")
+            traceback.print_exc()
+            self.server = None
+            return
+        finally:
+            self.ready.set()
+        self.loop.run_forever()
+    
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+    
+    @property
+    def subscriber_count(self):
+        return sum(len(subscribers) for subscribers in self.subscribers.values())
+    
+    def has_subscribers(self, agency):
+        return bool(self.subscribers.get(agency))
+    
+    def notify(self, agency):
+        if self.running:
+            self.loop.call_soon_threadsafe(self.broadcast, agency)
+    
+    def broadcast(self, agency):
+        subscribers = list(self.subscribers.get(agency, ()))
+        if not subscribers:
+            return
+        start = time.perf_counter()
+        events = {}
+        for subscriber in subscribers:
+            self.send_delta(subscriber, events)
+        logger.info(f"Pushed version {agency.bus_history.version} to {len(subscribers)} subscribers "
+                    f"({len(events)} distinct deltas) in {(time.perf_counter() - start) * 1000:.1f} ms")
+    
+    def send_delta(self, subscriber, events):
+        key = (subscriber.version, subscriber.route_id)
+        event = events.get(key)
+        if event is None:
+            delta = subscriber.agency.bus_history.delta(subscriber.version, subscriber.route_id,
+                                                        subscriber.route_short_name)
+            data = json.dumps(delta, separators=(',', ':'))
+            event = (delta['version'], f"id: {delta['version']}\nevent: delta\ndata: {data}\n\n".encode('utf-8'))
+            events[key] = event
+        
+        version, payload = event
+        if version == subscriber.version:
+            return
+        
+        transport = subscriber.writer.transport
+        if transport.is_closing():
+            return
+        if transport.get_write_buffer_size() > MAX_BUFFERED_BYTES:
+            logger.warning("Dropping a push subscriber that stopped reading")
+            transport.abort()
+            return
+        
+        subscriber.writer.write(payload)
+        subscriber.version = version
+    
+    async def keepalive(self):
+        # Comment lines keep proxies and idle-timeouts from closing quiet streams
+        while True:
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+            for subscribers in list(self.subscribers.values()):
+                for subscriber in list(subscribers):
+                    if not subscriber.writer.transport.is_closing():
+                        subscriber.writer.write(b": keepalive\n\n")
+    
+    async def read_request(self, reader):
+        request_line = await reader.readline()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        return method, target, headers
+    
+    async def handle(self, reader, writer):
+        try:
+            method, target, headers = await self.read_request(reader)
+        except (ValueError, ConnectionError):
+            writer.close()
+            return
+        
+        url = urlsplit(target)
+        if method != 'GET' or url.path != '/api/stream':
+            writer.write(NOT_FOUND)
+            writer.close()
+            return
+        
+        query = parse_qs(url.query)
+        # The first stream for an agency nobody is using loads its static feed
+        agency = await self.loop.run_in_executor(None, self.resolve, query.get('agency', [None])[0])
+        if agency is None:
+            writer.write(NOT_FOUND)
+            writer.close()
+            return
+        route_id = query.get('route_id', [None])[0]
+        # A reconnecting EventSource resumes from the last event id it received
+        since = headers.get('last-event-id') or query.get('since', ['0'])[0]
+        try:
+            since = int(since)
+        except ValueError:
+            since = 0
+        
+        route_short_name = agency.get_route_short_name(route_id) if route_id else None
+        subscriber = Subscriber(writer, agency, route_id, route_short_name, since)
+        writer.write(STREAM_HEADERS)
+        if agency not in self.subscribers:
+            self.subscribers[agency] = set()
+        self.subscribers[agency].add(subscriber)
+        self.send_delta(subscriber, {})
+        
+        try:
+            # Viewers never send anything after the request; this returns when they disconnect
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers[agency].discard(subscriber)
+            if not self.subscribers[agency]:
+                del self.subscribers[agency]
+            writer.close()
@@ -0,0 +1,105 @@
+# hamilton-transit-map/backend/realtime_channel.py
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import traceback
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_MAGIC = b'HTMRTCH\0'
+PREAMBLE = struct.Struct('<8sI')
+# How often workers look for a newly published snapshot
+WATCH_INTERVAL = 0.2
+
+def create_channel_directory():
+    # On tmpfs where there is one, so published snapshots are shared memory and never hit the disk
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    return Path(tempfile.mkdtemp(prefix='hamilton-transit-', dir=base))
+
+class ChannelPublisher:
+    # Publishes named snapshots (JSON metadata plus raw byte sections) for other processes to
+    # map. Each snapshot is written beside its file and renamed over it, so a reader only ever
+    # maps a complete snapshot and keeps the one it has mapped until it moves on.
+    def __init__(self, directory):
+        self.directory = Path(directory)
+    
+    def publish(self, name, metadata, sections=None):
+        sections = sections or {}
+        header = dict(metadata)
+        header['sections'] = {}
+        offset = 0
+        for section_name, data in sections.items():
+            header['sections'][section_name] = [offset, len(data)]
+            offset += len(data)
+        header_bytes = json.dumps(header).encode('utf-8')
+        
+        path = self.directory / f"{name}.bin"
+        tmp_path = path.with_name(f"{name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(PREAMBLE.pack(CHANNEL_MAGIC, len(header_bytes)))
+            f.write(header_bytes)
+            for data in sections.values():
+                f.write(data)
+        os.replace(tmp_path, path)
+
+class PublishedSnapshot:
+    def __init__(self, f):
+        stat = os.fstat(f.fileno())
+        self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = PREAMBLE.unpack_from(self.mapped)
+        if magic != CHANNEL_MAGIC:
+            raise ValueError("Not a realtime channel snapshot")
+        self.metadata = json.loads(self.mapped[PREAMBLE.size:PREAMBLE.size + header_length])
+        self.base = PREAMBLE.size + header_length
+    
+    def section(self, name, offset=0, length=None):
+        # A zero-copy view of a section, or of length bytes at offset within it
+        start, size = self.metadata['sections'][name]
+        length = size - offset if length is None else length
+        return memoryview(self.mapped)[self.base + start + offset:self.base + start + offset + length]
+
+class ChannelSubscriber:
+    # Follows the snapshots of a ChannelPublisher from another process, calling a handler with
+    # each new PublishedSnapshot of a name
+    def __init__(self, directory, handlers):
+        self.directory = Path(directory)
+        self.handlers = handlers
+        self.identities = {}
+    
+    def poll(self):
+        for name, handler in self.handlers.items():
+            path = self.directory / f"{name}.bin"
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == self.identities.get(name):
+                continue
+            
+            try:
+                with open(path, 'rb') as f:
+                    snapshot = PublishedSnapshot(f)
+                self.identities[name] = snapshot.identity
+                handler(snapshot)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.error(f"Error applying published {name} snapshot: {e}")
+                traceback.print_exc()
+    
+    def watch(self, interval=WATCH_INTERVAL):
+        def run():
+            while True:
+                self.poll()
+                time.sleep(interval)
+        
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
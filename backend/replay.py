@@ -0,0 +1,146 @@
+# hamilton-transit-map/backend/replay.py
+import logging
+import time
+from pathlib import Path
+from feed_fetcher import PollSchedule, iter_fields, read_feed_timestamp
+from gtfs_static_parser import GTFSStaticParser
+from gtfs_realtime_parser import GTFSRealtimeParser
+
+logger = logging.getLogger(__name__)
+
+# How long a feed with nothing left to play waits between polls
+FINISHED_POLL_INTERVAL = 60.0
+
+def feed_kind(data):
+    # 'vehicle_positions' or 'trip_updates', from the first entity carrying either (FeedEntity
+    # field 4 is a VehiclePosition, field 3 a TripUpdate); None for a feed with neither
+    for field, wire_type, start, value_start, value_end in iter_fields(data):
+        if field != 2 or wire_type != 2:
+            continue
+        for entity_field, _, _, _, _ in iter_fields(data, value_start, value_end):
+            if entity_field == 4:
+                return 'vehicle_positions'
+            if entity_field == 3:
+                return 'trip_updates'
+    return None
+
+def load_recordings(directory):
+    # The .pb files of a directory grouped by kind, each list ordered by header timestamp
+    recordings = {'vehicle_positions': [], 'trip_updates': []}
+    for path in sorted(Path(directory).glob('*.pb')):
+        data = path.read_bytes()
+        feed_timestamp = read_feed_timestamp(data)
+        kind = feed_kind(data)
+        if not feed_timestamp or kind is None:
+            logger.warning(f"Skipping recording {path.name}: no header timestamp or no vehicles/trip updates")
+            continue
+        recordings[kind].append((feed_timestamp, path))
+    for kind in recordings:
+        recordings[kind].sort()
+    return recordings
+
+class ReplayClock:
+    # Feed time, starting at the first recording and running speed times faster than the wall
+    # clock. With a speed of 0 the clock does not run on its own: each fetch plays the next
+    # recording straight away and moves the clock up to its timestamp.
+    def __init__(self, start, speed=1.0):
+        self.start = start
+        self.speed = speed
+        self.wall_start = time.time()
+        self.reached = start
+    
+    @property
+    def stepped(self):
+        return self.speed <= 0
+    
+    def time(self):
+        if self.stepped:
+            return self.reached
+        return self.start + (time.time() - self.wall_start) * self.speed
+    
+    def advance(self, feed_time):
+        self.reached = max(self.reached, feed_time)
+    
+    def wall_delay(self, feed_time):
+        # Real seconds until the clock reaches feed_time
+        if self.stepped:
+            return 0.0
+        return max(0.0, (feed_time - self.time()) / self.speed)
+
+class RecordedFeed:
+    # Stands in for FeedFetcher: fetch() returns each recording, in order, once the replay clock
+    # has reached its header timestamp, and None when nothing new is due. A replay that falls
+    # behind the clock plays the recordings it missed back to back rather than skipping them.
+    def __init__(self, recordings, clock, name='feed'):
+        self.recordings = recordings
+        self.timestamps = [feed_timestamp for feed_timestamp, path in recordings]
+        self.clock = clock
+        self.name = name
+        self.url = f"replay:{name}"
+        self.schedule = PollSchedule()
+        self.position = 0
+        self.feed_timestamp = None
+        self.status = None
+    
+    @property
+    def finished(self):
+        return self.position >= len(self.recordings)
+    
+    def fetch(self):
+        if self.finished:
+            self.status = 'finished'
+            return None
+        
+        feed_timestamp, path = self.recordings[self.position]
+        if self.clock.stepped:
+            self.clock.advance(feed_timestamp)
+        elif feed_timestamp > self.clock.time():
+            self.status = 'unchanged'
+            return None
+        
+        self.position += 1
+        self.feed_timestamp = feed_timestamp
+        self.status = 'updated'
+        self.schedule.record_update(feed_timestamp, self.clock.time())
+        if self.finished:
+            logger.info(f"Played the last of {len(self.recordings)} {self.name} recordings")
+        return path.read_bytes()
+    
+    def reset(self):
+        # The next fetch plays the last recording again
+        self.position = max(self.position - 1, 0)
+        self.feed_timestamp = None
+    
+    def next_delay(self):
+        if self.finished:
+            return FINISHED_POLL_INTERVAL
+        return self.clock.wall_delay(self.timestamps[self.position])
+    
+    def progress(self):
+        return {'played': self.position, 'recordings': len(self.recordings), 'feed_timestamp': self.feed_timestamp}
+
+def create_replay_parser(recordings_dir, static_zip, speed=1.0, data_dir=None, agency_id=None):
+    # A GTFSRealtimeParser that reads the static feed from static_zip and polls the recordings
+    # instead of the network. Its processed static snapshot and anything else written under
+    # data_dir are kept apart from the live server's.
+    if not static_zip or not Path(static_zip).exists():
+        raise ValueError(f"Replay needs a GTFS static zip, got {static_zip}")
+    recordings = load_recordings(recordings_dir)
+    timestamps = [feed_timestamp for kind in recordings.values() for feed_timestamp, path in kind]
+    if not timestamps:
+        raise ValueError(f"No GTFS-RT recordings found in {recordings_dir}")
+    clock = ReplayClock(min(timestamps), speed)
+    
+    pace = f"at {speed}x" if speed > 0 else "as fast as they are ingested"
+    logger.info(f"Replaying {len(recordings['vehicle_positions'])} vehicle position and "
+                f"{len(recordings['trip_updates'])} trip update recordings from {recordings_dir} {pace}")
+    
+    data_dir = Path(data_dir) if data_dir else Path(__file__).parent / "data" / "replay"
+    static_parser = GTFSStaticParser(data_dir=data_dir, static_zip_path=static_zip)
+    return GTFSRealtimeParser(
+        static_parser=static_parser,
+        vehicle_positions_feed=RecordedFeed(recordings['vehicle_positions'], clock, 'vehicle_positions'),
+        trip_updates_feed=RecordedFeed(recordings['trip_updates'], clock, 'trip_updates'),
+        clock=clock.time,
+        agency_id=agency_id
+    )
@@ -0,0 +1,96 @@
+# hamilton-transit-map/backend/response_cache.py
+import gzip
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, json, request
+from metrics import response_build_seconds
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry bookkeeping cost (key, CachedResponse, dict slot) counted against max_bytes
+ENTRY_OVERHEAD = 512
+
+class CachedResponse:
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.encodings = {'gzip': gzip.compress(body, compresslevel=9)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(body, quality=11)
+        self.size = len(body) + sum(len(data) for data in self.encodings.values()) + ENTRY_OVERHEAD
+    
+    def representation(self, accept_encodings):
+        # Each encoding is its own representation, so it gets its own strong ETag
+        for encoding in ('br', 'gzip'):
+            if encoding in self.encodings and accept_encodings[encoding]:
+                return encoding, self.encodings[encoding], f"{self.etag}-{encoding}"
+        return None, self.body, self.etag
+
+class StaticResponseCache:
+    # Serialized responses for endpoints that only change when the static feed is reloaded or
+    # the service day rolls over. Entries belong to one ServiceWindow of one StaticDataset;
+    # seeing a different one drops them all.
+    # With max_bytes set, the least recently used entries are evicted to stay under it.
+    def __init__(self, max_bytes=None):
+        self.dataset = None
+        self.entries = OrderedDict()
+        self.size = 0
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+    
+    @property
+    def is_full(self):
+        return self.max_bytes is not None and self.size >= self.max_bytes
+    
+    def get(self, dataset, key, build):
+        with self.lock:
+            if dataset is not self.dataset:
+                self.dataset = dataset
+                self.entries = OrderedDict()
+                self.size = 0
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        
+        if entry is None:
+            start = time.perf_counter()
+            entry = CachedResponse((json.dumps(build(), separators=(',', ':')) + '\n').encode('utf-8'))
+            response_build_seconds.observe(time.perf_counter() - start, key[0])
+            with self.lock:
+                if dataset is self.dataset:
+                    if key in self.entries:
+                        entry = self.entries[key]
+                    else:
+                        self.entries[key] = entry
+                        self.size += entry.size
+                        self.evict()
+            logger.debug(f"Cached response for {key} ({len(entry.body)} bytes)")
+        return entry
+    
+    def evict(self):
+        while self.max_bytes is not None and self.size > self.max_bytes and len(self.entries) > 1:
+            key, entry = self.entries.popitem(last=False)
+            self.size -= entry.size
+    
+    def respond(self, dataset, key, build):
+        entry = self.get(dataset, key, build)
+        encoding, body, etag = entry.representation(request.accept_encodings)
+        
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/json')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
@@ -1,12 +1,27 @@
 # hamiton-transit-map/backend/server.py
-from flask import Flask, jsonify, send_from_directory, request
+from flask import Flask, Response, jsonify, send_from_directory, request, g
 from flask_cors import CORS
 import os
 import time
 import threading
 import logging
 import webbrowser
-from gtfs_realtime_parser import GTFSRealtimeParser
+import math
+import pickle
+import hashlib
+from functools import partial
+from agencies import AgencyRegistry, FeedScheduler, load_agency_configs
+from shape_encoding import SHAPE_FORMATS, level_for_zoom
+from spatial_index import parse_bbox
+from trip_updates import PublishedPredictions, MAX_ARRIVALS
+from vehicle_archive import RETENTION_DAYS, MAX_POLL_TIME
+from replay import create_replay_parser
+from push_server import PushServer
+from vector_tiles import MIN_TILE_ZOOM, MAX_TILE_ZOOM, is_valid_tile, tiles_covering, parse_zoom_range
+from metrics import (
+    SlowRequestProfiler, registry, render, realtime_stage_seconds, http_request_seconds, http_response_bytes,
+    http_requests, profiled_requests
+)
 
 app = Flask(__name__, static_folder='../frontend')
 CORS(app)
@@ -14,31 +29,247 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-parser = GTFSRealtimeParser()
-bus_data = []
-last_update = 0
-update_interval = 60
+# AGENCIES_FILE names a JSON list of the agencies to serve side by side (see agencies.py);
+# without one only Hamilton is served. Every /api endpoint takes ?agency=, default the first.
+agency_configs = load_agency_configs(os.environ.get('AGENCIES_FILE'))
+# REPLAY_DIR (recorded .pb files) and REPLAY_STATIC_ZIP play recorded feeds back instead of
+# polling the default agency's, REPLAY_SPEED times faster than real time (0: as fast as possible)
+replay_dir = os.environ.get('REPLAY_DIR')
 
-def update_bus_data():
-    global bus_data, last_update
+def create_parser(config):
+    if replay_dir and config is agency_configs[0]:
+        return create_replay_parser(replay_dir, os.environ.get('REPLAY_STATIC_ZIP'),
+                                    speed=float(os.environ.get('REPLAY_SPEED', 1)),
+                                    data_dir=os.environ.get('REPLAY_DATA_DIR'), agency_id=config.agency_id)
+    return config.create_parser()
+
+# Each agency keeps its own vehicle snapshots, predictions, archive and response caches.
+# ARCHIVE_RETENTION_DAYS=0 turns the history archive off.
+agencies = AgencyRegistry(agency_configs, create_parser,
+                          tile_cache_bytes=int(os.environ.get('TILE_CACHE_MB', 64)) * 1024 * 1024,
+                          retention_days=int(os.environ.get('ARCHIVE_RETENTION_DAYS', RETENTION_DAYS)))
+
+def stream_agency(agency_id):
+    agency = agencies.get(agency_id)
+    return agency.activate() if agency else None
+
+push_server = PushServer(stream_agency, port=int(os.environ.get('PUSH_PORT', 8001)))
+# In a production.py worker, the metrics last published by the fetcher process
+published_metrics = None
+# production.py names each process, which /api/metrics adds as a label
+metrics_process = None
+# PROFILE_SLOW_REQUESTS_MS=500 runs cProfile on PROFILE_SAMPLE_RATE (default 1%) of requests and
+# keeps the profiles of those that took at least that long under data/profiles
+profile_threshold_ms = os.environ.get('PROFILE_SLOW_REQUESTS_MS')
+profiler = SlowRequestProfiler(threshold=float(profile_threshold_ms) / 1000 if profile_threshold_ms else None,
+                               sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0.01)),
+                               directory=agencies.default.parser.static_parser.data_dir / 'profiles')
+static_refresh_interval = 6 * 60 * 60
+max_nearest_stops = 100
+max_history_range = 7 * 24 * 60 * 60
+# e.g. TILE_PREWARM_ZOOMS=11-14 builds every tile over the network at those zooms on startup
+tile_prewarm_zooms = parse_zoom_range(os.environ.get('TILE_PREWARM_ZOOMS', ''))
+# Flask routes that do not serve a single agency's data
+agency_independent_endpoints = {'get_agencies', 'get_metrics'}
+
+def ingest_bus_data(agency=None):
+    # One poll of an agency's vehicle feed; replay benchmarks call this directly
+    agency = agency or agencies.default
+    parser = agency.parser
+    try:
+        columns = parser.poll_vehicle_positions()
+        if columns is None:
+            logger.debug(f"Vehicle positions of {agency.agency_id} not republished ({parser.vehicle_positions_feed.status})")
+        elif len(columns):
+            with realtime_stage_seconds.time('records'):
+                buses = columns.records()
+            # Serialized once per poll, straight from the decoded columns
+            with realtime_stage_seconds.time('serialize'):
+                body = columns.to_json().encode('utf-8')
+            snapshot = agency.bus_history.publish(buses, parser.index_buses_by_route(buses), body, parser.clock(),
+                                                  columns.feed_timestamp)
+            push_server.notify(agency)
+            if agency.vehicle_archive.enabled:
+                with realtime_stage_seconds.time('archive'):
+                    agency.vehicle_archive.append(columns.feed_timestamp or int(snapshot.last_update), columns)
+            logger.info(f"Updated {len(buses)} {agency.agency_id} bus positions (version {snapshot.version})")
+            return True
+        else:
+            logger.warning(f"Failed to get new {agency.agency_id} bus positions - no data returned")
+    except Exception as e:
+        logger.error(f"Error updating {agency.agency_id} bus data: {e}")
+    return False
+
+def ingest_trip_updates(agency=None):
+    agency = agency or agencies.default
+    parser = agency.parser
+    try:
+        binary_data = parser.poll_trip_updates()
+        if binary_data is None:
+            logger.debug(f"Trip updates of {agency.agency_id} not republished ({parser.trip_updates_feed.status})")
+        else:
+            trip_predictions = agency.trip_predictions
+            with realtime_stage_seconds.time('predictions') as timer:
+                changed, removed = trip_predictions.update(binary_data, parser.static_dataset, parser.clock())
+            logger.info(f"Updated {agency.agency_id} predictions for {changed} trips, removed {removed} "
+                        f"({len(trip_predictions.trips)} trips, {timer.elapsed:.2f}s)")
+            return True
+    except Exception as e:
+        logger.error(f"Error updating {agency.agency_id} trip updates: {e}")
+    return False
+
+# Polled for every active agency by a FeedScheduler: name -> (poll(agency), feed(agency))
+feed_jobs = {
+    'vehicle_positions': (ingest_bus_data, lambda agency: agency.parser.vehicle_positions_feed),
+    'trip_updates': (ingest_trip_updates, lambda agency: agency.parser.trip_updates_feed)
+}
+
+# production.py runs the ingest loops in one fetcher process, which publishes what they
+# produce through a ChannelPublisher; each worker process applies it with the apply_* functions.
+# Channels are named after the agency, e.g. hsr.vehicles.
+def publish_bus_data(publisher, agency):
+    snapshot = agency.bus_history.latest
+    publisher.publish(f"{agency.agency_id}.vehicles", {
+        'version': snapshot.version,
+        'etag': snapshot.etag,
+        'last_update': snapshot.last_update,
+        'feed_timestamp': snapshot.feed_timestamp,
+        'feed_status': feed_status(agency)
+    }, {
+        'body': snapshot.body,
+        'buses': pickle.dumps(snapshot.buses, protocol=pickle.HIGHEST_PROTOCOL)
+    })
+
+def apply_bus_data(agency, published):
+    metadata = published.metadata
+    buses = pickle.loads(published.section('buses'))
+    agency.bus_history.publish(buses, agency.parser.index_buses_by_route(buses), bytes(published.section('body')),
+                               metadata['last_update'], metadata['feed_timestamp'],
+                               version=metadata['version'], etag=metadata['etag'])
+    agency.published_feed_status = metadata['feed_status']
+
+def publish_predictions(publisher, agency):
+    trip_predictions = agency.trip_predictions
+    offsets, data = trip_predictions.export_by_stop()
+    publisher.publish(f"{agency.agency_id}.predictions", {
+        'feed_timestamp': trip_predictions.feed_timestamp,
+        'stops': offsets,
+        'feed_status': feed_status(agency)
+    }, {'departures': data})
+
+def apply_predictions(agency, snapshot):
+    agency.trip_predictions = PublishedPredictions(snapshot.metadata['stops'],
+                                                   lambda offset, length: snapshot.section('departures', offset, length),
+                                                   snapshot.metadata['feed_timestamp'])
+    agency.published_feed_status = snapshot.metadata['feed_status']
+
+def publish_metrics(publisher):
+    publisher.publish('metrics', {'families': registry.collect()})
+
+def apply_metrics(snapshot):
+    global published_metrics
+    published_metrics = snapshot.metadata['families']
+
+def publish_static_data(publisher, agency):
+    publisher.publish(f"{agency.agency_id}.static", {'refreshed': time.time()})
+
+def apply_static_data(agency, snapshot):
+    # The fetcher has refreshed the static feed and written its snapshot; mapping it is cheap.
+    # An agency this worker has not loaded reads the new snapshot when it is first used.
+    if not agency.loaded:
+        return
+    agency.parser.static_parser.reload_static_data()
+    logger.info(f"Switched to the updated GTFS static feed of {agency.agency_id}")
+    prewarm_tiles(agency)
+
+def channel_handlers():
+    # What a production.py worker applies from each channel. Vehicles and predictions are
+    # joined with the static dataset, so for an agency not loaded here only the latest of
+    # each is kept, and applied when a request loads it.
+    handlers = {'metrics': apply_metrics}
+    for agency in agencies:
+        handlers[f"{agency.agency_id}.vehicles"] = partial(agency.when_loaded, 'vehicles', apply_bus_data)
+        handlers[f"{agency.agency_id}.predictions"] = partial(agency.when_loaded, 'predictions', apply_predictions)
+        handlers[f"{agency.agency_id}.static"] = partial(apply_static_data, agency)
+    return handlers
+
+def refresh_static_data():
     while True:
-        try:
-            new_data = parser.get_vehicle_positions()
-            if new_data:
-                bus_data = new_data
-                last_update = time.time()
-                logger.info(f"Updated {len(bus_data)} bus positions")
-            else:
-                logger.warning("Failed to get new bus positions - no data returned")
-        except Exception as e:
-            logger.error(f"Error updating bus data: {e}")
-        
-        time.sleep(update_interval)
+        time.sleep(static_refresh_interval)
+        # Agencies that are not loaded read the latest feed when they are next used
+        for agency in agencies.loaded():
+            if agency.parser.refresh_static_data():
+                logger.info(f"Switched to the updated GTFS static feed of {agency.agency_id}")
+                prewarm_tiles(agency)
+
+def prewarm_tiles(agency):
+    dataset = agency.parser.static_dataset
+    window = dataset.service_window()
+    tile_responses = agency.tile_responses
+    bounds = dataset.get_network_bounds()
+    if not tile_prewarm_zooms or bounds is None:
+        return
+    
+    start = time.time()
+    count = 0
+    for zoom in tile_prewarm_zooms:
+        for z, x, y in tiles_covering(bounds, zoom):
+            if tile_responses.is_full:
+                logger.warning(f"Tile cache of {agency.agency_id} is full, stopped pre-warming at zoom {zoom}")
+                return
+            tile_responses.get(window, ('tile', z, x, y), lambda: dataset.get_tile(z, x, y))
+            count += 1
+    logger.info(f"Pre-warmed {count} {agency.agency_id} tiles in {time.time() - start:.1f}s "
+                f"({tile_responses.size // 1024} KB)")
+
+def prewarm_all_tiles():
+    # Only preloaded agencies are warmed on startup; the rest build tiles as they are requested
+    for agency in agencies:
+        if agency.pinned:
+            prewarm_tiles(agency)
 
 def open_browser():
     time.sleep(1.5)
     webbrowser.open('http://localhost:8000')
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.profile = profiler.start()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    http_request_seconds.observe(time.perf_counter() - g.request_start, endpoint)
+    http_requests.inc(endpoint, str(response.status_code))
+    if response.content_length is not None:
+        http_response_bytes.observe(response.content_length, endpoint)
+    return response
+
+@app.teardown_request
+def finish_request_profile(exc):
+    # Runs even when the handler raised, so the profiler is always released
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiled_requests.inc()
+        profiler.finish(profile, time.perf_counter() - g.request_start, f"{request.method} {request.path}")
+
+@app.before_request
+def resolve_agency():
+    # Using an agency marks it active, and the first request for an idle one loads its static feed
+    g.agency = None
+    if not request.url_rule or not request.url_rule.rule.startswith('/api/'):
+        return None
+    if request.endpoint in agency_independent_endpoints:
+        return None
+    
+    agency_id = request.args.get('agency')
+    agency = agencies.get(agency_id)
+    if agency is None:
+        return jsonify({'error': f"Unknown agency {agency_id}", 'agencies': [known.agency_id for known in agencies]}), 404
+    g.agency = agency.activate()
+    return None
+
 @app.route('/')
 def index():
     return send_from_directory(app.static_folder, 'index.html')
@@ -47,70 +278,216 @@ def index():
 def static_files(path):
     return send_from_directory(app.static_folder, path)
 
+def snapshot_response(snapshot, response, variant=None):
+    # Every response built from a snapshot names its version, and its ETag is the snapshot's
+    # (plus the variant of the request), so clients can revalidate with If-None-Match. The
+    # variant carries request arguments, so it is hashed to keep quotes and the like out of it.
+    if variant:
+        response.set_etag(f"{snapshot.etag}-{hashlib.sha1(variant.encode('utf-8')).hexdigest()}")
+    else:
+        response.set_etag(snapshot.etag)
+    response.headers['X-Snapshot-Version'] = str(snapshot.version)
+    return response.make_conditional(request)
+
 @app.route('/api/buses')
 def get_buses():
     route_id = request.args.get('route_id')
+    since = request.args.get('since', type=int)
+    agency = g.agency
+    bus_history = agency.bus_history
+    snapshot = bus_history.latest
+    
+    # Clients that pass the version they last saw get only the vehicles that changed
+    if since is not None:
+        route_short_name = agency.get_route_short_name(route_id) if route_id else None
+        delta = bus_history.delta(since, route_id, route_short_name, latest=snapshot)
+        return snapshot_response(snapshot, jsonify(delta), f"since-{since}-{route_id or ''}")
     
     if route_id:
-        route_short_name = None
-        for rid, route_info in parser.route_data.items():
-            if rid == route_id:
-                route_short_name = route_info.get('route_short_name')
-                break
-        
-        if route_short_name:
-            filtered_buses = []
-            for bus in bus_data:
-                bus_route_id = bus.get('route_id')
-                if bus_route_id in parser.route_data:
-                    if parser.route_data[bus_route_id].get('route_short_name') == route_short_name:
-                        filtered_buses.append(bus)
-            return jsonify(filtered_buses)
-        else:
-            filtered_buses = [bus for bus in bus_data if bus.get('route_id') == route_id]
-            return jsonify(filtered_buses)
+        route_short_name = agency.get_route_short_name(route_id)
+        return snapshot_response(snapshot, jsonify(snapshot.buses_by_route.get_buses(route_id, route_short_name)),
+                                 f"route-{route_id}")
     
-    if not bus_data:
+    if not snapshot.buses:
         return jsonify([]), 404
-    return jsonify(bus_data)
+    return snapshot_response(snapshot, Response(snapshot.body, mimetype='application/json'))
+
+@app.route('/api/history')
+def get_history():
+    agency = g.agency
+    vehicle_archive = agency.vehicle_archive
+    if not vehicle_archive.enabled:
+        return jsonify({'error': "History is disabled"}), 404
+    
+    vehicle_id = request.args.get('vehicle_id')
+    start = request.args.get('from', type=int)
+    end = request.args.get('to', int(agency.parser.clock()), type=int)
+    if not vehicle_id or start is None:
+        return jsonify({'error': "vehicle_id and from are required"}), 400
+    if not (0 <= start <= MAX_POLL_TIME and 0 <= end <= MAX_POLL_TIME):
+        return jsonify({'error': f"from and to must be Unix times between 0 and {MAX_POLL_TIME}"}), 400
+    if end < start or end - start > max_history_range:
+        return jsonify({'error': f"from..to must be a range of at most {max_history_range} seconds"}), 400
+    
+    return jsonify({
+        'vehicle_id': vehicle_id,
+        'from': start,
+        'to': end,
+        'positions': vehicle_archive.vehicle_history(vehicle_id, start, end)
+    })
+
+@app.route('/api/history/snapshot')
+def get_history_snapshot():
+    agency = g.agency
+    vehicle_archive = agency.vehicle_archive
+    if not vehicle_archive.enabled:
+        return jsonify({'error': "History is disabled"}), 404
+    
+    t = request.args.get('t', type=int)
+    if t is None:
+        return jsonify({'error': "t is required"}), 400
+    if not 0 <= t <= MAX_POLL_TIME:
+        return jsonify({'error': f"t must be a Unix time between 0 and {MAX_POLL_TIME}"}), 400
+    
+    poll_time, buses = vehicle_archive.snapshot(t)
+    route_data = agency.parser.route_data
+    for bus in buses:
+        route_info = route_data.get(bus['route_id'], {})
+        bus['route_short_name'] = route_info.get('route_short_name', bus['route_id'] or 'Unknown')
+        bus['route_color'] = route_info.get('route_color', '#FF0000')
+    return jsonify({'t': t, 'poll_time': poll_time, 'buses': buses})
 
 @app.route('/api/stops')
 def get_stops():
     route_id = request.args.get('route_id')
+    bbox = request.args.get('bbox')
+    agency = g.agency
+    dataset = agency.parser.static_dataset
     
+    # Viewport queries are too varied to be worth caching; they are answered from the grid index
+    if bbox:
+        try:
+            bbox = parse_bbox(bbox)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(dataset.find_stops_in_bbox(bbox, route_id))
+    
+    # Route-level responses only cover the services running today and tomorrow
+    window = dataset.service_window()
     if route_id:
-        stops = parser.get_route_stops(route_id)
-        return jsonify(stops)
+        if route_id not in window.route_stops:
+            return jsonify([])
+        return agency.static_responses.respond(window, ('stops', route_id), lambda: dataset.get_route_stops(route_id))
+    
+    return agency.static_responses.respond(window, ('stops',), dataset.get_stop_positions)
+
+@app.route('/api/stops/nearest')
+def get_nearest_stops():
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    k = request.args.get('k', 5, type=int)
+    
+    if lat is None or lon is None or not math.isfinite(lat) or not math.isfinite(lon):
+        return jsonify({'error': "lat and lon are required"}), 400
     
-    stops = parser.get_stop_positions()
-    return jsonify(stops)
+    k = max(1, min(k, max_nearest_stops))
+    return jsonify(g.agency.parser.static_dataset.find_nearest_stops(lat, lon, k))
+
+@app.route('/api/stops/<stop_id>/arrivals')
+def get_stop_arrivals(stop_id):
+    n = request.args.get('n', 5, type=int)
+    n = max(1, min(n, MAX_ARRIVALS))
+    agency = g.agency
+    trip_predictions = agency.trip_predictions
+    
+    arrivals = trip_predictions.arrivals(stop_id, n, agency.parser.clock())
+    for arrival in arrivals:
+        arrival['route_short_name'] = agency.get_route_short_name(arrival['route_id'])
+    return jsonify({
+        'stop_id': stop_id,
+        'arrivals': arrivals,
+        'feed_timestamp': trip_predictions.feed_timestamp
+    })
+
+@app.route('/api/stops/<stop_id>/routes')
+def get_stop_routes(stop_id):
+    dataset = g.agency.parser.static_dataset
+    if stop_id not in dataset.stop_ids:
+        return jsonify({'error': f"Unknown stop {stop_id}"}), 404
+    return jsonify({
+        'stop_id': stop_id,
+        'routes': dataset.get_stop_routes(stop_id)
+    })
 
 @app.route('/api/shapes')
 def get_shapes():
     route_id = request.args.get('route_id')
+    zoom = request.args.get('zoom', type=int)
+    shape_format = request.args.get('format', 'raw')
+    bbox = request.args.get('bbox')
+    agency = g.agency
+    dataset = agency.parser.static_dataset
+    
+    if shape_format not in SHAPE_FORMATS:
+        return jsonify({'error': f"Unknown shape format '{shape_format}'", 'formats': list(SHAPE_FORMATS)}), 400
+    
+    # Zooms that share a simplification level share a cache entry
+    level = level_for_zoom(zoom)
     
+    if bbox:
+        try:
+            bbox = parse_bbox(bbox)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(dataset.find_shapes_in_bbox(bbox, route_id, level, shape_format))
+    
+    window = dataset.service_window()
     if route_id:
-        route_shapes = parser.get_route_shapes(route_id)
-        return jsonify(route_shapes)
+        if route_id not in window.route_shapes:
+            return jsonify({})
+        return agency.static_responses.respond(window, ('shapes', route_id, level, shape_format),
+                                               lambda: dataset.get_route_shapes(route_id, level, shape_format))
     
-    shapes = parser.get_shapes()
-    return jsonify(shapes)
+    return agency.static_responses.respond(window, ('shapes', None, level, shape_format),
+                                           lambda: dataset.get_shapes(level, shape_format))
+
+@app.route('/api/tiles/<int:z>/<int:x>/<int:y>')
+def get_tile(z, x, y):
+    if not is_valid_tile(z, x, y):
+        return jsonify({'error': f"No tile {z}/{x}/{y}", 'zooms': [MIN_TILE_ZOOM, MAX_TILE_ZOOM]}), 404
+    
+    agency = g.agency
+    dataset = agency.parser.static_dataset
+    return agency.tile_responses.respond(dataset.service_window(), ('tile', z, x, y), lambda: dataset.get_tile(z, x, y))
 
 @app.route('/api/routes')
 def get_routes():
+    agency = g.agency
+    dataset = agency.parser.static_dataset
+    window = dataset.service_window()
+    return agency.static_responses.respond(window, ('routes',), lambda: build_route_list(dataset, window))
+
+@app.route('/api/routes/<route_id>/pattern')
+def get_route_pattern(route_id):
+    agency = g.agency
+    dataset = agency.parser.static_dataset
+    window = dataset.service_window()
+    if route_id not in window.route_stops:
+        return jsonify({'error': f"No stop pattern for route {route_id}"}), 404
+    return agency.static_responses.respond(window, ('pattern', route_id), lambda: {
+        'route_id': route_id,
+        'route_short_name': dataset.get_route_short_name(route_id),
+        'patterns': dataset.get_route_patterns(route_id)
+    })
+
+def build_route_list(dataset, window):
     routes = []
-    unique_route_names = set()
     
-    for route_id, route_info in parser.route_data.items():
-        route_short_name = route_info.get('route_short_name', route_id)
-        
-        if route_short_name in unique_route_names:
-            continue
-            
-        unique_route_names.add(route_short_name)
+    for route_short_name, route_ids in window.route_variants.items():
+        route_info = dataset.route_data[route_ids[0]]
         
         routes.append({
-            'route_id': route_id,
+            'route_id': route_ids[0],
             'route_short_name': route_short_name,
             'route_color': route_info.get('route_color', '#FF0000')
         })
@@ -120,19 +497,64 @@ def get_routes():
     except (ValueError, TypeError):
         routes.sort(key=lambda x: x['route_short_name'])
     
-    return jsonify(routes)
+    return routes
 
-@app.route('/api/status')
-def get_status():
+def feed_status(agency):
+    if agency.published_feed_status is not None:
+        return agency.published_feed_status
+    parser = agency.parser
+    return {
+        'feed_cadence': parser.vehicle_positions_feed.schedule.cadence,
+        'predicted_trips': len(agency.trip_predictions.trips),
+        'stream_port': push_server.port if push_server.running else None,
+        'replay': {
+            'vehicle_positions': parser.vehicle_positions_feed.progress(),
+            'trip_updates': parser.trip_updates_feed.progress()
+        } if replay_dir and agency is agencies.default else None
+    }
+
+@app.route('/api/agencies')
+def get_agencies():
     return jsonify({
-        'last_update': last_update,
-        'bus_count': len(bus_data),
-        'server_time': time.time()
+        'default': agencies.default.agency_id,
+        'agencies': agencies.describe()
     })
 
+@app.route('/api/metrics')
+def get_metrics():
+    collections = [(metrics_process, registry.collect())]
+    if published_metrics is not None:
+        collections.append(('fetcher', published_metrics))
+    return Response(render(collections), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/status')
+def get_status():
+    agency = g.agency
+    snapshot = agency.bus_history.latest
+    status = {
+        'agency': agency.agency_id,
+        'last_update': snapshot.last_update,
+        'bus_count': len(snapshot.buses),
+        'version': snapshot.version
+    }
+    status.update(feed_status(agency))
+    status['service_window'] = agency.parser.static_dataset.service_window().describe()
+    status['server_time'] = agency.parser.clock()
+    return jsonify(status)
+
 if __name__ == '__main__':
-    update_thread = threading.Thread(target=update_bus_data, daemon=True)
-    update_thread.start()
+    # The realtime feeds of every active agency share one pool of polling threads
+    feed_scheduler = FeedScheduler(agencies, feed_jobs)
+    feed_scheduler.start()
+    
+    static_refresh_thread = threading.Thread(target=refresh_static_data, daemon=True)
+    static_refresh_thread.start()
+    
+    prewarm_thread = threading.Thread(target=prewarm_all_tiles, daemon=True)
+    prewarm_thread.start()
+    
+    agencies.watch_idle(push_server.has_subscribers)
+    push_server.start()
     
     browser_thread = threading.Thread(target=open_browser, daemon=True)
     browser_thread.start()
@@ -0,0 +1,160 @@
+# hamilton-transit-map/backend/service_calendar.py
+import logging
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from gtfs_columnar import RouteStopIndex, iter_columns
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+# Trips after midnight belong to the previous day's service, so the window moves on to the
+# next service date at 04:00 rather than at midnight
+SERVICE_DAY_ROLLOVER = 4 * 3600
+# Today's service and tomorrow's
+WINDOW_DAYS = 2
+# Hamilton's, for a feed whose agency.txt names no timezone and an agency configured without one
+DEFAULT_TIMEZONE = ZoneInfo('America/Toronto')
+
+def parse_gtfs_date(text):
+    return date(int(text[0:4]), int(text[4:6]), int(text[6:8]))
+
+def service_date_at(timestamp, timezone=DEFAULT_TIMEZONE):
+    return datetime.fromtimestamp(timestamp - SERVICE_DAY_ROLLOVER, timezone).date()
+
+class ServiceCalendar:
+    # Which services run on a date, from calendar.txt (days of the week over a date range) and
+    # calendar_dates.txt (services added or removed on single dates). Services are the ids
+    # interned by the TripTable; dates are kept as ordinals. A feed with neither file has no
+    # calendar, and every trip counts as running every day.
+    def __init__(self, service_ids):
+        self.service_ids = service_ids
+        # service -> (weekday bitmask, first date, last date)
+        self.periods = {}
+        # date -> {service: True if added, False if removed}
+        self.exceptions = {}
+    
+    @property
+    def has_calendar(self):
+        return bool(self.periods or self.exceptions)
+    
+    def parse_calendar(self, lines):
+        count = 0
+        for row in iter_columns(lines, ['service_id'] + WEEKDAYS + ['start_date', 'end_date']):
+            service_id, days, start_date, end_date = row[0], row[1:8], row[8], row[9]
+            mask = 0
+            for weekday, flag in enumerate(days):
+                if flag.strip() == '1':
+                    mask |= 1 << weekday
+            service = self.service_ids.intern(service_id)
+            self.periods[service] = (mask, parse_gtfs_date(start_date).toordinal(), parse_gtfs_date(end_date).toordinal())
+            count += 1
+        logger.info(f"Loaded {count} service periods")
+    
+    def parse_calendar_dates(self, lines):
+        count = 0
+        for service_id, service_date, exception_type in iter_columns(lines, ['service_id', 'date', 'exception_type']):
+            day = parse_gtfs_date(service_date).toordinal()
+            if day not in self.exceptions:
+                self.exceptions[day] = {}
+            self.exceptions[day][self.service_ids.intern(service_id)] = exception_type.strip() == '1'
+            count += 1
+        logger.info(f"Loaded {count} service exceptions")
+    
+    def active_services(self, service_date):
+        day = service_date.toordinal()
+        weekday_bit = 1 << service_date.weekday()
+        services = {service for service, (mask, first, last) in self.periods.items()
+                    if mask & weekday_bit and first <= day <= last}
+        for service, added in self.exceptions.get(day, {}).items():
+            if added:
+                services.add(service)
+            else:
+                services.discard(service)
+        return services
+    
+    def export(self):
+        return {'periods': self.periods, 'exceptions': self.exceptions}
+    
+    def import_objects(self, objects):
+        self.periods = objects['periods']
+        self.exceptions = objects['exceptions']
+
+class ServiceWindow:
+    # The trips running on a few consecutive service dates, and the route -> shape and
+    # route <-> stop relations of just those trips. A dataset builds one the first time it is
+    # asked about a window, so the relations of services that are not running are never
+    # materialized, and the trips' stop times stay in the snapshot's unread pages. Without a
+    # calendar, or when none of its services run in the window (an expired feed, say), the
+    # window is every trip and reuses the relations built when the feed was loaded.
+    def __init__(self, dataset, service_dates, timezone=DEFAULT_TIMEZONE):
+        self.service_dates = service_dates
+        self.timezone = timezone
+        self.trip_mask = None
+        self.route_shapes = dataset.route_shapes
+        self.route_stops = dataset.route_stops
+        self.route_variants = dataset.route_variants
+        self.shape_ids = None
+        self.shape_routes = None
+        
+        trips_data = dataset.trips_data
+        self.trip_count = trips_data.count
+        self.total_trips = trips_data.count
+        if not dataset.calendar.has_calendar:
+            return
+        
+        services = set()
+        for service_date in service_dates:
+            services |= dataset.calendar.active_services(service_date)
+        trip_mask = bytearray(len(trips_data.services))
+        trip_count = 0
+        for trip_idx, (route, service) in enumerate(zip(trips_data.routes, trips_data.services)):
+            if route >= 0 and service in services:
+                trip_mask[trip_idx] = 1
+                trip_count += 1
+        if not trip_count:
+            logger.warning(f"No service runs on {', '.join(str(d) for d in service_dates)}; serving every trip")
+            return
+        
+        self.trip_mask = trip_mask
+        self.trip_count = trip_count
+        self.route_shapes = trips_data.route_shape_ids(dataset.shapes_data, trip_mask)
+        self.route_stops = RouteStopIndex(trips_data.route_ids, dataset.stop_ids, dataset.stop_data,
+                                          dataset.stop_times_data)
+        self.route_stops.build(trips_data, trip_mask)
+        self.shape_ids = {shape_id for shape_ids in self.route_shapes.values() for shape_id in shape_ids}
+        
+        route_variants = {}
+        for route_short_name, route_ids in dataset.route_variants.items():
+            running = [route_id for route_id in route_ids if route_id in self.route_stops or route_id in self.route_shapes]
+            if running:
+                route_variants[route_short_name] = running
+        self.route_variants = route_variants
+        logger.info(f"Service window {service_dates[0]} to {service_dates[-1]}: {trip_count} of "
+                    f"{self.total_trips} trips on {len(self.route_stops)} routes")
+    
+    def has_shape(self, shape_id):
+        return self.shape_ids is None or shape_id in self.shape_ids
+    
+    def get_shape_routes(self):
+        # Built on first use; tiles are the only consumer
+        if self.shape_routes is None:
+            shape_routes = {}
+            for route_id, shape_ids in self.route_shapes.items():
+                for shape_id in shape_ids:
+                    if shape_id not in shape_routes:
+                        shape_routes[shape_id] = []
+                    shape_routes[shape_id].append(route_id)
+            self.shape_routes = shape_routes
+        return self.shape_routes
+    
+    def describe(self):
+        return {
+            'service_dates': [service_date.isoformat() for service_date in self.service_dates],
+            'timezone': self.timezone.key,
+            'active_trips': self.trip_count,
+            'total_trips': self.total_trips
+        }
+
+def window_dates(timestamp, timezone=DEFAULT_TIMEZONE):
+    first = service_date_at(timestamp, timezone)
+    return [first + timedelta(days=i) for i in range(WINDOW_DAYS)]
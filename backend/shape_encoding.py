@@ -0,0 +1,146 @@
+# hamilton-transit-map/backend/shape_encoding.py
+import math
+from array import array
+from spatial_index import METERS_PER_DEGREE_LAT, METERS_PER_DEGREE_LON
+
+# Simplification tolerance in metres for each precomputed zoom level. At Hamilton's latitude
+# one screen pixel is roughly 114 km / 2^zoom, so each level keeps error at about one pixel.
+SHAPE_ZOOM_TOLERANCES = {10: 100.0, 12: 25.0, 14: 6.0}
+FULL_DETAIL_ZOOM = 16
+
+SHAPE_FORMATS = ('raw', 'polyline', 'delta')
+COORDINATE_PRECISION = 5
+
+def level_for_zoom(zoom):
+    if zoom is None or zoom >= FULL_DETAIL_ZOOM:
+        return None
+    levels = sorted(SHAPE_ZOOM_TOLERANCES)
+    eligible = [level for level in levels if level <= zoom]
+    return eligible[-1] if eligible else levels[0]
+
+def douglas_peucker(lats, lons, tolerance):
+    count = len(lats)
+    if count < 3:
+        return list(range(count))
+    
+    # Equirectangular projection around the first point is accurate to well under a metre
+    # over the extent of a single bus route
+    lon_scale = METERS_PER_DEGREE_LON * math.cos(math.radians(lats[0]))
+    xs = [lon * lon_scale for lon in lons]
+    ys = [lat * METERS_PER_DEGREE_LAT for lat in lats]
+    
+    keep = bytearray(count)
+    keep[0] = keep[-1] = 1
+    tolerance_sq = tolerance * tolerance
+    stack = [(0, count - 1)]
+    
+    while stack:
+        start, end = stack.pop()
+        ax, ay = xs[start], ys[start]
+        dx, dy = xs[end] - ax, ys[end] - ay
+        segment_sq = dx * dx + dy * dy
+        
+        max_sq = 0.0
+        max_index = -1
+        for i in range(start + 1, end):
+            px, py = xs[i] - ax, ys[i] - ay
+            if segment_sq > 0:
+                t = (px * dx + py * dy) / segment_sq
+                t = 0.0 if t < 0 else 1.0 if t > 1 else t
+                px -= t * dx
+                py -= t * dy
+            distance_sq = px * px + py * py
+            if distance_sq > max_sq:
+                max_sq = distance_sq
+                max_index = i
+        
+        if max_sq > tolerance_sq:
+            keep[max_index] = 1
+            stack.append((start, max_index))
+            stack.append((max_index, end))
+    
+    return [i for i in range(count) if keep[i]]
+
+def encode_polyline(points, precision=COORDINATE_PRECISION):
+    factor = 10 ** precision
+    output = []
+    previous_lat = previous_lon = 0
+    
+    for lat, lon in points:
+        lat = int(round(lat * factor))
+        lon = int(round(lon * factor))
+        for delta in (lat - previous_lat, lon - previous_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                output.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            output.append(chr(value + 63))
+        previous_lat, previous_lon = lat, lon
+    
+    return ''.join(output)
+
+def delta_encode(points, precision=COORDINATE_PRECISION):
+    # Flat [lat0, lon0, dlat1, dlon1, ...] in units of 10^-precision degrees
+    factor = 10 ** precision
+    output = []
+    previous_lat = previous_lon = 0
+    
+    for lat, lon in points:
+        lat = int(round(lat * factor))
+        lon = int(round(lon * factor))
+        output.append(lat - previous_lat)
+        output.append(lon - previous_lon)
+        previous_lat, previous_lon = lat, lon
+    
+    return output
+
+def format_points(points, shape_format):
+    if shape_format == 'polyline':
+        return encode_polyline(points)
+    if shape_format == 'delta':
+        return delta_encode(points)
+    return points
+
+class SimplifiedShapes:
+    # For each zoom level, the rows of a ShapeTable that survive simplification,
+    # stored as row indices grouped with the same offsets layout as the table itself
+    def __init__(self, shapes):
+        self.shapes = shapes
+        self.levels = {}
+    
+    def build(self):
+        for zoom, tolerance in sorted(SHAPE_ZOOM_TOLERANCES.items()):
+            indices = array('I')
+            offsets = array('I', [0])
+            for group in range(len(self.shapes.offsets) - 1):
+                start, end = self.shapes.offsets[group], self.shapes.offsets[group + 1]
+                if end > start:
+                    kept = douglas_peucker(self.shapes.lat[start:end], self.shapes.lon[start:end], tolerance)
+                    indices.extend(start + i for i in kept)
+                offsets.append(len(indices))
+            self.levels[zoom] = (indices, offsets)
+    
+    def points(self, shape_id, level):
+        if level not in self.levels:
+            return self.shapes[shape_id]
+        
+        indices, offsets = self.levels[level]
+        group = self.shapes.key_ids.lookup(shape_id)
+        if group is None or group + 1 >= len(offsets):
+            raise KeyError(shape_id)
+        
+        lat, lon = self.shapes.lat, self.shapes.lon
+        return [[lat[i], lon[i]] for i in indices[offsets[group]:offsets[group + 1]]]
+    
+    def export_columns(self):
+        columns = {}
+        for zoom, (indices, offsets) in self.levels.items():
+            columns[f"{zoom}.indices"] = indices
+            columns[f"{zoom}.offsets"] = offsets
+        return columns
+    
+    def import_columns(self, columns):
+        self.levels = {}
+        for zoom in SHAPE_ZOOM_TOLERANCES:
+            if f"{zoom}.indices" in columns:
+                self.levels[zoom] = (columns[f"{zoom}.indices"], columns[f"{zoom}.offsets"])
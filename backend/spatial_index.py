@@ -0,0 +1,272 @@
+# hamilton-transit-map/backend/spatial_index.py
+import heapq
+import math
+from array import array
+
+# 0.005 degrees is roughly 550 m north-south and 400 m east-west in Hamilton
+DEFAULT_CELL_SIZE = 0.005
+
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LON = 111320.0
+
+def parse_bbox(text):
+    # min_lon,min_lat,max_lon,max_lat, the same order Leaflet's LatLngBounds.toBBoxString() uses
+    parts = [float(part) for part in text.split(',')]
+    if len(parts) != 4 or not all(math.isfinite(part) for part in parts):
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    min_lon, min_lat, max_lon, max_lat = parts
+    if min_lat > max_lat or min_lon > max_lon:
+        raise ValueError("bbox minimums must not exceed its maximums")
+    return min_lat, min_lon, max_lat, max_lon
+
+def distance_meters(lat1, lon1, lat2, lon2):
+    # Equirectangular approximation; well within a metre of haversine at city scale
+    x = (lon2 - lon1) * METERS_PER_DEGREE_LON * math.cos(math.radians((lat1 + lat2) / 2))
+    y = (lat2 - lat1) * METERS_PER_DEGREE_LAT
+    return math.hypot(x, y)
+
+class GridIndex:
+    # Sparse uniform grid. Each occupied cell lists the items that have a point in it,
+    # stored CSR-style (cell -> slice of entries) so it can be written to the static snapshot.
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cell_rows = array('i')
+        self.cell_cols = array('i')
+        self.offsets = array('I', [0])
+        self.entries = array('I')
+        self.cells = {}
+        self.extent = None
+    
+    def cell_of(self, lat, lon):
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+    
+    def build(self, points, unique=False):
+        self.cell_rows = array('i')
+        self.cell_cols = array('i')
+        self.offsets = array('I', [0])
+        self.entries = array('I')
+        
+        buckets = {}
+        for lat, lon, item in points:
+            cell = self.cell_of(lat, lon)
+            if cell not in buckets:
+                buckets[cell] = []
+            bucket = buckets[cell]
+            if not unique or not bucket or bucket[-1] != item:
+                bucket.append(item)
+        
+        for (row, col), items in sorted(buckets.items()):
+            self.cell_rows.append(row)
+            self.cell_cols.append(col)
+            self.entries.extend(sorted(set(items)) if unique else items)
+            self.offsets.append(len(self.entries))
+        self.build_cell_lookup()
+        return self
+    
+    def segment_cells(self, lat1, lon1, lat2, lon2):
+        # Every cell the segment passes through, walking from one cell boundary crossing to the
+        # next; a segment through a corner also yields one of the two cells beside it
+        row, col = self.cell_of(lat1, lon1)
+        end_row, end_col = self.cell_of(lat2, lon2)
+        yield row, col
+        
+        size = self.cell_size
+        d_lat, d_lon = lat2 - lat1, lon2 - lon1
+        step_row = 1 if d_lat > 0 else -1
+        step_col = 1 if d_lon > 0 else -1
+        # Fraction of the segment at which it crosses into the next row / column
+        if d_lat:
+            t_row = ((row + (step_row > 0)) * size - lat1) / d_lat
+            dt_row = size / abs(d_lat)
+        else:
+            t_row = dt_row = math.inf
+        if d_lon:
+            t_col = ((col + (step_col > 0)) * size - lon1) / d_lon
+            dt_col = size / abs(d_lon)
+        else:
+            t_col = dt_col = math.inf
+        
+        for _ in range(abs(end_row - row) + abs(end_col - col)):
+            if col == end_col or (row != end_row and t_row <= t_col):
+                row += step_row
+                t_row += dt_row
+            else:
+                col += step_col
+                t_col += dt_col
+            yield row, col
+    
+    def build_cell_lookup(self):
+        self.cells = {cell: i for i, cell in enumerate(zip(self.cell_rows, self.cell_cols))}
+        if self.cells:
+            self.extent = (min(self.cell_rows), min(self.cell_cols), max(self.cell_rows), max(self.cell_cols))
+    
+    def cell_entries(self, cell):
+        i = self.cells.get(cell)
+        if i is None:
+            return ()
+        return self.entries[self.offsets[i]:self.offsets[i + 1]]
+    
+    def candidates(self, min_lat, min_lon, max_lat, max_lon):
+        min_row, min_col = self.cell_of(min_lat, min_lon)
+        max_row, max_col = self.cell_of(max_lat, max_lon)
+        
+        # Walk whichever is smaller: the cells covered by the box, or the occupied cells
+        if (max_row - min_row + 1) * (max_col - min_col + 1) <= len(self.cells):
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    yield from self.cell_entries((row, col))
+        else:
+            for (row, col), i in self.cells.items():
+                if min_row <= row <= max_row and min_col <= col <= max_col:
+                    yield from self.entries[self.offsets[i]:self.offsets[i + 1]]
+    
+    def ring(self, center, radius):
+        # The cells of the square ring, clipped to the occupied extent so a ring far wider
+        # than the network costs no more than one crossing it
+        row, col = center
+        min_row, min_col, max_row, max_col = self.extent
+        if radius == 0:
+            yield center
+            return
+        cols = range(max(col - radius, min_col), min(col + radius, max_col) + 1)
+        for r in (row - radius, row + radius):
+            if min_row <= r <= max_row:
+                for c in cols:
+                    yield r, c
+        rows = range(max(row - radius + 1, min_row), min(row + radius - 1, max_row) + 1)
+        for c in (col - radius, col + radius):
+            if min_col <= c <= max_col:
+                for r in rows:
+                    yield r, c
+    
+    def nearest(self, lat, lon, k, coordinates):
+        # Expand square rings of cells around the query until the k-th best distance is closer
+        # than anything an unvisited ring could contain
+        if not self.cells or k <= 0:
+            return []
+        
+        center = self.cell_of(lat, lon)
+        min_row, min_col, max_row, max_col = self.extent
+        # A cell's width shrinks away from the equator, so bound it at the latitude furthest
+        # from it among the query and the network
+        widest_lat = max(abs(lat), abs(min_row) * self.cell_size, abs(max_row + 1) * self.cell_size)
+        cell_meters = self.cell_size * min(METERS_PER_DEGREE_LAT, METERS_PER_DEGREE_LON * math.cos(math.radians(min(widest_lat, 90))))
+        max_radius = max(abs(center[0] - min_row), abs(center[0] - max_row), abs(center[1] - min_col), abs(center[1] - max_col))
+        # Rings closer in than the extent hold nothing, so a query far from the network
+        # starts at the first ring that reaches it
+        min_radius = max(0, min_row - center[0], center[0] - max_row, min_col - center[1], center[1] - max_col)
+        
+        best = []
+        for radius in range(min_radius, max_radius + 1):
+            for cell in self.ring(center, radius):
+                for item in self.cell_entries(cell):
+                    item_lat, item_lon = coordinates(item)
+                    distance = distance_meters(lat, lon, item_lat, item_lon)
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, item))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, item))
+            
+            if len(best) == k and -best[0][0] <= radius * cell_meters:
+                break
+        
+        return [(item, -negative) for negative, item in sorted(best, reverse=True)]
+    
+    def export_columns(self):
+        return {
+            'cell_rows': self.cell_rows,
+            'cell_cols': self.cell_cols,
+            'offsets': self.offsets,
+            'entries': self.entries
+        }
+    
+    def import_columns(self, columns):
+        for name, column in columns.items():
+            setattr(self, name, column)
+        self.build_cell_lookup()
+
+class StopIndex:
+    def __init__(self, stop_data):
+        self.stop_data = stop_data
+        self.grid = GridIndex()
+    
+    def build(self):
+        self.grid.build((stop['latitude'], stop['longitude'], i) for i, stop in enumerate(self.stop_data))
+        return self
+    
+    def coordinates(self, i):
+        stop = self.stop_data[i]
+        return stop['latitude'], stop['longitude']
+    
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        stops = []
+        for i in sorted(self.grid.candidates(min_lat, min_lon, max_lat, max_lon)):
+            stop = self.stop_data[i]
+            if min_lat <= stop['latitude'] <= max_lat and min_lon <= stop['longitude'] <= max_lon:
+                stops.append(stop)
+        return stops
+    
+    def nearest(self, lat, lon, k):
+        return [(self.stop_data[i], distance) for i, distance in self.grid.nearest(lat, lon, k, self.coordinates)]
+    
+    def export_columns(self):
+        return self.grid.export_columns()
+    
+    def import_columns(self, columns):
+        self.grid.import_columns(columns)
+
+class ShapeIndex:
+    # Grid over shape segments plus a bounding box per shape. Each segment is entered in every
+    # cell it crosses, so a shape matches a bbox when its own bounds intersect it and one of its
+    # segments passes through a grid cell the bbox touches, even with no point in the viewport.
+    def __init__(self, shapes):
+        self.shapes = shapes
+        self.grid = GridIndex()
+        self.bounds = array('d')
+    
+    def build(self):
+        shapes = self.shapes
+        self.bounds = array('d')
+        for group in range(len(shapes.offsets) - 1):
+            start, end = shapes.offsets[group], shapes.offsets[group + 1]
+            if end > start:
+                lats, lons = shapes.lat[start:end], shapes.lon[start:end]
+                self.bounds.extend((min(lats), min(lons), max(lats), max(lons)))
+            else:
+                self.bounds.extend((math.inf, math.inf, -math.inf, -math.inf))
+        
+        grid = self.grid
+        half = grid.cell_size / 2
+        
+        def points():
+            # The centre of each cell a segment crosses stands in for it
+            for group in range(len(shapes.offsets) - 1):
+                start, end = shapes.offsets[group], shapes.offsets[group + 1]
+                if end - start == 1:
+                    yield shapes.lat[start], shapes.lon[start], group
+                for row in range(start, end - 1):
+                    for cell_row, cell_col in grid.segment_cells(shapes.lat[row], shapes.lon[row],
+                                                                 shapes.lat[row + 1], shapes.lon[row + 1]):
+                        yield cell_row * grid.cell_size + half, cell_col * grid.cell_size + half, group
+        
+        grid.build(points(), unique=True)
+        return self
+    
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        bounds = self.bounds
+        shape_ids = []
+        for group in sorted(set(self.grid.candidates(min_lat, min_lon, max_lat, max_lon))):
+            b = group * 4
+            if bounds[b] <= max_lat and bounds[b + 1] <= max_lon and bounds[b + 2] >= min_lat and bounds[b + 3] >= min_lon:
+                shape_ids.append(self.shapes.key_ids[group])
+        return shape_ids
+    
+    def export_columns(self):
+        columns = {'bounds': self.bounds}
+        for name, column in self.grid.export_columns().items():
+            columns[f"grid_{name}"] = column
+        return columns
+    
+    def import_columns(self, columns):
+        self.bounds = columns['bounds']
+        self.grid.import_columns({name[len('grid_'):]: column for name, column in columns.items() if name.startswith('grid_')})
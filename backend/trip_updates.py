@@ -0,0 +1,297 @@
+# hamilton-transit-map/backend/trip_updates.py
+import bisect
+import logging
+import pickle
+import time
+from datetime import datetime, timedelta
+from google.transit import gtfs_realtime_pb2
+from feed_fetcher import iter_fields
+from service_calendar import DEFAULT_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+# Departures are kept this long after they were predicted, so a bus that is a little late
+# leaving does not vanish from the board before it has gone
+DEPARTED_GRACE = 60
+MAX_ARRIVALS = 20
+
+TripDescriptor = gtfs_realtime_pb2.TripDescriptor
+StopTimeUpdate = gtfs_realtime_pb2.TripUpdate.StopTimeUpdate
+
+# Field numbers in gtfs-realtime.proto
+FEED_HEADER = 1
+FEED_ENTITY = 2
+ENTITY_TRIP_UPDATE = 3
+TRIP_UPDATE_TIMESTAMP = 4
+
+def split_feed(data):
+    # The FeedHeader and each FeedEntity of an encoded FeedMessage, still encoded
+    header = None
+    entities = []
+    for field, wire_type, start, value_start, value_end in iter_fields(data):
+        if field == FEED_HEADER:
+            header = gtfs_realtime_pb2.FeedHeader.FromString(data[value_start:value_end])
+        elif field == FEED_ENTITY:
+            entities.append(data[value_start:value_end])
+    return header, entities
+
+def entity_signature(entity):
+    # The encoded entity minus TripUpdate.timestamp, which moves on every publish even when
+    # none of the predictions have
+    parts = []
+    for field, wire_type, start, value_start, value_end in iter_fields(entity):
+        if field != ENTITY_TRIP_UPDATE:
+            parts.append(entity[start:value_end])
+            continue
+        parts.append(entity[start:value_start])
+        for inner, _, inner_start, _, inner_end in iter_fields(entity, value_start, value_end):
+            if inner != TRIP_UPDATE_TIMESTAMP:
+                parts.append(entity[inner_start:inner_end])
+    return b''.join(parts)
+
+def service_day_start(service_date, timezone=DEFAULT_TIMEZONE):
+    # GTFS times count from "noon minus 12h", which is midnight except on DST change days
+    noon = datetime(service_date.year, service_date.month, service_date.day, 12, tzinfo=timezone)
+    return int(noon.timestamp()) - 12 * 3600
+
+def interpolate_times(times):
+    # Non-timepoint stops have no scheduled time; spread the gap evenly between timepoints
+    times = list(times)
+    known = [i for i, t in enumerate(times) if t >= 0]
+    for a, b in zip(known, known[1:]):
+        for i in range(a + 1, b):
+            times[i] = times[a] + (times[b] - times[a]) * (i - a) // (b - a)
+    return times
+
+def event_time(update, scheduled, delay):
+    # The predicted departure (or arrival, for the last stop) of one StopTimeUpdate and the
+    # delay it implies, or (None, None) when it carries neither a time nor a delay
+    for field in ('departure', 'arrival'):
+        if update.HasField(field):
+            event = getattr(update, field)
+            if event.HasField('time'):
+                return event.time, event.time - scheduled if scheduled is not None else delay
+            if event.HasField('delay') and scheduled is not None:
+                return scheduled + event.delay, event.delay
+    return None, None
+
+def upcoming_arrivals(departures, count, now):
+    if not departures:
+        return []
+    
+    start = bisect.bisect_left(departures, (now - DEPARTED_GRACE,))
+    return [{
+        'trip_id': trip_id,
+        'route_id': route_id,
+        'stop_sequence': stop_sequence,
+        'departure': departure,
+        'delay': delay
+    } for departure, trip_id, route_id, stop_sequence, delay in departures[start:start + count]]
+
+class PredictionIndex:
+    # Predicted departures from the TripUpdates feed, joined with the scheduled stop_times.
+    # trips maps trip_id -> (signature, route_id, [(departure, stop_id, stop_sequence, delay)]);
+    # by_stop maps stop_id -> [(departure, trip_id, route_id, stop_sequence, delay)] sorted by
+    # departure. A poll only decodes the entities whose bytes changed, recomputes those trips
+    # and re-sorts the stops they touch. The dicts are replaced rather than mutated, so readers
+    # need no lock. Service days follow the timezone of the dataset last updated against.
+    def __init__(self):
+        self.dataset = None
+        self.timezone = DEFAULT_TIMEZONE
+        self.trips = {}
+        self.signatures = {}
+        self.by_stop = {}
+        self.feed_timestamp = None
+        self.day_starts = {}
+    
+    def update(self, binary_data, dataset, now=None):
+        now = time.time() if now is None else now
+        if dataset is not self.dataset:
+            # New static data can change every schedule, so nothing carries over
+            self.dataset = dataset
+            self.timezone = dataset.timezone
+            self.trips = {}
+            self.signatures = {}
+            self.by_stop = {}
+            self.day_starts = {}
+        
+        header, entities = split_feed(binary_data)
+        trips = {}
+        signatures = {}
+        changed = {}
+        for data in entities:
+            signature = entity_signature(data)
+            trip_id = self.signatures.get(signature)
+            if trip_id is not None:
+                trips[trip_id] = self.trips[trip_id]
+                signatures[signature] = trip_id
+                continue
+            
+            entity = gtfs_realtime_pb2.FeedEntity.FromString(data)
+            if not entity.HasField('trip_update') or entity.is_deleted:
+                continue
+            trip_update = entity.trip_update
+            trip_id = trip_update.trip.trip_id
+            if not trip_id:
+                continue
+            
+            try:
+                route_id, predictions = self.predict_trip(trip_update, dataset, now)
+            except Exception as e:
+                logger.warning(f"Skipping trip update for {trip_id}: {e}")
+                continue
+            trips[trip_id] = (signature, route_id, predictions)
+            signatures[signature] = trip_id
+            changed[trip_id] = predictions
+        
+        removed = [trip_id for trip_id in self.trips if trip_id not in trips]
+        
+        touched = set()
+        for trip_id in list(changed) + removed:
+            previous = self.trips.get(trip_id)
+            if previous is not None:
+                touched.update(prediction[1] for prediction in previous[2])
+        for predictions in changed.values():
+            touched.update(prediction[1] for prediction in predictions)
+        
+        stale = set(changed) | set(removed)
+        by_stop = dict(self.by_stop)
+        for stop_id in touched:
+            departures = [departure for departure in by_stop.get(stop_id, ())
+                          if departure[1] not in stale and departure[0] >= now - DEPARTED_GRACE]
+            by_stop[stop_id] = departures
+        
+        for trip_id, predictions in changed.items():
+            route_id = trips[trip_id][1]
+            for departure, stop_id, stop_sequence, delay in predictions:
+                if departure >= now - DEPARTED_GRACE:
+                    by_stop[stop_id].append((departure, trip_id, route_id, stop_sequence, delay))
+        
+        for stop_id in touched:
+            if by_stop[stop_id]:
+                by_stop[stop_id].sort()
+            else:
+                del by_stop[stop_id]
+        
+        self.trips = trips
+        self.signatures = signatures
+        self.by_stop = by_stop
+        self.feed_timestamp = header.timestamp if header is not None and header.HasField('timestamp') else None
+        return len(changed), len(removed)
+    
+    def predict_trip(self, trip_update, dataset, now):
+        trip = trip_update.trip
+        trip_idx = dataset.trip_ids.lookup(trip.trip_id)
+        route_id = trip.route_id or (dataset.trips_data.route_of(trip_idx) if trip_idx is not None else None)
+        
+        if trip.schedule_relationship == TripDescriptor.CANCELED:
+            return route_id, []
+        
+        schedule = dataset.stop_times_data.schedule(trip_idx) if trip_idx is not None else []
+        if not schedule:
+            # Added or unknown trips: only updates with an absolute time and a stop_id are usable
+            predictions = []
+            for update in trip_update.stop_time_update:
+                departure, delay = event_time(update, None, None)
+                if departure is not None and update.stop_id and update.schedule_relationship != StopTimeUpdate.SKIPPED:
+                    predictions.append((departure, update.stop_id, update.stop_sequence, None))
+            return route_id, predictions
+        
+        updates_by_sequence = {}
+        updates_by_stop = {}
+        for update in trip_update.stop_time_update:
+            if update.HasField('stop_sequence'):
+                updates_by_sequence[update.stop_sequence] = update
+            elif update.stop_id:
+                updates_by_stop[update.stop_id] = update
+        
+        times = interpolate_times(departure for _, _, departure in schedule)
+        day_start = self.service_day_start(trip.start_date, times, trip_update, now)
+        
+        # Delays carry downstream from each update until the next one (GTFS-RT propagation);
+        # stops before the first update only get a prediction from a trip-level delay
+        delay = trip_update.delay if trip_update.HasField('delay') else None
+        predictions = []
+        for (stop_idx, stop_sequence, _), scheduled in zip(schedule, times):
+            stop_id = dataset.stop_ids[stop_idx]
+            scheduled = day_start + scheduled if scheduled >= 0 else None
+            update = updates_by_sequence.get(stop_sequence) or updates_by_stop.get(stop_id)
+            
+            if update is not None:
+                if update.schedule_relationship == StopTimeUpdate.SKIPPED:
+                    continue
+                if update.schedule_relationship == StopTimeUpdate.NO_DATA:
+                    delay = None
+                    continue
+                departure, update_delay = event_time(update, scheduled, delay)
+                if departure is not None:
+                    delay = update_delay
+                    predictions.append((departure, stop_id, stop_sequence, delay))
+                    continue
+            
+            if delay is not None and scheduled is not None:
+                predictions.append((scheduled + delay, stop_id, stop_sequence, delay))
+        
+        return route_id, predictions
+    
+    def service_day_start(self, start_date, times, trip_update, now):
+        if start_date:
+            day_start = self.day_starts.get(start_date)
+            if day_start is None:
+                day_start = service_day_start(datetime.strptime(start_date, '%Y%m%d').date(), self.timezone)
+                self.day_starts[start_date] = day_start
+            return day_start
+        
+        # Without a start_date, pick the service day (yesterday's runs past midnight) that puts the
+        # schedule nearest to an absolute prediction, or to now
+        reference = now
+        for update in trip_update.stop_time_update:
+            departure, _ = event_time(update, None, None)
+            if departure is not None:
+                reference = departure
+                break
+        first = next((t for t in times if t >= 0), 0)
+        today = datetime.fromtimestamp(reference, self.timezone).date()
+        candidates = [service_day_start(today - timedelta(days=1), self.timezone), service_day_start(today, self.timezone)]
+        return min(candidates, key=lambda day_start: abs(day_start + first - reference))
+    
+    def arrivals(self, stop_id, count, now=None):
+        now = time.time() if now is None else now
+        return upcoming_arrivals(self.by_stop.get(stop_id), count, now)
+        
+    def export_by_stop(self):
+        # by_stop with each stop's departures pickled on its own, as ({stop_id: (offset, length)},
+        # bytes), so a reader in another process only unpickles the stops it is asked for
+        offsets = {}
+        chunks = []
+        offset = 0
+        for stop_id, departures in self.by_stop.items():
+            data = pickle.dumps(departures, protocol=pickle.HIGHEST_PROTOCOL)
+            offsets[stop_id] = (offset, len(data))
+            chunks.append(data)
+            offset += len(data)
+        return offsets, b''.join(chunks)
+    
+    def trip_predictions(self, trip_id):
+        trip = self.trips.get(trip_id)
+        return trip[2] if trip else []
+
+class PublishedPredictions:
+    # The arrivals side of a PredictionIndex published by another process (export_by_stop).
+    # read(offset, length) returns the pickled departures of one stop.
+    def __init__(self, offsets, read, feed_timestamp):
+        self.offsets = offsets
+        self.read = read
+        self.feed_timestamp = feed_timestamp
+        self.by_stop = {}
+    
+    def departures(self, stop_id):
+        departures = self.by_stop.get(stop_id)
+        if departures is None and stop_id in self.offsets:
+            departures = pickle.loads(self.read(*self.offsets[stop_id]))
+            self.by_stop[stop_id] = departures
+        return departures
+    
+    def arrivals(self, stop_id, count, now=None):
+        now = time.time() if now is None else now
+        return upcoming_arrivals(self.departures(stop_id), count, now)
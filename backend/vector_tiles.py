@@ -0,0 +1,63 @@
+# hamilton-transit-map/backend/vector_tiles.py
+import math
+
+# Tiles are served for the zooms the frontend draws the network at. Shapes are already at
+# full detail by the last one, so the browser overzooms its tiles past that point.
+MIN_TILE_ZOOM = 10
+MAX_TILE_ZOOM = 16
+
+def is_valid_tile(z, x, y):
+    return MIN_TILE_ZOOM <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+def tile_bounds(z, x, y):
+    # Web Mercator (slippy map) tile numbering, the same scheme as the OpenStreetMap base layer
+    n = 2 ** z
+    min_lon = x / n * 360.0 - 180.0
+    max_lon = (x + 1) / n * 360.0 - 180.0
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lat, min_lon, max_lat, max_lon
+
+def tile_for_point(lat, lon, z):
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tiles_covering(bbox, z):
+    min_lat, min_lon, max_lat, max_lon = bbox
+    min_x, min_y = tile_for_point(max_lat, min_lon, z)
+    max_x, max_y = tile_for_point(min_lat, max_lon, z)
+    for x in range(min_x, max_x + 1):
+        for y in range(min_y, max_y + 1):
+            yield z, x, y
+
+def parse_zoom_range(text):
+    # "11-14" -> 11, 12, 13, 14; "12" -> 12; "" -> nothing
+    text = text.strip()
+    if not text:
+        return range(0)
+    low, _, high = text.partition('-')
+    low = int(low)
+    high = int(high) if high else low
+    return range(max(low, MIN_TILE_ZOOM), min(high, MAX_TILE_ZOOM) + 1)
+
+def clip_points(points, bounds):
+    # Runs of consecutive segments whose extent touches the tile. Segments crossing the tile
+    # edge are kept whole, so the pieces drawn from neighbouring tiles join up.
+    min_lat, min_lon, max_lat, max_lon = bounds
+    pieces = []
+    piece = []
+    for i in range(len(points) - 1):
+        (lat1, lon1), (lat2, lon2) = points[i], points[i + 1]
+        if (min(lat1, lat2) <= max_lat and max(lat1, lat2) >= min_lat and
+                min(lon1, lon2) <= max_lon and max(lon1, lon2) >= min_lon):
+            if not piece:
+                piece.append(points[i])
+            piece.append(points[i + 1])
+        elif piece:
+            pieces.append(piece)
+            piece = []
+    if piece:
+        pieces.append(piece)
+    return pieces
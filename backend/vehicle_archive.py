@@ -0,0 +1,277 @@
+# hamilton-transit-map/backend/vehicle_archive.py
+import bisect
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import traceback
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from gtfs_columnar import StringInterner
+
+logger = logging.getLogger(__name__)
+
+# poll time, vehicle timestamp, vehicle, route, trip, latitude, longitude, bearing, speed.
+# Ids are indices into the segment's own id lists (-1 for none); latitude and longitude are
+# float32 exactly as in the feed; bearing is in hundredths of a degree and speed in cm/s.
+RECORD = struct.Struct('<IIIiiffHH')
+UINT32 = struct.Struct('<I')
+POLL_TIME_OFFSET = 0
+VEHICLE_OFFSET = 8
+NO_VALUE = 0xFFFF
+BEARING_SCALE = 100
+SPEED_SCALE = 100
+# Poll times are stored as unsigned 32-bit seconds, so nothing outside this range is archived
+MAX_POLL_TIME = 2 ** 32 - 1
+
+# 32 bytes per vehicle per poll: 250 buses polled every 30 s is about 23 MB a day
+RETENTION_DAYS = 90
+MAX_OPEN_SEGMENTS = 8
+SEGMENT_SUFFIX = '.vpa'
+
+def segment_day(poll_time):
+    return datetime.fromtimestamp(poll_time, timezone.utc).date()
+
+def encode_scaled(value, scale):
+    if math.isnan(value):
+        return NO_VALUE
+    return min(max(int(round(value * scale)), 0), NO_VALUE - 1)
+
+class ArchiveSegment:
+    # One UTC day of records, appended in poll order, so poll times are non-decreasing and a
+    # time range is found by binary search. The id lists live in a JSON file next to it.
+    def __init__(self, path):
+        self.path = path
+        self.ids_path = path.with_suffix('.json')
+        self.ids_mtime = None
+        self.vehicle_ids = StringInterner()
+        self.route_ids = StringInterner()
+        self.trip_ids = StringInterner()
+        self.mapped = None
+        self.count = 0
+        self.by_vehicle = {}
+        self.indexed = 0
+        self.lock = threading.Lock()
+        self.load_ids()
+    
+    def load_ids(self):
+        try:
+            mtime = self.ids_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.ids_mtime:
+            return
+        with open(self.ids_path) as f:
+            ids = json.load(f)
+        self.vehicle_ids = StringInterner.from_values(ids['vehicles'])
+        self.route_ids = StringInterner.from_values(ids['routes'])
+        self.trip_ids = StringInterner.from_values(ids['trips'])
+        self.ids_mtime = mtime
+    
+    def save_ids(self):
+        tmp_path = self.ids_path.with_name(self.ids_path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'vehicles': self.vehicle_ids.values, 'routes': self.route_ids.values,
+                       'trips': self.trip_ids.values}, f)
+        os.replace(tmp_path, self.ids_path)
+        self.ids_mtime = self.ids_path.stat().st_mtime_ns
+    
+    def refresh(self):
+        # Picks up records appended since the last read; a partly written record at the end is ignored
+        try:
+            count = self.path.stat().st_size // RECORD.size
+        except FileNotFoundError:
+            return
+        with self.lock:
+            if count > self.count:
+                self.load_ids()
+                with open(self.path, 'rb') as f:
+                    self.mapped = mmap.mmap(f.fileno(), count * RECORD.size, access=mmap.ACCESS_READ)
+                self.count = count
+    
+    def poll_time(self, i):
+        return UINT32.unpack_from(self.mapped, i * RECORD.size + POLL_TIME_OFFSET)[0]
+    
+    def lower_bound(self, poll_time):
+        # First record polled at or after poll_time
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.poll_time(mid) < poll_time:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    def vehicle_rows(self, vehicle):
+        # Record numbers of one vehicle, in time order; extended with whatever was appended
+        # since the last query rather than rebuilt
+        with self.lock:
+            mapped, count = self.mapped, self.count
+            for i in range(self.indexed, count):
+                key = UINT32.unpack_from(mapped, i * RECORD.size + VEHICLE_OFFSET)[0]
+                if key not in self.by_vehicle:
+                    self.by_vehicle[key] = array('I')
+                self.by_vehicle[key].append(i)
+            self.indexed = count
+            return self.by_vehicle.get(vehicle, array('I'))
+    
+    def position(self, i):
+        poll_time, timestamp, vehicle, route, trip, latitude, longitude, bearing, speed = \
+            RECORD.unpack_from(self.mapped, i * RECORD.size)
+        position = {
+            'vehicle_id': self.vehicle_ids[vehicle],
+            'route_id': self.route_ids[route] if route >= 0 else None,
+            'trip_id': self.trip_ids[trip] if trip >= 0 else None,
+            'latitude': latitude,
+            'longitude': longitude,
+            'timestamp': timestamp,
+            'poll_time': poll_time
+        }
+        if bearing != NO_VALUE:
+            position['bearing'] = bearing / BEARING_SCALE
+        if speed != NO_VALUE:
+            position['speed'] = speed / SPEED_SCALE
+        return position
+
+class VehicleArchive:
+    # Append-only log of every vehicle position polled, one segment file per UTC day. Whole
+    # segments older than retention_days are deleted when a new day starts.
+    def __init__(self, directory, retention_days=RETENTION_DAYS):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.segments = OrderedDict()
+        self.writer = None
+        self.writer_day = None
+        self.last_poll_time = 0
+        self.lock = threading.Lock()
+    
+    @property
+    def enabled(self):
+        return self.retention_days > 0
+    
+    def segment_path(self, day):
+        return self.directory / f"{day.isoformat()}{SEGMENT_SUFFIX}"
+    
+    def segment(self, day, create=False):
+        with self.lock:
+            segment = self.segments.get(day)
+            if segment is not None:
+                self.segments.move_to_end(day)
+                return segment
+            
+            path = self.segment_path(day)
+            if not create and not path.exists():
+                return None
+            segment = ArchiveSegment(path)
+            self.segments[day] = segment
+            # Evicted segments are unmapped once the last query using them finishes
+            while len(self.segments) > MAX_OPEN_SEGMENTS:
+                self.segments.popitem(last=False)
+            return segment
+    
+    def append(self, poll_time, columns):
+        try:
+            # Binary search relies on poll times never going backwards within a segment
+            poll_time = max(poll_time, self.last_poll_time)
+            day = segment_day(poll_time)
+            if day != self.writer_day:
+                self.open_writer(day)
+            segment = self.segment(day, create=True)
+            
+            known = (len(segment.vehicle_ids), len(segment.route_ids), len(segment.trip_ids))
+            vehicle_keys = {v: segment.vehicle_ids.intern(columns.vehicle_ids[v]) for v in set(columns.vehicles)}
+            route_keys = {r: segment.route_ids.intern(columns.route_ids[r]) if r >= 0 else -1 for r in set(columns.routes)}
+            trip_keys = {t: segment.trip_ids.intern(columns.trip_ids[t]) if t >= 0 else -1 for t in set(columns.trips)}
+            # Ids are on disk before any record that refers to them
+            if (len(segment.vehicle_ids), len(segment.route_ids), len(segment.trip_ids)) != known:
+                segment.save_ids()
+            
+            records = bytearray(RECORD.size * len(columns))
+            for i in range(len(columns)):
+                RECORD.pack_into(records, i * RECORD.size, poll_time, columns.timestamp[i],
+                                 vehicle_keys[columns.vehicles[i]], route_keys[columns.routes[i]],
+                                 trip_keys[columns.trips[i]], columns.latitude[i], columns.longitude[i],
+                                 encode_scaled(columns.bearing[i], BEARING_SCALE),
+                                 encode_scaled(columns.speed[i], SPEED_SCALE))
+            self.writer.write(records)
+            self.writer.flush()
+            self.last_poll_time = poll_time
+        except Exception as e:
+            logger.error(f"Error archiving vehicle positions: {e}")
+            traceback.print_exc()
+    
+    def open_writer(self, day):
+        if self.writer is not None:
+            self.writer.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.segment_path(day)
+        self.writer = open(path, 'ab')
+        # A record cut short by a crash would shift every record after it
+        extra = self.writer.tell() % RECORD.size
+        if extra:
+            self.writer.truncate(self.writer.tell() - extra)
+            self.writer.seek(0, os.SEEK_END)
+        self.writer_day = day
+        
+        segment = self.segment(day, create=True)
+        segment.refresh()
+        if segment.count:
+            self.last_poll_time = max(self.last_poll_time, segment.poll_time(segment.count - 1))
+        self.expire(day)
+    
+    def expire(self, today):
+        oldest = today - timedelta(days=self.retention_days - 1)
+        for path in self.directory.glob(f"*{SEGMENT_SUFFIX}"):
+            try:
+                day = datetime.strptime(path.stem, '%Y-%m-%d').date()
+            except ValueError:
+                continue
+            if day < oldest:
+                logger.info(f"Removing archived vehicle positions for {day}")
+                with self.lock:
+                    self.segments.pop(day, None)
+                path.unlink()
+                path.with_suffix('.json').unlink(missing_ok=True)
+    
+    def vehicle_history(self, vehicle_id, start, end):
+        positions = []
+        day = segment_day(start)
+        while day <= segment_day(end):
+            segment = self.segment(day)
+            day += timedelta(days=1)
+            if segment is None:
+                continue
+            segment.refresh()
+            vehicle = segment.vehicle_ids.lookup(vehicle_id)
+            if vehicle is None:
+                continue
+            rows = segment.vehicle_rows(vehicle)
+            first, last = segment.lower_bound(start), segment.lower_bound(end + 1)
+            for i in rows[bisect.bisect_left(rows, first):bisect.bisect_left(rows, last)]:
+                positions.append(segment.position(i))
+        return positions
+    
+    def snapshot(self, t):
+        # Every vehicle from the last poll at or before t, looking back at most one day
+        for day in (segment_day(t), segment_day(t) - timedelta(days=1)):
+            segment = self.segment(day)
+            if segment is None:
+                continue
+            segment.refresh()
+            end = segment.lower_bound(t + 1)
+            if end == 0:
+                continue
+            poll_time = segment.poll_time(end - 1)
+            start = segment.lower_bound(poll_time)
+            return poll_time, [segment.position(i) for i in range(start, end)]
+        return None, []
+    
+    def days(self):
+        if not self.directory.exists():
+            return []
+        return sorted(path.stem for path in self.directory.glob(f"*{SEGMENT_SUFFIX}"))
@@ -0,0 +1,264 @@
+# hamilton-transit-map/backend/vehicle_columns.py
+import json
+import math
+import struct
+from array import array
+from feed_fetcher import read_varint
+
+# Field numbers in gtfs-realtime.proto
+FEED_HEADER = 1
+FEED_ENTITY = 2
+HEADER_TIMESTAMP = 3
+ENTITY_VEHICLE = 4
+VEHICLE_TRIP = 1
+VEHICLE_POSITION = 2
+VEHICLE_TIMESTAMP = 5
+VEHICLE_DESCRIPTOR = 8
+TRIP_ID = 1
+TRIP_ROUTE_ID = 5
+DESCRIPTOR_ID = 1
+POSITION_LATITUDE = 1
+POSITION_LONGITUDE = 2
+POSITION_BEARING = 3
+POSITION_SPEED = 5
+
+MISSING = float('nan')
+DEFAULT_ROUTE_COLOR = '#FF0000'
+
+unpack_float = struct.Struct('<f').unpack_from
+
+def skip_field(data, pos, wire_type):
+    if wire_type == 0:
+        return read_varint(data, pos)[1]
+    if wire_type == 1:
+        return pos + 8
+    if wire_type == 5:
+        return pos + 4
+    if wire_type == 2:
+        length, pos = read_varint(data, pos)
+        return pos + length
+    raise ValueError(f"Unsupported wire type {wire_type}")
+
+def read_strings(data, pos, end, fields):
+    # The string fields of a small message (TripDescriptor, VehicleDescriptor) that are in fields
+    values = {}
+    while pos < end:
+        key, pos = read_varint(data, pos)
+        if key & 7 == 2 and key >> 3 in fields:
+            length, pos = read_varint(data, pos)
+            values[key >> 3] = data[pos:pos + length].decode('utf-8')
+            pos += length
+        else:
+            pos = skip_field(data, pos, key & 7)
+    return values
+
+class VehicleColumns:
+    # One VehiclePositions feed as parallel columns, one row per vehicle that reported a
+    # position. Vehicle, route and trip ids are indices into interners owned by the parser,
+    # so they stay stable from one poll to the next; missing route/trip ids are -1 and a
+    # missing bearing or speed is NaN. Latitude, longitude, bearing and speed are float32
+    # as on the wire.
+    def __init__(self, vehicle_ids, route_ids, trip_ids):
+        self.vehicle_ids = vehicle_ids
+        self.route_ids = route_ids
+        self.trip_ids = trip_ids
+        self.vehicles = array('I')
+        self.routes = array('i')
+        self.trips = array('i')
+        self.latitude = array('f')
+        self.longitude = array('f')
+        self.bearing = array('f')
+        self.speed = array('f')
+        self.timestamp = array('Q')
+        self.feed_timestamp = None
+        self.route_short_names = {}
+        self.route_colors = {}
+        # Filled by map_matching.snap_to_shapes; NaN for vehicles that were not matched
+        self.snapped_latitude = None
+        self.snapped_longitude = None
+        self.distance_along = None
+        self.progress = None
+    
+    def __len__(self):
+        return len(self.vehicles)
+    
+    def decode(self, data):
+        # Walks the encoded FeedMessage directly: only the fields used here are read, and no
+        # message objects are built
+        pos = 0
+        end = len(data)
+        while pos < end:
+            key, pos = read_varint(data, pos)
+            if key == (FEED_HEADER << 3 | 2):
+                length, pos = read_varint(data, pos)
+                self.decode_header(data, pos, pos + length)
+                pos += length
+                continue
+            if key != (FEED_ENTITY << 3 | 2):
+                pos = skip_field(data, pos, key & 7)
+                continue
+            length, pos = read_varint(data, pos)
+            entity_end = pos + length
+            while pos < entity_end:
+                key, pos = read_varint(data, pos)
+                if key != (ENTITY_VEHICLE << 3 | 2):
+                    pos = skip_field(data, pos, key & 7)
+                    continue
+                length, pos = read_varint(data, pos)
+                self.decode_vehicle(data, pos, pos + length)
+                pos += length
+            pos = entity_end
+        return self
+    
+    def decode_header(self, data, pos, end):
+        while pos < end:
+            key, pos = read_varint(data, pos)
+            if key == (HEADER_TIMESTAMP << 3):
+                self.feed_timestamp, pos = read_varint(data, pos)
+            else:
+                pos = skip_field(data, pos, key & 7)
+    
+    def decode_vehicle(self, data, pos, end):
+        trip = None
+        descriptor = None
+        position = None
+        timestamp = 0
+        while pos < end:
+            key, pos = read_varint(data, pos)
+            field, wire_type = key >> 3, key & 7
+            if wire_type == 2 and field in (VEHICLE_TRIP, VEHICLE_POSITION, VEHICLE_DESCRIPTOR):
+                length, pos = read_varint(data, pos)
+                if field == VEHICLE_TRIP:
+                    trip = read_strings(data, pos, pos + length, (TRIP_ID, TRIP_ROUTE_ID))
+                elif field == VEHICLE_POSITION:
+                    position = (pos, pos + length)
+                else:
+                    descriptor = read_strings(data, pos, pos + length, (DESCRIPTOR_ID,))
+                pos += length
+            elif wire_type == 0 and field == VEHICLE_TIMESTAMP:
+                timestamp, pos = read_varint(data, pos)
+            else:
+                pos = skip_field(data, pos, wire_type)
+        
+        if position is None:
+            return
+        
+        latitude = longitude = 0.0
+        bearing = speed = MISSING
+        pos, end = position
+        while pos < end:
+            key, pos = read_varint(data, pos)
+            if key & 7 == 5:
+                value = unpack_float(data, pos)[0]
+                field = key >> 3
+                if field == POSITION_LATITUDE:
+                    latitude = value
+                elif field == POSITION_LONGITUDE:
+                    longitude = value
+                elif field == POSITION_BEARING:
+                    bearing = value
+                elif field == POSITION_SPEED:
+                    speed = value
+                pos += 4
+            else:
+                pos = skip_field(data, pos, key & 7)
+        
+        if descriptor is not None:
+            vehicle_id = descriptor.get(DESCRIPTOR_ID, '')
+        else:
+            vehicle_id = f"unknown_{len(self.vehicles)}"
+        self.vehicles.append(self.vehicle_ids.intern(vehicle_id))
+        if trip is not None:
+            self.routes.append(self.route_ids.intern(trip.get(TRIP_ROUTE_ID, '')))
+            self.trips.append(self.trip_ids.intern(trip.get(TRIP_ID, '')))
+        else:
+            self.routes.append(-1)
+            self.trips.append(-1)
+        self.latitude.append(latitude)
+        self.longitude.append(longitude)
+        self.bearing.append(bearing)
+        self.speed.append(speed)
+        self.timestamp.append(timestamp)
+    
+    def join_routes(self, route_data):
+        # Route names and colours are looked up once per distinct route in the snapshot
+        for route in set(self.routes):
+            route_id = self.route_ids[route] if route >= 0 else None
+            route_info = route_data.get(route_id, {})
+            self.route_short_names[route] = route_info.get('route_short_name', route_id if route_id else 'Unknown')
+            self.route_colors[route] = route_info.get('route_color', DEFAULT_ROUTE_COLOR)
+        return self
+    
+    def records(self):
+        vehicle_ids = self.vehicle_ids.values
+        route_ids = self.route_ids.values
+        trip_ids = self.trip_ids.values
+        results = []
+        for i in range(len(self.vehicles)):
+            route = self.routes[i]
+            trip = self.trips[i]
+            bus = {
+                'vehicle_id': vehicle_ids[self.vehicles[i]],
+                'route_id': route_ids[route] if route >= 0 else None,
+                'trip_id': trip_ids[trip] if trip >= 0 else None,
+                'route_short_name': self.route_short_names[route],
+                'route_color': self.route_colors[route],
+                'latitude': self.latitude[i],
+                'longitude': self.longitude[i],
+                'timestamp': self.timestamp[i]
+            }
+            
+            bearing = self.bearing[i]
+            if not math.isnan(bearing):
+                bus['bearing'] = bearing
+            
+            speed = self.speed[i]
+            if not math.isnan(speed):
+                bus['speed'] = speed
+            
+            if self.progress is not None and not math.isnan(self.progress[i]):
+                bus.update(self.match_fields(i))
+            
+            results.append(bus)
+        return results
+    
+    def match_fields(self, i):
+        # Rounded to about 10 cm; the snapped point is only as good as the shape
+        return {
+            'snapped_latitude': round(self.snapped_latitude[i], 6),
+            'snapped_longitude': round(self.snapped_longitude[i], 6),
+            'distance_along': round(self.distance_along[i], 1),
+            'progress': round(self.progress[i], 4)
+        }
+    
+    def to_json(self):
+        # The same list as json.dumps(self.records()), written straight from the columns; each
+        # distinct id and route is escaped once rather than once per vehicle
+        quote = json.dumps
+        vehicle_ids = self.vehicle_ids.values
+        trip_ids = self.trip_ids.values
+        vehicles = {vehicle: quote(vehicle_ids[vehicle]) for vehicle in set(self.vehicles)}
+        trips = {trip: quote(trip_ids[trip]) if trip >= 0 else 'null' for trip in set(self.trips)}
+        routes = {route: (f'"route_id": {quote(self.route_ids[route] if route >= 0 else None)}, '
+                          f'"trip_id": ',
+                          f', "route_short_name": {quote(self.route_short_names[route])}, '
+                          f'"route_color": {quote(self.route_colors[route])}, "latitude": ')
+                  for route in self.route_short_names}
+        
+        progress = self.progress if self.progress is not None else array('d', [MISSING]) * len(self.vehicles)
+        rows = []
+        for i, (vehicle, route, trip, latitude, longitude, timestamp, bearing, speed, matched) in enumerate(zip(
+                self.vehicles, self.routes, self.trips, self.latitude, self.longitude, self.timestamp,
+                self.bearing, self.speed, progress)):
+            before_trip, before_latitude = routes[route]
+            row = (f'{{"vehicle_id": {vehicles[vehicle]}, {before_trip}{trips[trip]}{before_latitude}'
+                   f'{latitude!r}, "longitude": {longitude!r}, "timestamp": {timestamp}')
+            # NaN marks a bearing or speed the feed did not report
+            if bearing == bearing:
+                row += f', "bearing": {bearing!r}'
+            if speed == speed:
+                row += f', "speed": {speed!r}'
+            if matched == matched:
+                row += ''.join(f', "{name}": {value!r}' for name, value in self.match_fields(i).items())
+            rows.append(row + '}')
+        return '[' + ', '.join(rows) + ']'
@@ -0,0 +1,105 @@
+# hamilton-transit-map/backend/vehicle_deltas.py
+import hashlib
+import threading
+from collections import OrderedDict
+
+# The feed is polled once a minute, so a client can miss half an hour of polls and still
+# catch up with a delta instead of the whole fleet
+MAX_SNAPSHOTS = 30
+
+def diff_vehicles(old, new):
+    added = []
+    moved = []
+    for vehicle_id, bus in new.items():
+        previous = old.get(vehicle_id)
+        if previous is None:
+            added.append(bus)
+        elif previous != bus:
+            # Only the fields that changed; ones the feed stopped reporting are sent as null
+            changes = {key: value for key, value in bus.items() if previous.get(key) != value}
+            for key in previous:
+                if key not in bus:
+                    changes[key] = None
+            changes['vehicle_id'] = vehicle_id
+            moved.append(changes)
+    
+    removed = [vehicle_id for vehicle_id in old if vehicle_id not in new]
+    return {'added': added, 'moved': moved, 'removed': removed}
+
+class VehicleSnapshot:
+    # Everything served about one poll of the fleet: the records, their indexes by route and by
+    # vehicle, the serialized /api/buses body with its ETag, and when it was ingested. Built
+    # once and not modified afterwards, apart from the deltas memoized against it.
+    def __init__(self, version, buses, buses_by_route, body=b'[]', last_update=0, feed_timestamp=None, etag=None):
+        self.version = version
+        self.buses = buses
+        self.buses_by_route = buses_by_route
+        self.by_vehicle = {bus['vehicle_id']: bus for bus in buses}
+        self.body = body
+        self.etag = etag or hashlib.sha1(body).hexdigest()
+        self.last_update = last_update
+        self.feed_timestamp = feed_timestamp
+        self.deltas = {}
+    
+    def select(self, route_id=None, route_short_name=None):
+        if route_id:
+            return {bus['vehicle_id']: bus for bus in self.buses_by_route.get_buses(route_id, route_short_name)}
+        return self.by_vehicle
+
+class SnapshotHistory:
+    # The last few vehicle snapshots, numbered by a version that increases on every poll.
+    # latest is replaced by a single assignment, so a reader that takes it once sees one
+    # consistent snapshot without locking. Deltas against the latest snapshot are computed
+    # once per (since, route) and kept on it, for routes the static feed or the snapshot knows.
+    def __init__(self, empty_index=None, max_snapshots=MAX_SNAPSHOTS):
+        self.max_snapshots = max_snapshots
+        self.snapshots = OrderedDict()
+        self.latest = VehicleSnapshot(0, [], empty_index)
+        self.lock = threading.Lock()
+    
+    @property
+    def version(self):
+        return self.latest.version
+    
+    def publish(self, buses, buses_by_route, body, last_update, feed_timestamp=None, version=None, etag=None):
+        # version and etag are given when mirroring the history of another process
+        with self.lock:
+            if version is not None and version <= self.latest.version:
+                # The other process restarted its numbering; older snapshots no longer line up
+                self.snapshots.clear()
+            version = self.latest.version + 1 if version is None else version
+            snapshot = VehicleSnapshot(version, buses, buses_by_route, body, last_update, feed_timestamp, etag)
+            self.snapshots[version] = snapshot
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+            self.latest = snapshot
+            return snapshot
+    
+    def delta(self, since, route_id=None, route_short_name=None, latest=None):
+        # Against latest when given, so a caller can keep to the snapshot it already holds
+        latest = latest or self.latest
+        with self.lock:
+            base = self.snapshots.get(since)
+        if latest.version == 0:
+            return {'version': 0, 'reset': True, 'added': [], 'moved': [], 'removed': []}
+        
+        # Versions that were never published, or have been dropped, all get the full fleet.
+        # Routes are keyed by short name, which routes.txt bounds; a route_id without one is
+        # only kept when vehicles on it are in the snapshot, so made-up ids are answered
+        # without filling the cache.
+        key = (since if base is not None else None, route_short_name or route_id)
+        cached = not route_id or route_short_name or latest.buses_by_route.has_route_id(route_id)
+        delta = latest.deltas.get(key)
+        if delta is not None:
+            return delta
+        
+        current = latest.select(route_id, route_short_name)
+        if base is None:
+            delta = {'added': list(current.values()), 'moved': [], 'removed': []}
+        else:
+            delta = diff_vehicles(base.select(route_id, route_short_name), current)
+        delta['version'] = latest.version
+        delta['reset'] = base is None
+        if cached:
+            latest.deltas[key] = delta
+        return delta
@@ -5,14 +5,16 @@ import RouteManager from './route-manager.js';
 import BusManager from './bus-manager.js';
 import StopManager from './stop-manager.js';
 import ShapeManager from './shape-manager.js';
+import TileManager from './tile-manager.js';
 
 class TransitApp {
     constructor() {
         this.mapManager = new MapManager();
         this.routeManager = new RouteManager(this.handleRouteSelection.bind(this));
+        this.tileManager = new TileManager(this.mapManager);
         this.busManager = new BusManager(this.mapManager, this.routeManager);
-        this.stopManager = new StopManager(this.mapManager, this.routeManager);
-        this.shapeManager = new ShapeManager(this.mapManager, this.routeManager);
+        this.stopManager = new StopManager(this.mapManager, this.routeManager, this.tileManager);
+        this.shapeManager = new ShapeManager(this.mapManager, this.routeManager, this.tileManager);
         
         this.resetViewButton = document.getElementById(ELEMENTS.RESET_VIEW);
         this.resetViewButton.addEventListener('click', () => this.resetView());
@@ -21,6 +23,7 @@ class TransitApp {
     async initialize() {
         await this.routeManager.loadRoutes();
         await this.busManager.updateBusLocations();
+        await this.busManager.startStream();
         this.setupPeriodicUpdates();
     }
     
@@ -6,16 +6,77 @@ class BusManager {
         this.mapManager = mapManager;
         this.routeManager = routeManager;
         this.busMarkers = {};
+        this.buses = {};
         this.busesByRoute = {};
+        this.version = 0;
+        this.versionRouteId = null;
         this.isUpdating = false;
+        this.stream = null;
+        this.streamPort = null;
+        this.streamRouteId = null;
+    }
+    
+    async startStream() {
+        if (!window.EventSource) {
+            return;
+        }
+        
+        try {
+            const response = await fetch(API.STATUS);
+            const status = await response.json();
+            this.streamPort = status.stream_port;
+        } catch (error) {
+            console.error('Error fetching server status:', error);
+        }
+        
+        if (this.streamPort) {
+            this.openStream();
+        }
+    }
+    
+    openStream() {
+        if (this.stream) {
+            this.stream.close();
+        }
+        
+        const selectedRouteId = this.routeManager.getSelectedRouteId();
+        this.streamRouteId = selectedRouteId;
+        const url = `${window.location.protocol}//${window.location.hostname}:${this.streamPort}${API.STREAM}?${this.deltaParams(selectedRouteId)}`;
+        
+        this.stream = new EventSource(url);
+        this.stream.addEventListener('delta', event => {
+            this.handleDelta(JSON.parse(event.data), selectedRouteId);
+        });
+    }
+    
+    isStreaming() {
+        return this.stream !== null && this.stream.readyState !== EventSource.CLOSED;
+    }
+    
+    deltaParams(selectedRouteId) {
+        // Ask only for what changed since the last version seen for this route selection
+        const since = selectedRouteId === this.versionRouteId ? this.version : 0;
+        const params = new URLSearchParams({ since });
+        if (selectedRouteId) {
+            params.set('route_id', selectedRouteId);
+        }
+        return params;
     }
     
     async updateBusLocations() {
+        // While the push channel is open, polling only reconnects it when the route changes
+        if (this.isStreaming()) {
+            if (this.routeManager.getSelectedRouteId() !== this.streamRouteId) {
+                this.openStream();
+            }
+            return;
+        }
+        
         if (this.isUpdating) return;
         
         this.isUpdating = true;
         const selectedRouteId = this.routeManager.getSelectedRouteId();
-        const url = selectedRouteId ? `${API.BUSES}?route_id=${selectedRouteId}` : API.BUSES;
+        const url = `${API.BUSES}?${this.deltaParams(selectedRouteId)}`;
         
         try {
             const response = await fetch(url);
@@ -23,18 +84,8 @@ class BusManager {
                 throw new Error(`Server responded with ${response.status}`);
             }
             
-            const data = await response.json();
-            document.getElementById(ELEMENTS.UPDATE_TIME).textContent = new Date().toLocaleTimeString();
-            
-            this.mapManager.clearBusLayer();
-            Object.keys(this.busMarkers).forEach(id => delete this.busMarkers[id]);
-            
-            Object.keys(this.busesByRoute).forEach(id => {
-                this.busesByRoute[id] = [];
-            });
-            this.routeManager.resetBusCounts();
-            
-            data.forEach(bus => this.addBusToMap(bus));
+            const delta = await response.json();
+            this.handleDelta(delta, selectedRouteId);
         } catch (error) {
             console.error('Error fetching bus data:', error);
             document.getElementById(ELEMENTS.UPDATE_TIME).textContent = 'Failed to update';
@@ -43,8 +94,74 @@ class BusManager {
         }
     }
     
-    addBusToMap(bus) {
-        const { vehicle_id, route_id, route_short_name, route_color, latitude, longitude, bearing, speed } = bus;
+    handleDelta(delta, selectedRouteId) {
+        document.getElementById(ELEMENTS.UPDATE_TIME).textContent = new Date().toLocaleTimeString();
+        
+        this.applyDelta(delta);
+        this.version = delta.version;
+        this.versionRouteId = selectedRouteId;
+        
+        Object.keys(this.busesByRoute).forEach(id => {
+            this.busesByRoute[id] = [];
+        });
+        this.routeManager.resetBusCounts();
+        
+        Object.values(this.buses).forEach(bus => this.countBus(bus));
+    }
+    
+    applyDelta(delta) {
+        if (delta.reset) {
+            const current = new Set(delta.added.map(bus => bus.vehicle_id));
+            Object.keys(this.buses).forEach(id => {
+                if (!current.has(id)) {
+                    this.removeBus(id);
+                }
+            });
+        }
+        
+        delta.removed.forEach(id => this.removeBus(id));
+        delta.added.forEach(bus => this.updateBus(bus));
+        
+        delta.moved.forEach(changes => {
+            const bus = { ...this.buses[changes.vehicle_id], ...changes };
+            Object.keys(changes).forEach(key => {
+                if (changes[key] === null) {
+                    delete bus[key];
+                }
+            });
+            this.updateBus(bus);
+        });
+    }
+    
+    updateBus(bus) {
+        const previous = this.buses[bus.vehicle_id];
+        const marker = this.busMarkers[bus.vehicle_id];
+        this.buses[bus.vehicle_id] = bus;
+        
+        if (!marker) {
+            this.addBusToMap(bus);
+            return;
+        }
+        
+        // Existing markers are moved in place; the icon is only rebuilt when its label or colour changes
+        marker.setLatLng(this.getBusLatLng(bus));
+        if (previous.route_short_name !== bus.route_short_name || previous.route_color !== bus.route_color) {
+            marker.setIcon(this.createBusIcon(bus));
+        }
+        marker.setPopupContent(this.createPopupContent(bus));
+    }
+    
+    removeBus(vehicleId) {
+        const marker = this.busMarkers[vehicleId];
+        if (marker) {
+            this.mapManager.removeBusMarker(marker);
+        }
+        delete this.busMarkers[vehicleId];
+        delete this.buses[vehicleId];
+    }
+    
+    countBus(bus) {
+        const { vehicle_id, route_id, route_short_name } = bus;
         
         if (!this.busesByRoute[route_id]) {
             this.busesByRoute[route_id] = [];
@@ -66,23 +183,44 @@ class BusManager {
                 }
             }
         }
-        
+    }
+    
+    createBusIcon(bus) {
+        const { route_id, route_short_name, route_color } = bus;
         const color = route_color || this.routeManager.getRouteColor(route_id) || DEFAULT_MARKER_COLOR;
         
-        const busIcon = L.divIcon({
+        return L.divIcon({
             html: `<div style="background-color: ${color}; color: white; font-weight: bold; font-size: 12px; display: flex; justify-content: center; align-items: center; width: 24px; height: 24px; border-radius: 50%; box-shadow: 0 0 3px rgba(0,0,0,0.3);">${route_short_name}</div>`,
             className: '',
             iconSize: [24, 24],
             iconAnchor: [12, 12]
         });
-        
-        const marker = this.mapManager.addBusMarker(latitude, longitude, busIcon);
-        
-        marker.bindPopup(`
+    }
+    
+    createPopupContent(bus) {
+        const { vehicle_id, route_short_name, speed, progress } = bus;
+        return `
             <strong>Route ${route_short_name}</strong><br>
             Vehicle ID: ${vehicle_id}<br>
             Speed: ${speed ? Math.round(speed * 3.6) + ' km/h' : 'N/A'}
-        `);
+            ${progress !== undefined ? `<br>Trip progress: ${Math.round(progress * 100)}%` : ''}
+        `;
+    }
+    
+    getBusLatLng(bus) {
+        // Vehicles matched to their trip's shape are drawn on the route rather than at the raw GPS fix
+        if (bus.snapped_latitude !== undefined) {
+            return [bus.snapped_latitude, bus.snapped_longitude];
+        }
+        return [bus.latitude, bus.longitude];
+    }
+    
+    addBusToMap(bus) {
+        const { vehicle_id } = bus;
+        const [latitude, longitude] = this.getBusLatLng(bus);
+        
+        const marker = this.mapManager.addBusMarker(latitude, longitude, this.createBusIcon(bus));
+        marker.bindPopup(this.createPopupContent(bus));
         
         this.busMarkers[vehicle_id] = marker;
     }
@@ -13,8 +13,10 @@ export const API = {
     BUSES: '/api/buses',
     STOPS: '/api/stops',
     SHAPES: '/api/shapes',
+    TILES: '/api/tiles',
     ROUTES: '/api/routes',
-    STATUS: '/api/status'
+    STATUS: '/api/status',
+    STREAM: '/api/stream'
 };
 
 // UI elements
@@ -32,6 +34,17 @@ export const DEFAULT_ROUTE_COLOR = '#1A4D2E';
 export const DEFAULT_MARKER_COLOR = '#FF0000';
 export const BUS_UPDATE_INTERVAL = 60000; // milliseconds
 
+// Shapes are requested as encoded polylines, simplified for the current zoom level
+export const SHAPE_FORMAT = 'polyline';
+export const SHAPE_LEVEL_ZOOMS = [10, 12, 14, 16];
+
+// The whole network is loaded in z/x/y tiles covering the viewport
+export const TILE_MIN_ZOOM = 10;
+export const TILE_MAX_ZOOM = 16;
+export const MAX_VISIBLE_TILES = 64;
+// Fetched tiles kept for panning back; the least recently used are dropped past this
+export const MAX_CACHED_TILES = 256;
+
 // Chunk processing
 export const STOP_CHUNK_SIZE = 200;
 export const CHUNK_PROCESSING_DELAY = 10; // milliseconds
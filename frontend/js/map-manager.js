@@ -27,6 +27,22 @@ class MapManager {
         this.map.setView(DEFAULT_CENTER, DEFAULT_ZOOM);
     }
     
+    getZoom() {
+        return this.map.getZoom();
+    }
+    
+    onZoomEnd(callback) {
+        this.map.on('zoomend', callback);
+    }
+    
+    onMoveEnd(callback) {
+        this.map.on('moveend', callback);
+    }
+    
+    getBounds() {
+        return this.map.getBounds();
+    }
+    
     addStopLayer() {
         this.stopLayerGroup.addTo(this.map);
     }
@@ -59,6 +75,10 @@ class MapManager {
         return L.marker([latitude, longitude], { icon, zIndexOffset: 1000 }).addTo(this.busLayerGroup);
     }
     
+    removeBusMarker(marker) {
+        this.busLayerGroup.removeLayer(marker);
+    }
+    
     addStopMarker(latitude, longitude, icon) {
         return L.marker([latitude, longitude], { icon }).addTo(this.stopLayerGroup);
     }
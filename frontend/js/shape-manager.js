@@ -1,12 +1,52 @@
 // hamilton-transit-map/frontend/js/shape-manager.js
-import { API, ELEMENTS, DEFAULT_ROUTE_COLOR } from './config.js';
+import { API, ELEMENTS, DEFAULT_ROUTE_COLOR, SHAPE_FORMAT, SHAPE_LEVEL_ZOOMS } from './config.js';
+
+function decodePolyline(encoded, precision = 5) {
+    const factor = Math.pow(10, precision);
+    const points = [];
+    let index = 0;
+    let lat = 0;
+    let lon = 0;
+    
+    while (index < encoded.length) {
+        const deltas = [0, 0];
+        for (let i = 0; i < 2; i++) {
+            let result = 0;
+            let shift = 0;
+            let byte;
+            do {
+                byte = encoded.charCodeAt(index++) - 63;
+                result |= (byte & 0x1f) << shift;
+                shift += 5;
+            } while (byte >= 0x20);
+            deltas[i] = (result & 1) ? ~(result >> 1) : (result >> 1);
+        }
+        lat += deltas[0];
+        lon += deltas[1];
+        points.push([lat / factor, lon / factor]);
+    }
+    
+    return points;
+}
+
+function shapeLevelForZoom(zoom) {
+    const levels = SHAPE_LEVEL_ZOOMS.filter(level => level <= zoom);
+    return levels.length > 0 ? levels[levels.length - 1] : SHAPE_LEVEL_ZOOMS[0];
+}
 
 class ShapeManager {
-    constructor(mapManager, routeManager) {
+    constructor(mapManager, routeManager, tileManager) {
         this.mapManager = mapManager;
         this.routeManager = routeManager;
+        this.tileManager = tileManager;
         this.shapesLoaded = false;
         this.shapesVisible = false;
+        this.shapeLevel = null;
+        this.tileZoom = null;
+        this.drawnTiles = {};
+        this.tileListener = this.drawTile.bind(this);
+        
+        this.mapManager.onZoomEnd(() => this.handleZoomChange());
         
         this.toggleShapesButton = document.getElementById(ELEMENTS.TOGGLE_SHAPES);
         this.toggleShapesButton.addEventListener('click', () => this.toggleShapes());
@@ -19,10 +59,14 @@ class ShapeManager {
         }
         
         if (this.shapesVisible) {
+            this.tileManager.unsubscribe(this.tileListener);
             this.mapManager.removeShapesLayer();
             this.toggleShapesButton.textContent = 'Show Route Shapes';
             this.toggleShapesButton.classList.remove('active');
         } else {
+            if (this.tileZoom !== null) {
+                this.tileManager.subscribe(this.tileListener);
+            }
             this.mapManager.addShapesLayer();
             this.toggleShapesButton.textContent = 'Hide Route Shapes';
             this.toggleShapesButton.classList.add('active');
@@ -31,14 +75,36 @@ class ShapeManager {
         this.shapesVisible = !this.shapesVisible;
     }
     
+    handleZoomChange() {
+        // Only refetch when the zoom crosses into a different simplification level; the
+        // network view follows the zoom through its tiles instead
+        if (this.tileZoom !== null) {
+            return;
+        }
+        
+        if (this.shapesVisible && !this.toggleShapesButton.disabled && shapeLevelForZoom(this.mapManager.getZoom()) !== this.shapeLevel) {
+            this.loadShapesForCurrentSelection();
+        }
+    }
+    
     async loadShapesForCurrentSelection() {
         this.mapManager.clearShapesLayer();
+        this.tileManager.unsubscribe(this.tileListener);
+        this.tileZoom = null;
+        this.drawnTiles = {};
+        
+        const selectedRouteId = this.routeManager.getSelectedRouteId();
+        if (!selectedRouteId) {
+            this.showNetworkShapes();
+            return;
+        }
         
         this.toggleShapesButton.disabled = true;
         this.toggleShapesButton.textContent = 'Loading Shapes...';
         
-        const selectedRouteId = this.routeManager.getSelectedRouteId();
-        const url = selectedRouteId ? `${API.SHAPES}?route_id=${selectedRouteId}` : API.SHAPES;
+        this.shapeLevel = shapeLevelForZoom(this.mapManager.getZoom());
+        const params = new URLSearchParams({ route_id: selectedRouteId, zoom: this.shapeLevel, format: SHAPE_FORMAT });
+        const url = `${API.SHAPES}?${params}`;
         
         try {
             const response = await fetch(url);
@@ -56,12 +122,10 @@ class ShapeManager {
             
             console.log(`Loaded ${Object.keys(shapes).length} route shapes`);
             
-            const color = selectedRouteId && this.routeManager.getRouteColor(selectedRouteId)
-                ? this.routeManager.getRouteColor(selectedRouteId)
-                : DEFAULT_ROUTE_COLOR;
+            const color = this.routeManager.getRouteColor(selectedRouteId) || DEFAULT_ROUTE_COLOR;
             
             Object.keys(shapes).forEach(shapeId => {
-                const points = shapes[shapeId];
+                const points = decodePolyline(shapes[shapeId]);
                 this.mapManager.addRouteShape(points, color);
             });
             
@@ -72,9 +136,7 @@ class ShapeManager {
             this.toggleShapesButton.textContent = 'Hide Route Shapes';
             this.toggleShapesButton.classList.add('active');
             
-            if (selectedRouteId) {
-                this.mapManager.fitToShapes();
-            }
+            this.mapManager.fitToShapes();
         } catch (error) {
             console.error('Error loading shapes:', error);
             this.toggleShapesButton.disabled = false;
@@ -82,6 +144,36 @@ class ShapeManager {
         }
     }
     
+    showNetworkShapes() {
+        // Without a selected route, only the tiles covering the viewport are fetched and drawn
+        this.tileZoom = this.tileManager.getTileZoom();
+        this.tileManager.subscribe(this.tileListener);
+        
+        this.shapesLoaded = true;
+        this.mapManager.addShapesLayer();
+        this.shapesVisible = true;
+        this.toggleShapesButton.disabled = false;
+        this.toggleShapesButton.textContent = 'Hide Route Shapes';
+        this.toggleShapesButton.classList.add('active');
+    }
+    
+    drawTile(key, zoom, tile) {
+        if (zoom !== this.tileZoom) {
+            this.mapManager.clearShapesLayer();
+            this.drawnTiles = {};
+            this.tileZoom = zoom;
+        }
+        
+        if (this.drawnTiles[key]) {
+            return;
+        }
+        this.drawnTiles[key] = true;
+        
+        tile.shapes.forEach(shape => {
+            this.mapManager.addRouteShape(decodePolyline(shape.points), DEFAULT_ROUTE_COLOR);
+        });
+    }
+    
     resetShapeState() {
         this.shapesLoaded = false;
     }
@@ -2,12 +2,22 @@
 import { API, ELEMENTS, STOP_CHUNK_SIZE, CHUNK_PROCESSING_DELAY } from './config.js';
 
 class StopManager {
-    constructor(mapManager, routeManager) {
+    constructor(mapManager, routeManager, tileManager) {
         this.mapManager = mapManager;
         this.routeManager = routeManager;
+        this.tileManager = tileManager;
         this.stopMarkers = {};
+        this.stopRoutes = {};
         this.stopsLoaded = false;
         this.stopsVisible = false;
+        this.networkMode = false;
+        this.tileListener = this.drawTile.bind(this);
+        this.stopIcon = L.divIcon({
+            html: `<div style="background-color: #333; opacity: 0.6; width: 6px; height: 6px; border-radius: 50%;"></div>`,
+            className: '',
+            iconSize: [6, 6],
+            iconAnchor: [3, 3]
+        });
         
         this.toggleStopsButton = document.getElementById(ELEMENTS.TOGGLE_STOPS);
         this.toggleStopsButton.addEventListener('click', () => this.toggleStops());
@@ -20,10 +30,14 @@ class StopManager {
         }
         
         if (this.stopsVisible) {
+            this.tileManager.unsubscribe(this.tileListener);
             this.mapManager.removeStopLayer();
             this.toggleStopsButton.textContent = 'Show Bus Stops';
             this.toggleStopsButton.classList.remove('active');
         } else {
+            if (this.networkMode) {
+                this.tileManager.subscribe(this.tileListener);
+            }
             this.mapManager.addStopLayer();
             this.toggleStopsButton.textContent = 'Hide Bus Stops';
             this.toggleStopsButton.classList.add('active');
@@ -35,20 +49,27 @@ class StopManager {
     async loadStopsForCurrentSelection() {
         this.mapManager.clearStopLayer();
         Object.keys(this.stopMarkers).forEach(id => delete this.stopMarkers[id]);
+        this.tileManager.unsubscribe(this.tileListener);
+        this.networkMode = false;
+        
+        const selectedRouteId = this.routeManager.getSelectedRouteId();
+        if (!selectedRouteId) {
+            this.showNetworkStops();
+            return;
+        }
         
         this.toggleStopsButton.disabled = true;
         this.toggleStopsButton.textContent = 'Loading Stops...';
         
-        const selectedRouteId = this.routeManager.getSelectedRouteId();
-        const url = selectedRouteId ? `${API.STOPS}?route_id=${selectedRouteId}` : API.STOPS;
+        const url = `${API.ROUTES}/${selectedRouteId}/pattern`;
         
         try {
             const response = await fetch(url);
-            if (!response.ok) {
+            if (!response.ok && response.status !== 404) {
                 throw new Error(`Server responded with ${response.status}`);
             }
             
-            const stops = await response.json();
+            const stops = response.ok ? this.orderedStops((await response.json()).patterns) : [];
             if (stops.length === 0) {
                 console.warn('No stops data available');
                 this.toggleStopsButton.disabled = true;
@@ -58,14 +79,7 @@ class StopManager {
             
             console.log(`Loading ${stops.length} bus stops`);
             
-            const stopIcon = L.divIcon({
-                html: `<div style="background-color: #333; opacity: 0.6; width: 6px; height: 6px; border-radius: 50%;"></div>`,
-                className: '',
-                iconSize: [6, 6],
-                iconAnchor: [3, 3]
-            });
-            
-            await this.loadStopsInChunks(stops, stopIcon);
+            await this.loadStopsInChunks(stops);
             
             this.stopsLoaded = true;
             this.mapManager.addStopLayer();
@@ -80,7 +94,75 @@ class StopManager {
         }
     }
     
-    loadStopsInChunks(stops, stopIcon) {
+    showNetworkStops() {
+        // Without a selected route, stops are added tile by tile as the viewport moves
+        this.networkMode = true;
+        this.tileManager.subscribe(this.tileListener);
+        
+        this.stopsLoaded = true;
+        this.mapManager.addStopLayer();
+        this.stopsVisible = true;
+        this.toggleStopsButton.disabled = false;
+        this.toggleStopsButton.textContent = 'Hide Bus Stops';
+        this.toggleStopsButton.classList.add('active');
+    }
+    
+    drawTile(key, zoom, tile) {
+        tile.stops.forEach(stop => this.addStop(stop));
+    }
+    
+    orderedStops(patterns) {
+        // Every pattern's stops in visiting order, busiest pattern first; a stop shared by
+        // several patterns is numbered by the first one that visits it
+        const stops = [];
+        const seen = new Set();
+        patterns.forEach(pattern => {
+            pattern.stops.forEach((stop, index) => {
+                if (!seen.has(stop.stop_id)) {
+                    seen.add(stop.stop_id);
+                    stops.push({ ...stop, stopNumber: index + 1, patternLength: pattern.stops.length });
+                }
+            });
+        });
+        return stops;
+    }
+    
+    addStop(stop) {
+        const { stop_id, stop_name, latitude, longitude, stopNumber, patternLength } = stop;
+        if (this.stopMarkers[stop_id]) {
+            return;
+        }
+        
+        const marker = this.mapManager.addStopMarker(latitude, longitude, this.stopIcon);
+        const position = stopNumber ? `<br>Stop ${stopNumber} of ${patternLength}` : '';
+        const content = `<strong>${stop_name}</strong><br>Stop ID: ${stop_id}${position}`;
+        marker.bindPopup(content);
+        marker.on('popupopen', () => this.showStopRoutes(marker, stop_id, content));
+        
+        this.stopMarkers[stop_id] = marker;
+    }
+    
+    async showStopRoutes(marker, stopId, content) {
+        if (!this.stopRoutes[stopId]) {
+            try {
+                const response = await fetch(`${API.STOPS}/${stopId}/routes`);
+                if (!response.ok) {
+                    return;
+                }
+                this.stopRoutes[stopId] = (await response.json()).routes;
+            } catch (error) {
+                console.error(`Error loading routes for stop ${stopId}:`, error);
+                return;
+            }
+        }
+        
+        const routes = this.stopRoutes[stopId].map(route => route.route_short_name).join(', ');
+        if (routes) {
+            marker.setPopupContent(`${content}<br>Routes: ${routes}`);
+        }
+    }
+    
+    loadStopsInChunks(stops) {
         return new Promise(resolve => {
             let index = 0;
             
@@ -92,14 +174,7 @@ class StopManager {
                     return;
                 }
                 
-                chunk.forEach(stop => {
-                    const { stop_id, stop_name, latitude, longitude } = stop;
-                    
-                    const marker = this.mapManager.addStopMarker(latitude, longitude, stopIcon);
-                    marker.bindPopup(`<strong>${stop_name}</strong><br>Stop ID: ${stop_id}`);
-                    
-                    this.stopMarkers[stop_id] = marker;
-                });
+                chunk.forEach(stop => this.addStop(stop));
                 
                 index += STOP_CHUNK_SIZE;
                 this.toggleStopsButton.textContent = `Loading Stops... ${Math.min(index, stops.length)}/${stops.length}`;
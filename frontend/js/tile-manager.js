@@ -0,0 +1,106 @@
+// hamilton-transit-map/frontend/js/tile-manager.js
+import { API, TILE_MIN_ZOOM, TILE_MAX_ZOOM, MAX_VISIBLE_TILES, MAX_CACHED_TILES } from './config.js';
+
+function tileForPoint(lat, lon, zoom) {
+    const n = Math.pow(2, zoom);
+    const x = Math.floor((lon + 180) / 360 * n);
+    const latRadians = lat * Math.PI / 180;
+    const y = Math.floor((1 - Math.asinh(Math.tan(latRadians)) / Math.PI) / 2 * n);
+    return [Math.min(Math.max(x, 0), n - 1), Math.min(Math.max(y, 0), n - 1)];
+}
+
+class TileManager {
+    constructor(mapManager) {
+        this.mapManager = mapManager;
+        // Tile key -> fetch promise, least recently used first
+        this.tiles = new Map();
+        this.listeners = [];
+        
+        this.mapManager.onMoveEnd(() => this.loadVisibleTiles());
+    }
+    
+    subscribe(listener) {
+        if (!this.listeners.includes(listener)) {
+            this.listeners.push(listener);
+        }
+        this.loadVisibleTiles();
+    }
+    
+    unsubscribe(listener) {
+        this.listeners = this.listeners.filter(l => l !== listener);
+    }
+    
+    getTileZoom() {
+        return Math.min(Math.max(Math.round(this.mapManager.getZoom()), TILE_MIN_ZOOM), TILE_MAX_ZOOM);
+    }
+    
+    getVisibleTiles(zoom) {
+        const bounds = this.mapManager.getBounds();
+        const [minX, minY] = tileForPoint(bounds.getNorth(), bounds.getWest(), zoom);
+        const [maxX, maxY] = tileForPoint(bounds.getSouth(), bounds.getEast(), zoom);
+        
+        const tiles = [];
+        for (let x = minX; x <= maxX; x++) {
+            for (let y = minY; y <= maxY; y++) {
+                tiles.push(`${zoom}/${x}/${y}`);
+            }
+        }
+        return tiles;
+    }
+    
+    loadVisibleTiles() {
+        if (this.listeners.length === 0) {
+            return;
+        }
+        
+        const zoom = this.getTileZoom();
+        const tiles = this.getVisibleTiles(zoom);
+        if (tiles.length > MAX_VISIBLE_TILES) {
+            console.warn(`Viewport covers ${tiles.length} tiles; zoom in to load the network`);
+            return;
+        }
+        
+        tiles.forEach(key => {
+            let request = this.tiles.get(key);
+            if (request) {
+                // Move to the most recently used end
+                this.tiles.delete(key);
+            } else {
+                request = fetch(`${API.TILES}/${key}`).then(response => {
+                    if (!response.ok) {
+                        throw new Error(`Server responded with ${response.status}`);
+                    }
+                    return response.json();
+                });
+                request.catch(error => {
+                    console.error(`Error loading tile ${key}:`, error);
+                    if (this.tiles.get(key) === request) {
+                        this.tiles.delete(key);
+                    }
+                });
+            }
+            this.tiles.set(key, request);
+            
+            // Tiles that arrive after the zoom changed are no longer visible
+            request.then(tile => {
+                if (this.getTileZoom() === zoom) {
+                    this.listeners.forEach(listener => listener(key, zoom, tile));
+                }
+            }).catch(() => {});
+        });
+        
+        this.evictTiles();
+    }
+    
+    evictTiles() {
+        // The visible tiles were just used, so they are never the ones dropped
+        for (const key of this.tiles.keys()) {
+            if (this.tiles.size <= MAX_CACHED_TILES) {
+                break;
+            }
+            this.tiles.delete(key);
+        }
+    }
+}
+
+export default TileManager;